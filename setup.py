@@ -6,9 +6,13 @@
 
 import setuptools
 
-REQUIREMENTS = ['future', 'pandas', 'requests', 'requests_cache']
+REQUIREMENTS = ['future', 'pandas', 'requests',
+                'futures; python_version < "3.0"']
 
 EXTRAS_REQUIRE = {
+    'arrow': ['pyarrow>=14.0'],
+    'polars': ['pyarrow>=14.0', 'polars'],
+    'dask': ['dask[dataframe]'],
     'dev': [
         'sphinx', 'sphinx-autobuild', 'sphinx-rtd-theme', 'bumpversion',
         'pytest>=2.7', 'pytest-mock', 'pytest-helpers-namespace', 'pytest-cov',
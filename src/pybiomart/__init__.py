@@ -3,6 +3,12 @@
 from .server import Server
 from .mart import Mart
 from .dataset import Dataset
+from .search import SearchIndex
+from .governor import Governor
+from .cache import ResponseCache
+from .results import ResultCache
+from .intervals import IntervalIndex
+from .transport import RecordingTransport, ReplayTransport
 
 __author__ = 'Julian de Ruiter'
 __email__ = 'julianderuiter@gmail.com'
@@ -0,0 +1,197 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# pylint: disable=import-error
+from .planning import DEFAULT_MAX_JOBS
+# pylint: enable=import-error
+
+DEFAULT_ANNOTATION_PATH = '.pybiomart_annotations.sqlite'
+
+# Maximum number of keys per lookup (below the SQLite variable limit).
+LOOKUP_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+"""
+
+
+class AnnotationCache(object):
+    """Persistent cache of annotations, stored per key.
+
+    For each key (for example a gene id), the cache stores the rows that
+    a dataset returned for the key, including an empty list for keys that
+    were not found. Rows are stored per scope, which identifies the
+    dataset, the key attribute and the annotated attributes. The cache is
+    stored in a SQLite file (in WAL mode, so that it can be read by several
+    processes at once).
+
+    Args:
+        path (str): Path of the file used to store the cache.
+
+    """
+
+    def __init__(self, path=DEFAULT_ANNOTATION_PATH):
+        self._path = path
+
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    @property
+    def path(self):
+        """Path of the file used to store the cache."""
+        return self._path
+
+    def get(self, scope, keys):
+        """Looks up the cached rows of the given keys.
+
+        Args:
+            scope (str): Scope of the annotations.
+            keys (list[str]): Keys to look up.
+
+        Returns:
+            dict[str,list[list]]: Rows of the keys found in the cache.
+
+        """
+        keys = list(keys)
+        found = {}
+
+        for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[i:i + LOOKUP_BATCH_SIZE]
+            cursor = self._conn.execute(
+                'SELECT key, rows FROM annotations WHERE scope = ? AND '
+                'key IN ({})'.format(', '.join('?' for _ in batch)),
+                [scope] + batch)
+            found.update((key, json.loads(rows)) for key, rows in cursor)
+
+        return found
+
+    def set(self, scope, rows):
+        """Stores the rows of the given keys.
+
+        Args:
+            scope (str): Scope of the annotations.
+            rows (dict[str,list[list]]): Rows of each key.
+
+        """
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO annotations (scope, key, rows) '
+                'VALUES (?, ?, ?)',
+                ((scope, key, json.dumps(key_rows))
+                 for key, key_rows in rows.items()))
+
+    def close(self):
+        """Closes the connection to the cache file."""
+        self._conn.close()
+
+    def __repr__(self):
+        return '<biomart.AnnotationCache path={!r}>'.format(self._path)
+
+
+def annotate(dataset, frame, key_column, attributes, key_attribute=None,
+             key_filter=None, cache=None, chunk_size=None,
+             n_jobs=DEFAULT_MAX_JOBS):
+    """Annotates a DataFrame with attributes of a dataset (see Dataset)."""
+
+    if isinstance(cache, AnnotationCache):
+        return _annotate(dataset, frame, key_column, attributes,
+                         key_attribute, key_filter, cache, chunk_size, n_jobs)
+
+    cache = AnnotationCache(cache or DEFAULT_ANNOTATION_PATH)
+    try:
+        return _annotate(dataset, frame, key_column, attributes,
+                         key_attribute, key_filter, cache, chunk_size, n_jobs)
+    finally:
+        cache.close()
+
+
+def _annotate(dataset, frame, key_column, attributes, key_attribute,
+              key_filter, cache, chunk_size, n_jobs):
+    key_attribute = key_attribute or key_column
+    key_filter = key_filter or key_attribute
+    attributes = [attr for attr in attributes if attr != key_attribute]
+
+    scope = '|'.join([','.join(dataset.hosts) + dataset.path, dataset.name,
+                      key_attribute] + attributes)
+
+    # Look up unique keys in the cache, querying only for missing keys.
+    keys = frame[key_column].dropna().unique()
+    str_keys = [_format_key(key) for key in keys]
+
+    rows = cache.get(scope, str_keys)
+    missing = [key for key in str_keys if key not in rows]
+
+    if missing:
+        fetched = _fetch_rows(dataset, missing, key_attribute, key_filter,
+                              attributes, chunk_size, n_jobs)
+        cache.set(scope, fetched)
+        rows.update(fetched)
+
+    # Build annotation frame, using the original key values for joining.
+    records = [(key, ) + tuple(row)
+               for key, str_key in zip(keys, str_keys)
+               for row in rows[str_key]]
+    annotation = pd.DataFrame.from_records(
+        records, columns=['__key'] + attributes)
+
+    if len(annotation) == 0:
+        # Match the dtype of the (empty) key column for merging.
+        annotation['__key'] = annotation['__key'].astype(
+            frame[key_column].dtype)
+
+    result = frame.merge(annotation, how='left', left_on=key_column,
+                         right_on='__key')
+
+    return result.drop('__key', axis=1)
+
+
+def _fetch_rows(dataset, keys, key_attribute, key_filter, attributes,
+                chunk_size, n_jobs):
+    """Queries the rows of the given keys, grouped by key."""
+
+    result = dataset.query(
+        attributes=[key_attribute] + attributes,
+        filters={key_filter: keys},
+        use_attr_names=True,
+        chunk_size=chunk_size,
+        n_jobs=n_jobs)
+
+    # Keys without results are stored with an empty list of rows.
+    rows = {key: [] for key in keys}
+
+    values = result[attributes].astype(object)
+    values = values.where(pd.notnull(values), None)
+
+    for key, row in zip(map(_format_key, result[key_attribute]),
+                        values.itertuples(index=False, name=None)):
+        rows.setdefault(key, []).append([_to_json(value) for value in row])
+
+    return rows
+
+
+def _format_key(key):
+    # Key columns containing NaN are floats, which should be formatted
+    # as integers to match the (integer) values known by the server.
+    if isinstance(key, (float, np.floating)) and float(key).is_integer():
+        return '{:d}'.format(int(key))
+    return str(key)
+
+
+def _to_json(value):
+    # Convert numpy scalars into their python equivalents.
+    return value.item() if hasattr(value, 'item') else value
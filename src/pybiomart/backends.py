@@ -0,0 +1,338 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import io
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+from pandas.errors import EmptyDataError
+
+BACKENDS = ('pandas', 'arrow', 'polars', 'shared')
+
+# Maximum number of distinct values for dictionary encoding string columns.
+DICT_MAX_CARDINALITY = 1000
+
+# Number of rows parsed at once from streamed responses.
+STREAM_ROWS = 50000
+
+
+def check_backend(backend):
+    """Checks if the backend is valid and its dependencies are available."""
+
+    if backend not in BACKENDS:
+        raise ValueError('Invalid backend {!r}, should be one of {}'
+                         .format(backend, ', '.join(BACKENDS)))
+
+    if backend in {'arrow', 'polars', 'shared'}:
+        _import_pyarrow()
+
+    if backend == 'polars':
+        _import_polars()
+
+
+def read_tsv(response, backend='pandas', dtypes=None, names=None):
+    """Parses a TSV query response into a result of the given backend.
+
+    The arrow (and polars/shared) backends parse the raw response content
+    directly into an Arrow table, in which string columns with few
+    distinct values are dictionary encoded. Results of the polars and
+    shared backends are kept as Arrow tables until finalize is called, so
+    that the results of sub-queries can be combined without copying.
+
+    Queries without any matching rows return an empty response (without
+    a header), which is parsed into an empty result with the given names.
+
+    Args:
+        response (requests.models.Response): Query response.
+        backend (str): Backend to use for the result.
+        dtypes (dict[str,any]): Dictionary of columns --> data types.
+        names (list[str]): Column names of the result, used if the
+            response is empty.
+
+    Returns:
+        pd.DataFrame or pyarrow.Table: Parsed result.
+
+    """
+    if not response.content.strip():
+        return empty(names, backend=backend, dtypes=dtypes)
+
+    if backend == 'pandas':
+        try:
+            return pd.read_csv(StringIO(response.text), sep='\t', dtype=dtypes)
+        # Type error is raised of a data type is not understood by pandas
+        except TypeError:
+            raise ValueError("Non valid data type is used in dtypes")
+
+    pa, _ = _import_pyarrow()
+    return _read_arrow(pa.BufferReader(response.content), dtypes)
+
+
+def read_tsv_file(path, backend='pandas', dtypes=None, names=None):
+    """Parses a TSV file (such as a stored query response).
+
+    Args:
+        path (str): Path of the file to parse.
+        backend (str): Backend to use for the result.
+        dtypes (dict[str,any]): Dictionary of columns --> data types.
+        names (list[str]): Column names of the result, used if the
+            file is empty.
+
+    Returns:
+        pd.DataFrame or pyarrow.Table: Parsed result.
+
+    """
+    if _is_empty_file(path):
+        return empty(names, backend=backend, dtypes=dtypes)
+
+    if backend == 'pandas':
+        try:
+            return pd.read_csv(path, sep='\t', dtype=dtypes)
+        except TypeError:
+            raise ValueError("Non valid data type is used in dtypes")
+
+    return _read_arrow(path, dtypes)
+
+
+def empty(names, backend='pandas', dtypes=None):
+    """Returns an empty result with the given columns.
+
+    Columns without a data type in dtypes are of the null type for the
+    arrow backends, so that they are promoted to the type of the same
+    column in other results when concatenated.
+
+    Args:
+        names (list[str]): Column names of the result.
+        backend (str): Backend to use for the result.
+        dtypes (dict[str,any]): Dictionary of columns --> data types.
+
+    Returns:
+        pd.DataFrame or pyarrow.Table: Empty result.
+
+    """
+    names = list(names or [])
+    dtypes = {name: dtype for name, dtype in (dtypes or {}).items()
+              if name in names}
+
+    if backend == 'pandas':
+        try:
+            return pd.DataFrame(columns=names).astype(dtypes)
+        except TypeError:
+            raise ValueError("Non valid data type is used in dtypes")
+
+    pa, _ = _import_pyarrow()
+    types = _arrow_types(dtypes) or {}
+
+    return pa.schema([(name, types.get(name, pa.null()))
+                      for name in names]).empty_table()
+
+
+def _is_empty_file(path, peek=1024):
+    with open(path, 'rb') as file_:
+        return not file_.read(peek).strip()
+
+
+def read_tsv_chunks(chunks, names, dtypes=None, chunk_rows=STREAM_ROWS):
+    """Parses streamed TSV content into pandas DataFrames of chunk_rows rows.
+
+    Args:
+        chunks (iterable[bytes]): Chunks of TSV content (including header).
+        names (list[str]): Column names, replacing those of the header.
+        dtypes (dict[str,any]): Dictionary of columns --> data types.
+        chunk_rows (int): Number of rows per DataFrame.
+
+    Yields:
+        pd.DataFrame: Parsed rows.
+
+    """
+    stream = io.BufferedReader(_ChunkReader(chunks))
+
+    try:
+        reader = pd.read_csv(stream, sep='\t', header=0, names=names,
+                             dtype=dtypes, chunksize=chunk_rows)
+    except EmptyDataError:
+        return
+    except TypeError:
+        raise ValueError("Non valid data type is used in dtypes")
+
+    for frame in reader:
+        yield frame
+
+
+class _ChunkReader(io.RawIOBase):
+    """Readable file object reading from an iterator of bytes."""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer_):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer_), len(self._buffer))
+        buffer_[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+
+        return size
+
+
+def _read_arrow(source, dtypes):
+    _, pa_csv = _import_pyarrow()
+
+    convert_options = pa_csv.ConvertOptions(
+        column_types=_arrow_types(dtypes),
+        strings_can_be_null=True,
+        auto_dict_encode=True,
+        auto_dict_max_cardinality=DICT_MAX_CARDINALITY)
+
+    return pa_csv.read_csv(
+        source,
+        parse_options=pa_csv.ParseOptions(delimiter='\t', quote_char=False),
+        convert_options=convert_options)
+
+
+def _arrow_types(dtypes):
+    if not dtypes:
+        return None
+
+    pa, _ = _import_pyarrow()
+
+    types = {}
+    for column, dtype in dtypes.items():
+        try:
+            np_dtype = np.dtype(dtype)
+            if np_dtype.kind in {'U', 'S', 'O'}:
+                types[column] = pa.string()
+            else:
+                types[column] = pa.from_numpy_dtype(np_dtype)
+        except (TypeError, pa.ArrowNotImplementedError):
+            raise ValueError("Non valid data type is used in dtypes")
+
+    return types
+
+
+def concat(results, backend='pandas'):
+    """Concatenates the results of several sub-queries."""
+
+    if backend == 'pandas':
+        # Skip empty results, whose columns lack the inferred data types.
+        results = [result for result in results if len(result)] or results
+        return pd.concat(results, ignore_index=True)
+
+    pa, _ = _import_pyarrow()
+
+    # Sub-queries may differ in which columns were dictionary encoded,
+    # decode columns that were not encoded in all (non-empty) results.
+    plain = {field.name
+             for table in results for field in table.schema
+             if not (pa.types.is_dictionary(field.type) or
+                     pa.types.is_null(field.type))}
+
+    decoded = []
+    for table in results:
+        for i, field in enumerate(table.schema):
+            if field.name in plain and pa.types.is_dictionary(field.type):
+                column = table.column(i).cast(field.type.value_type)
+                table = table.set_column(i, field.name, column)
+        decoded.append(table)
+
+    return pa.concat_tables(decoded, promote_options='permissive')
+
+
+def drop_duplicates(result, backend='pandas'):
+    """Drops duplicate rows from a result."""
+
+    if backend == 'pandas':
+        return result.drop_duplicates().reset_index(drop=True)
+
+    pa, _ = _import_pyarrow()
+
+    # Keep the first occurrence of each row (in order), like pandas.
+    result = result.unify_dictionaries()
+    index = result.append_column(
+        '__index', pa.array(np.arange(result.num_rows, dtype=np.int64)))
+    first = index.group_by(result.column_names, use_threads=False) \
+        .aggregate([('__index', 'min')]).column('__index_min')
+
+    return result.take(np.sort(first.to_numpy()))
+
+
+def rename(result, columns, backend='pandas'):
+    """Renames the columns of a result using the given mapping."""
+
+    if backend == 'pandas':
+        return result.rename(columns=columns)
+
+    return result.rename_columns(
+        [columns.get(name, name) for name in result.column_names])
+
+
+def set_columns(result, names, backend='pandas'):
+    """Replaces the column names of a result (by position)."""
+
+    if backend == 'pandas':
+        result.columns = names
+        return result
+
+    return result.rename_columns(list(names))
+
+
+def finalize(result, backend='pandas'):
+    """Converts a (combined) result into its final backend type."""
+
+    if backend == 'polars':
+        pl = _import_polars()
+        return pl.from_arrow(result)
+
+    if backend == 'shared':
+        # pylint: disable=import-error
+        from .shared import SharedResult
+        # pylint: enable=import-error
+        return SharedResult.from_table(result)
+
+    return result
+
+
+def _import_pyarrow():
+    try:
+        # pylint: disable=import-error
+        import pyarrow
+        from pyarrow import csv
+        # pylint: enable=import-error
+    except ImportError:
+        raise ImportError('The arrow, polars and shared backends require '
+                          'pyarrow to be installed')
+    return pyarrow, csv
+
+
+def _import_polars():
+    try:
+        # pylint: disable=import-error
+        import polars
+        # pylint: enable=import-error
+    except ImportError:
+        raise ImportError('The polars backend requires polars '
+                          'to be installed')
+    return polars
+
+
+def _import_dask():
+    try:
+        # pylint: disable=import-error
+        import dask.dataframe
+        # pylint: enable=import-error
+    except ImportError:
+        raise ImportError('Dask DataFrames require dask[dataframe] '
+                          'to be installed')
+    return dask.dataframe
@@ -4,37 +4,86 @@ from __future__ import absolute_import, division, print_function
 from builtins import *
 # pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
 
+from contextlib import contextmanager
+import threading
+import time
+import warnings
+
 import requests
-import requests_cache
+
+from .cache import DEFAULT_CACHE, ResponseCache
+from .routing import get_router
+from .transport import HttpTransport
+from . import tracing
 
 DEFAULT_HOST = 'http://www.biomart.org'
 DEFAULT_PATH = '/biomart/martservice'
 DEFAULT_PORT = 80
 DEFAULT_SCHEMA = 'default'
 
-requests_cache.install_cache('.pybiomart')
+DEFAULT_TIMEOUT = (10, 300)
+PROBE_TIMEOUT = 5
 
 
 class ServerBase(object):
     """Base class that handles requests to the biomart server.
 
+    Multiple equivalent hosts (mirrors serving identical biomart content)
+    can be given as a list. Requests are then routed to the healthy host
+    with the lowest latency. Hosts are probed before the first request,
+    after which the routing table is updated using the latency of each
+    request. If a request to a host fails, the host is avoided for a while
+    and the request is retried on the next host. The routing table is
+    shared by all objects connecting to the same set of hosts.
+
     Attributes:
         host (str): Host to connect to for the biomart service.
+        hosts (list[str]): Equivalent hosts for the biomart service.
         path (str): Path to the biomart service on the host.
         port (str): Port to connect to on the host.
         url (str): Url used to connect to the biomart service.
         use_cache (bool): Whether to cache requests to biomart.
+        cache (ResponseCache): Cache used for requests to biomart.
+        governor (Governor): Governor limiting the request rate.
+        timeout (tuple[float,float]): Connect and read timeouts (in seconds).
+        use_post (bool): Whether to submit queries using post requests.
+        metadata_ttl (float): Number of seconds after which metadata is
+            refreshed in the background (None to never refresh).
+        transport (Transport): Transport used to send requests.
 
     """
 
-    def __init__(self, host=None, path=None, port=None, use_cache=True):
+    def __init__(self, host=None, path=None, port=None, use_cache=True,
+                 governor=None, timeout=DEFAULT_TIMEOUT, use_post=True,
+                 metadata_ttl=None, transport=None):
         """ServerBase constructor.
 
         Args:
-            host (str): Url of host to connect to.
+            host (str or list[str]): Url of host to connect to, or a list
+                of urls of equivalent hosts.
             path (str): Path on the host to access to the biomart service.
             port (int): Port to use for the connection.
-            use_cache (bool): Whether to cache requests.
+            use_cache (bool or ResponseCache): Whether to cache requests.
+                Responses are stored in the default cache directory, unless
+                a ResponseCache is given, in which case that cache is used.
+            governor (Governor): Governor used to limit the concurrency
+                and rate of requests. Requests are not limited if None.
+            timeout (float or tuple[float,float]): Timeout (in seconds) for
+                connecting to the host and for reading its response, given
+                as a single value for both or as a (connect, read) tuple.
+                Requests do not time out if None.
+            use_post (bool): Whether to submit queries as post requests
+                (default), which allows larger queries than get requests.
+            metadata_ttl (float): Number of seconds after which metadata
+                (such as marts, datasets and their configuration) becomes
+                stale. Stale metadata is still returned immediately, whilst
+                it is refreshed on a background thread and replaced once
+                the refresh completes. Metadata is never refreshed if None.
+            transport (Transport): Transport used to send requests, for
+                example a RecordingTransport to record the requests of a
+                session or a ReplayTransport to replay a recorded session
+                without a network connection. Defaults to sending requests
+                over http.
 
         """
         # Use defaults if arg is None.
@@ -42,23 +91,49 @@ class ServerBase(object):
         path = path or DEFAULT_PATH
         port = port or DEFAULT_PORT
 
+        if isinstance(host, (list, tuple)):
+            hosts = list(host)
+        else:
+            hosts = [host]
+
         # Add http prefix and remove trailing slash.
-        host = self._add_http_prefix(host)
-        host = self._remove_trailing_slash(host)
+        hosts = [self._remove_trailing_slash(self._add_http_prefix(host))
+                 for host in hosts]
 
         # Ensure path starts with slash.
         if not path.startswith('/'):
             path = '/' + path
 
-        self._host = host
+        self._hosts = hosts
         self._path = path
         self._port = port
         self._use_cache = use_cache
+        self._governor = governor
+
+        if timeout is not None and not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        self._timeout = timeout
+        self._use_post = use_post
+
+        self._metadata_ttl = metadata_ttl
+        self._transport = _HTTP_TRANSPORT if transport is None else transport
+        self._loaded = {}
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+        self._router = get_router(hosts)
 
     @property
     def host(self):
         """Host to connect to for the biomart service."""
-        return self._host
+        if len(self._hosts) == 1:
+            return self._hosts[0]
+        return self._router.best()
+
+    @property
+    def hosts(self):
+        """Equivalent hosts for the biomart service."""
+        return list(self._hosts)
 
     @property
     def path(self):
@@ -73,12 +148,129 @@ class ServerBase(object):
     @property
     def url(self):
         """Url used to connect to the biomart service."""
-        return '{}:{}{}'.format(self._host, self._port, self._path)
+        return self._url_for(self.host)
+
+    def _url_for(self, host):
+        return '{}:{}{}'.format(host, self._port, self._path)
 
     @property
     def use_cache(self):
         """Whether to cache requests to biomart."""
-        return self._use_cache
+        return self.cache is not None
+
+    @property
+    def cache(self):
+        """Cache used for requests to biomart (None if not caching)."""
+        if isinstance(self._use_cache, ResponseCache):
+            return self._use_cache
+        return DEFAULT_CACHE if self._use_cache else None
+
+    @property
+    def governor(self):
+        """Governor limiting the concurrency and rate of requests."""
+        return self._governor
+
+    @property
+    def timeout(self):
+        """Connect and read timeouts (in seconds) of requests."""
+        return self._timeout
+
+    @property
+    def use_post(self):
+        """Whether queries are submitted using post requests."""
+        return self._use_post
+
+    @property
+    def metadata_ttl(self):
+        """Number of seconds after which metadata is refreshed."""
+        return self._metadata_ttl
+
+    @property
+    def transport(self):
+        """Transport used to send requests."""
+        return self._transport
+
+    def __getstate__(self):
+        # Routers are shared by all objects in a process (and hold locks),
+        # they are recreated when unpickling.
+        state = self.__dict__.copy()
+        del state['_router']
+        del state['_refreshing']
+        del state['_refresh_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._router = get_router(self._hosts)
+
+    def _metadata(self, name, load):
+        """Returns cached metadata, loading it on first access.
+
+        Once the metadata is older than metadata_ttl, the cached value is
+        still returned, but a fresh value is loaded on a background thread.
+        The attribute holding the metadata is replaced (atomically) once
+        the refresh completes.
+
+        Args:
+            name (str): Name of the attribute holding the metadata.
+            load (callable): Function loading the metadata.
+
+        """
+        value = getattr(self, name)
+
+        if value is None:
+            value = load()
+            setattr(self, name, value)
+            self._loaded[name] = time.time()
+        elif (self._metadata_ttl is not None and
+              time.time() - self._loaded.get(name, 0) > self._metadata_ttl):
+            self._refresh_metadata(name, load)
+
+        return value
+
+    def _refresh_metadata(self, name, load):
+        """Starts a background refresh of metadata (if not yet running)."""
+
+        with self._refresh_lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+
+        thread = threading.Thread(
+            target=self._run_refresh, args=(name, load),
+            name='pybiomart-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def _run_refresh(self, name, load):
+        # Bypass cached responses, whilst still storing the new responses.
+        _REFRESH.active = True
+
+        try:
+            with tracing.span('refresh_metadata', attribute=name):
+                value = load()
+            setattr(self, name, value)
+        except Exception as err:  # pylint: disable=broad-except
+            # Keep serving the stale value, retrying after another ttl.
+            warnings.warn('Failed to refresh biomart metadata ({}): {}'
+                          .format(name, err), RuntimeWarning)
+        finally:
+            self._loaded[name] = time.time()
+            with self._refresh_lock:
+                self._refreshing.discard(name)
+
+    def _client_params(self):
+        """Parameters passed on to marts/datasets created by this object."""
+        return {
+            'use_cache': self._use_cache,
+            'governor': self._governor,
+            'timeout': self._timeout,
+            'use_post': self._use_post,
+            'metadata_ttl': self._metadata_ttl,
+            'transport': self._transport
+        }
 
     @staticmethod
     def _add_http_prefix(url, prefix='http://'):
@@ -95,6 +287,11 @@ class ServerBase(object):
     def get(self, **params):
         """Performs get request to the biomart service.
 
+        If the request is made within the scope of a deadline (see
+        Dataset.query), the timeouts of the request are limited to the
+        time remaining until the deadline. DeadlineExceeded is raised if
+        the deadline has passed or if the request was cancelled.
+
         Args:
             **params (dict of str: any): Arbitrary keyword arguments, which
                 are added as parameters to the get request to biomart.
@@ -103,15 +300,288 @@ class ServerBase(object):
             requests.models.Response: Response from biomart for the request.
 
         """
-        if self._use_cache:
-            r = requests.get(self.url, params=params)
-        else:
-            with requests_cache.disabled():
-                r = requests.get(self.url, params=params)
+        return self._request('get', params)
+
+    def post(self, **data):
+        """Performs post request to the biomart service.
+
+        Parameters are sent as a form-encoded request body instead of
+        in the url, which avoids limits on the length of urls for large
+        requests (such as queries with many filter values). Otherwise
+        behaves identically to get.
+
+        Args:
+            **data (dict of str: any): Arbitrary keyword arguments, which
+                are added as form data to the post request to biomart.
+
+        Returns:
+            requests.models.Response: Response from biomart for the request.
+
+        """
+        return self._request('post', data)
+
+    def _request(self, method, params, stream=False):
+        cache = self.cache
+
+        # Streamed responses are not cached, as their content is not read.
+        if cache is None or stream:
+            return self._request_hosts(method, params, stream=stream)
+
+        # Mirrors serve identical content, so they share cache entries.
+        key = cache.key(method, self._cache_url(), params)
+
+        with tracing.span('cache_lookup'):
+            cached = cache.get(key)
+
+        if cached is not None and not getattr(_REFRESH, 'active', False):
+            return cached
+
+        # Refreshes revalidate cached responses using their validators
+        # (if any), so that unchanged responses are not downloaded again.
+        headers = _conditional_headers(cached)
+        response = self._request_hosts(method, params, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            return cached
+
+        if response.status_code == 200:
+            with tracing.span('cache_store'):
+                cache.set(key, response)
+
+        return response
+
+    def _cache_url(self):
+        return '{}:{}{}'.format(','.join(self._hosts), self._port, self._path)
+
+    def _request_hosts(self, method, params, stream=False, headers=None):
+        if self._router.needs_probe:
+            self.probe_hosts()
+
+        hosts = self._router.ranked()
+        deadline = current_deadline()
+
+        for i, host in enumerate(hosts):
+            try:
+                return self._request_from(method, host, params, deadline,
+                                          stream=stream, headers=headers)
+            except (requests.ConnectionError, requests.Timeout):
+                self._router.record_failure(host)
+                if deadline is not None:
+                    deadline.check()
+                if i == len(hosts) - 1:
+                    raise
+            except requests.HTTPError as err:
+                # Only fail over for server errors, other errors are
+                # caused by the request itself.
+                status = getattr(err.response, 'status_code', None)
+                if status is None or status < 500 or i == len(hosts) - 1:
+                    raise
+                self._router.record_failure(host)
+
+    def _request_from(self, method, host, params, deadline=None,
+                      stream=False, headers=None):
+        if deadline is not None:
+            deadline.check()
+
+        with tracing.span('http_request', method=method, host=host):
+            if self._governor is not None:
+                with self._governor.request(host, deadline=deadline):
+                    r, latency = self._send_within(
+                        method, host, params, deadline, stream, headers)
+            else:
+                r, latency = self._send_within(
+                    method, host, params, deadline, stream, headers)
+
+        self._router.record_success(host, latency)
+
+        return r
+
+    def _send_within(self, method, host, params, deadline, stream=False,
+                     headers=None):
+        """Sends a request, returning the response and its latency."""
+
+        # Timeouts are limited once the governor allowed the request, so
+        # that waiting for the governor does not extend past the deadline.
+        # For the same reason, the latency excludes the time spent waiting.
+        timeout = self._timeout
+        if deadline is not None:
+            timeout = deadline.limit_timeout(timeout)
+
+        start = time.time()
+        r = self._send(method, host, params, timeout, stream, headers)
+
+        return r, time.time() - start
+
+    def _send(self, method, host, params, timeout, stream=False,
+              headers=None):
+        r = self._send_request(method, host, params, timeout, stream, headers)
         r.raise_for_status()
         return r
 
+    def _send_request(self, method, host, params, timeout, stream=False,
+                      headers=None):
+        return self._transport.send(method, self._url_for(host), params,
+                                    timeout=timeout, stream=stream,
+                                    headers=headers)
+
+    def probe_hosts(self):
+        """Probes the latency of the equivalent hosts.
+
+        Sends a lightweight (uncached) request to each host and updates
+        the routing table with the measured latencies. Hosts that do not
+        respond are marked as failed.
+
+        Returns:
+            dict[str,float]: Latency (in seconds) of each responding host.
+
+        """
+
+        def _measure(host):
+            start = time.time()
+            r = self._transport.send('get', self._url_for(host),
+                                     {'type': 'registry'},
+                                     timeout=PROBE_TIMEOUT)
+            r.raise_for_status()
+            return time.time() - start
+
+        with tracing.span('probe_hosts'):
+            self._router.probe(_measure)
+
+        return self._router.latencies
+
 
 class BiomartException(Exception):
     """Basic exception class for biomart exceptions."""
     pass
+
+
+class DeadlineExceeded(BiomartException):
+    """Exception raised if a query does not finish before its deadline."""
+    pass
+
+
+class Deadline(object):
+    """Deadline and cancellation token for (sub-)requests of a query.
+
+    A deadline expires after the given number of seconds or when it is
+    cancelled explicitly. Deadlines can be nested by passing a parent, in
+    which case the deadline also expires when its parent expires. This is
+    used to cancel the remaining sub-queries of a query, without affecting
+    other queries sharing the same parent deadline.
+
+    Args:
+        seconds (float): Number of seconds until the deadline expires, or
+            None if the deadline only expires when cancelled.
+        parent (Deadline): Parent deadline.
+
+    """
+
+    def __init__(self, seconds=None, parent=None):
+        self._expires = time.time() + seconds if seconds is not None else None
+        self._parent = parent
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        """Returns the seconds remaining until expiry (None if unbounded)."""
+        remaining = None
+
+        if self._expires is not None:
+            remaining = self._expires - time.time()
+
+        if self._parent is not None:
+            parent_remaining = self._parent.remaining()
+            if parent_remaining is not None:
+                remaining = (parent_remaining if remaining is None else
+                             min(remaining, parent_remaining))
+
+        return remaining
+
+    @property
+    def cancelled(self):
+        """Whether the deadline (or its parent) was cancelled."""
+        return self._cancelled.is_set() or (self._parent is not None and
+                                            self._parent.cancelled)
+
+    @property
+    def expired(self):
+        """Whether the deadline has passed or was cancelled."""
+        remaining = self.remaining()
+        return self.cancelled or (remaining is not None and remaining <= 0)
+
+    def cancel(self):
+        """Cancels the deadline, stopping requests made in its scope."""
+        self._cancelled.set()
+
+    def check(self):
+        """Raises DeadlineExceeded if the deadline has expired."""
+        if self.cancelled:
+            raise DeadlineExceeded('Query was cancelled')
+        if self.expired:
+            raise DeadlineExceeded('Query did not finish before its deadline')
+
+    def limit_timeout(self, timeout):
+        """Limits (connect, read) timeouts to the remaining time.
+
+        Raises:
+            DeadlineExceeded: If the deadline has expired.
+
+        """
+        self.check()
+        remaining = self.remaining()
+
+        if remaining is None:
+            return timeout
+
+        if remaining <= 0:
+            raise DeadlineExceeded('Query did not finish before its deadline')
+
+        if timeout is None:
+            return (remaining, remaining)
+
+        return tuple(min(value, remaining) for value in timeout)
+
+
+def _conditional_headers(response):
+    """Returns headers revalidating a cached response (if possible)."""
+
+    if response is None:
+        return None
+
+    headers = {}
+    if 'ETag' in response.headers:
+        headers['If-None-Match'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        headers['If-Modified-Since'] = response.headers['Last-Modified']
+
+    return headers or None
+
+
+_DEADLINES = threading.local()
+
+# Transport used by objects without a transport.
+_HTTP_TRANSPORT = HttpTransport()
+
+# Marks threads refreshing metadata, which bypass cached responses.
+_REFRESH = threading.local()
+
+
+def current_deadline():
+    """Returns the deadline of the current thread (None if not set)."""
+    return getattr(_DEADLINES, 'deadline', None)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Sets the deadline for requests made by the current thread.
+
+    Args:
+        deadline (Deadline): Deadline to use within the scope.
+
+    """
+    previous = current_deadline()
+    _DEADLINES.deadline = deadline
+
+    try:
+        yield deadline
+    finally:
+        _DEADLINES.deadline = previous
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    from os import replace as _replace
+except ImportError:  # Python 2 (rename replaces atomically on POSIX).
+    from os import rename as _replace
+
+DEFAULT_CACHE_PATH = '.pybiomart_cache'
+
+
+class ResponseCache(object):
+    """Cache of responses, which can be shared by many processes.
+
+    Responses are stored in a directory, with a separate file for each
+    response. Files are named after a hash of the request (content
+    addressing) and are spread over sub-directories (shards) to keep
+    directories small. Entries are written to a temporary file that is
+    atomically moved into place, so that concurrent readers never see
+    partially written entries and concurrent writers of the same entry do
+    not need to lock the cache. Reading from the cache is therefore not
+    serialized between processes, unlike a single (SQLite) database.
+
+    Args:
+        path (str): Path of the cache directory, which is created when
+            the first response is stored.
+
+    Examples:
+        Using a separate cache for a dataset:
+            >>> cache = ResponseCache('/tmp/biomart_cache')
+            >>> dataset = Dataset(name='hsapiens_gene_ensembl',
+            >>>                   host='http://www.ensembl.org',
+            >>>                   use_cache=cache)
+
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self._path = path
+
+    @property
+    def path(self):
+        """Path of the cache directory."""
+        return self._path
+
+    @staticmethod
+    def key(method, url, params):
+        """Returns the cache key of a request.
+
+        Args:
+            method (str): Request method (get or post).
+            url (str): Url of the service the request is sent to.
+            params (dict[str,any]): Parameters (or form data) of the request.
+
+        Returns:
+            str: Hex digest identifying the request.
+
+        """
+        digest = hashlib.sha256()
+        digest.update(u'{}\n{}\n'.format(method.lower(), url).encode('utf-8'))
+
+        for name in sorted(params):
+            value = params[name]
+            if not isinstance(value, bytes):
+                value = str(value).encode('utf-8')
+            digest.update(u'{}='.format(name).encode('utf-8'))
+            digest.update(value)
+            digest.update(b'\n')
+
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self._path, key[:2], key[2:])
+
+    def get(self, key):
+        """Returns the cached response for the given key.
+
+        Args:
+            key (str): Cache key of the request (see key).
+
+        Returns:
+            requests.models.Response: Cached response, or None if the
+                request has not been cached.
+
+        """
+        try:
+            with open(self._entry_path(key), 'rb') as file_:
+                header = file_.readline()
+                content = file_.read()
+        except (IOError, OSError):
+            return None
+
+        try:
+            header = json.loads(header.decode('utf-8'))
+        except ValueError:
+            return None
+
+        response = requests.Response()
+        response.status_code = header['status_code']
+        response.url = header['url']
+        response.encoding = header['encoding']
+        response.headers = CaseInsensitiveDict(header['headers'])
+        # pylint: disable=protected-access
+        response._content = content
+        # pylint: enable=protected-access
+        response.from_cache = True
+
+        return response
+
+    def set(self, key, response):
+        """Stores a response under the given key.
+
+        Args:
+            key (str): Cache key of the request (see key).
+            response (requests.models.Response): Response to store.
+
+        """
+        header = json.dumps({
+            'status_code': response.status_code,
+            'url': response.url,
+            'encoding': response.encoding,
+            'headers': dict(response.headers)
+        }).encode('utf-8')
+
+        entry_path = self._entry_path(key)
+        shard_path = os.path.dirname(entry_path)
+        _makedirs(shard_path)
+
+        fd, tmp_path = tempfile.mkstemp(dir=shard_path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file_:
+                file_.write(header + b'\n')
+                file_.write(response.content)
+            _replace(tmp_path, entry_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def clear(self):
+        """Removes all cached responses."""
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def __repr__(self):
+        return '<biomart.ResponseCache path={!r}>'.format(self._path)
+
+
+# Cache used by objects with use_cache=True.
+DEFAULT_CACHE = ResponseCache(DEFAULT_CACHE_PATH)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as err:
+        if err.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
@@ -5,13 +5,22 @@ from builtins import *
 # pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
 from future.utils import native_str
 
-from io import StringIO
+from collections import namedtuple
+import difflib
+import hashlib
+import pickle
 from xml.etree import ElementTree
+import zlib
 
+from future.moves.urllib.parse import urlencode
 import pandas as pd
 
 # pylint: disable=import-error
-from .base import ServerBase, BiomartException, DEFAULT_SCHEMA
+from .base import (ServerBase, BiomartException, Deadline, DEFAULT_SCHEMA,
+                   DEFAULT_TIMEOUT, current_deadline, deadline_scope)
+from . import (annotation, backends, intervals, jobs, planning, predicates,
+               sequences, tracing)
+from .prepared import PreparedQuery, split_template
 
 # pylint: enable=import-error
 
@@ -30,11 +39,22 @@ class Dataset(ServerBase):
     Args:
         name (str): Id of the dataset.
         display_name (str): Display name of the dataset.
-        host (str): Url of host to connect to.
+        host (str or list[str]): Url of host to connect to, or a list of
+            urls of equivalent mirrors (see ServerBase).
         path (str): Path on the host to access to the biomart service.
         port (int): Port to use for the connection.
         use_cache (bool): Whether to cache requests.
         virtual_schema (str): The virtual schema of the dataset.
+        governor (Governor): Governor limiting the rate of requests.
+        timeout (tuple[float,float]): Connect and read timeouts (seconds).
+        use_post (bool): Whether to submit queries using post requests.
+        metadata_ttl (float): Number of seconds after which the
+            configuration is refreshed in the background (see ServerBase).
+        transport (Transport): Transport used to send requests (see
+            ServerBase).
+        validate_options (bool): Whether to validate filter values against
+            the options listed in the configuration before sending
+            queries (see Filter.normalize).
 
     Examples:
         Directly connecting to a dataset:
@@ -63,16 +83,26 @@ class Dataset(ServerBase):
                  path=None,
                  port=None,
                  use_cache=True,
-                 virtual_schema=DEFAULT_SCHEMA):
-        super().__init__(host=host, path=path, port=port, use_cache=use_cache)
+                 virtual_schema=DEFAULT_SCHEMA,
+                 governor=None,
+                 timeout=DEFAULT_TIMEOUT,
+                 use_post=True,
+                 metadata_ttl=None,
+                 transport=None,
+                 validate_options=True):
+        super().__init__(host=host, path=path, port=port,
+                         use_cache=use_cache, governor=governor,
+                         timeout=timeout, use_post=use_post,
+                         metadata_ttl=metadata_ttl, transport=transport)
 
         self._name = name
         self._display_name = display_name
         self._virtual_schema = virtual_schema
+        self._validate_options = validate_options
 
-        self._filters = None
-        self._attributes = None
-        self._default_attributes = None
+        # Filters and attributes, which are replaced together when the
+        # configuration is refreshed.
+        self._configuration = None
 
     @property
     def name(self):
@@ -84,30 +114,70 @@ class Dataset(ServerBase):
         """Display name of the dataset."""
         return self._display_name
 
+    @property
+    def validate_options(self):
+        """Whether filter values are validated against their options."""
+        return self._validate_options
+
     @property
     def filters(self):
         """List of filters available for the dataset."""
-        if self._filters is None:
-            self._filters, self._attributes = self._fetch_configuration()
-        return self._filters
+        return self._metadata('_configuration',
+                              self._fetch_configuration).filters
 
     @property
     def attributes(self):
         """List of attributes available for the dataset (cached)."""
-        if self._attributes is None:
-            self._filters, self._attributes = self._fetch_configuration()
-        return self._attributes
+        return self._metadata('_configuration',
+                              self._fetch_configuration).attributes
 
     @property
     def default_attributes(self):
         """List of default attributes for the dataset."""
-        if self._default_attributes is None:
-            self._default_attributes = {
-                name: attr
-                for name, attr in self.attributes.items()
-                if attr.default is True
-            }
-        return self._default_attributes
+        return self._metadata(
+            '_configuration', self._fetch_configuration).default_attributes
+
+    def __getstate__(self):
+        state = super().__getstate__()
+
+        # Store the configuration as compressed tuples instead of objects,
+        # which keeps pickles small when shipping datasets to workers.
+        catalog = None
+        config = self._configuration
+        if config is not None:
+            strings = {}
+            attributes = _pack(
+                ((attr.name, attr.display_name, attr.description,
+                  attr.default) for attr in config.attributes.values()),
+                strings)
+            filters = _pack(
+                ((filt.name, filt.type, filt.description, filt.display_name,
+                  filt.options) for filt in config.filters.values()),
+                strings)
+            catalog = zlib.compress(pickle.dumps(
+                (attributes, filters, config.digest, config.version),
+                protocol=2))
+
+        del state['_configuration']
+        state['_catalog'] = catalog
+
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        catalog = state.pop('_catalog')
+
+        super().__setstate__(state)
+
+        if catalog is not None:
+            attributes, filters, digest, version = pickle.loads(
+                zlib.decompress(catalog))
+            self._configuration = _Configuration.create(
+                {row[0]: Filter(*row) for row in filters},
+                {row[0]: Attribute(*row) for row in attributes},
+                digest=digest, version=version)
+        else:
+            self._configuration = None
 
     def list_attributes(self):
         """Lists available attributes in a readable DataFrame format.
@@ -139,28 +209,74 @@ class Dataset(ServerBase):
             _row_gen(self.filters), columns=['name', 'type', 'description'])
 
     def _fetch_configuration(self):
-        # Get datasets using biomart.
-        response = self.get(type='configuration', dataset=self._name)
+        """Fetches the configuration, reusing the current one if unchanged.
+
+        Configurations are large, but rarely change. When refreshing, the
+        current configuration is therefore revalidated instead of fetched
+        again. If the server supplied validators (ETag/Last-Modified) for
+        the configuration, it is revalidated using a conditional request
+        (see ServerBase). Otherwise, the configuration is assumed to be
+        unchanged as long as the (much smaller) registry of the server is
+        unchanged, as new releases are listed as new mart databases. If the
+        configuration is downloaded anyway, parsing is skipped if its
+        content is identical to the current configuration.
+        """
+
+        current = self._configuration
+
+        with tracing.span('fetch_configuration', dataset=self._name):
+            # Registry versions are only needed if refreshes are enabled.
+            version = None
+            if self._metadata_ttl is not None:
+                version = self._registry_version()
+
+            if (current is not None and current.version is not None and
+                    current.version == version):
+                return current
 
-        # Check response for problems.
-        if 'Problem retrieving configuration' in response.text:
-            raise BiomartException('Failed to retrieve dataset configuration, '
-                                   'check the dataset name and schema.')
+            # Get datasets using biomart.
+            response = self.get(type='configuration', dataset=self._name)
 
-        # Get filters and attributes from xml.
-        xml = ElementTree.fromstring(response.content)
+            # Check response for problems.
+            if 'Problem retrieving configuration' in response.text:
+                raise BiomartException(
+                    'Failed to retrieve dataset configuration, '
+                    'check the dataset name and schema.')
+
+            if version is not None and _has_validators(response):
+                version = None
+
+            digest = hashlib.sha256(response.content).hexdigest()
+            if current is not None and current.digest == digest:
+                return current._replace(version=version)
+
+            # Get filters and attributes from xml.
+            xml = ElementTree.fromstring(response.content)
 
-        filters = {f.name: f for f in self._filters_from_xml(xml)}
-        attributes = {a.name: a for a in self._attributes_from_xml(xml)}
+            filters = {f.name: f for f in self._filters_from_xml(xml)}
+            attributes = {a.name: a for a in self._attributes_from_xml(xml)}
 
-        return filters, attributes
+            return _Configuration.create(
+                filters, attributes, digest=digest, version=version)
+
+    def _registry_version(self):
+        """Returns a hash identifying the version of the server registry."""
+        response = self.get(type='registry')
+        return hashlib.sha256(response.content).hexdigest()
 
     @staticmethod
     def _filters_from_xml(xml):
         for node in xml.iter('FilterDescription'):
             attrib = node.attrib
+            options = tuple(option.attrib['value']
+                            for option in node.findall('Option')
+                            if 'value' in option.attrib)
             yield Filter(
-                name=attrib['internalName'], type=attrib.get('type', ''))
+                name=attrib['internalName'],
+                type=attrib.get('type', ''),
+                description=attrib.get('description', ''),
+                display_name=attrib.get('displayName', ''),
+                options=options)
 
     @staticmethod
     def _attributes_from_xml(xml):
@@ -183,8 +299,15 @@ class Dataset(ServerBase):
               filters=None,
               only_unique=True,
               use_attr_names=False,
-              dtypes = None
-              ):
+              dtypes=None,
+              chunk_size=None,
+              shard_by=None,
+              n_jobs=planning.DEFAULT_MAX_JOBS,
+              backend='pandas',
+              deadline=None,
+              linked=None,
+              result_cache=None,
+              where=None):
         """Queries the dataset to retrieve the contained data.
 
         Args:
@@ -202,12 +325,588 @@ class Dataset(ServerBase):
                 display names (False).
             dtypes (dict[str,any]): Dictionary of attributes --> data types
                 to describe to pandas how the columns should be handled
+            chunk_size (int or str): If given, the values of the largest
+                list filter are split into chunks of this size, which are
+                fetched as separate sub-queries. If 'auto', the chunk size
+                is chosen using the row count estimated by a count query.
+                Queries exceeding the maximum size of a request (which is
+                much larger for post than for get requests) are always
+                split into chunks that fit within a single request,
+                including the chunks or shards of chunked or sharded
+                queries.
+            shard_by (str): If 'region', the query is split into shards
+                covering (groups of) chromosomes or windows of large
+                chromosomes, using the chromosome_name, start and end
+                filters. Duplicate rows from entries overlapping the
+                boundaries of windows are removed from the result.
+            n_jobs (int): Maximum number of sub-queries to run in parallel
+                when the query is split into chunks or shards.
+            backend (str): Type of the returned result. Either 'pandas'
+                (default) for a pandas DataFrame, 'arrow' for a pyarrow
+                Table, 'polars' for a polars DataFrame or 'shared' for a
+                SharedResult (an Arrow file in shared memory, which can be
+                attached to by other processes without copying). The other
+                backends parse the response directly into Arrow, dictionary
+                encoding string columns with few distinct values.
+            deadline (float): Maximum number of seconds the query may take.
+                The deadline applies to all requests made by the query,
+                including those of its chunks or shards, whose timeouts are
+                limited to the remaining time. Once the deadline passes,
+                outstanding sub-queries are cancelled and DeadlineExceeded
+                is raised.
+            linked (tuple): Tuple of (dataset, attributes, filters), giving
+                a second dataset (from the same virtual schema) that is
+                joined to this dataset by the server. The result contains
+                the attributes of both datasets, with the attributes of the
+                linked dataset as last columns. Filters of the linked
+                dataset are optional, as are its attributes (in which case
+                its default attributes are used).
+            result_cache (ResultCache): Cache of results, which is used to
+                answer queries contained in previously cached results
+                locally (see ResultCache). Only supported for the pandas
+                backend, without dtypes or linked datasets.
+            where (Predicate): Predicate selecting rows of the result,
+                built using pybiomart.predicates.col. Parts of the predicate
+                that select values of attributes with a corresponding
+                filter are sent to the server as filters. The remainder
+                (ranges, regular expressions, negations, alternatives
+                across attributes, etc.) is evaluated locally on chunks of
+                the streamed response, keeping only the selected rows in
+                memory. Only supported for the pandas backend, without
+                linked datasets.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing the query results (or
+                a pyarrow.Table/polars.DataFrame/SharedResult for other
+                backends).
+
+        """
+
+        if shard_by not in {None, 'region'}:
+            raise ValueError('Invalid value for shard_by ({})'
+                             .format(shard_by))
+
+        if chunk_size is not None and shard_by is not None:
+            raise ValueError('Queries cannot be both chunked and sharded')
+
+        backends.check_backend(backend)
+
+        if deadline is not None:
+            deadline = Deadline(deadline, parent=current_deadline())
+        else:
+            deadline = current_deadline()
+
+        # The configuration (needed for default attributes, linked datasets
+        # and predicates) may still have to be fetched within the deadline.
+        with deadline_scope(deadline):
+            # Default to default attributes if none requested.
+            if attributes is None:
+                attributes = list(self.default_attributes.keys())
+
+            if linked is not None:
+                linked = self._check_linked(linked)
+
+            local = None
+            if where is not None:
+                if backend != 'pandas' or linked is not None:
+                    raise ValueError('Predicates are only supported for '
+                                     'pandas queries without linked datasets')
+
+                with tracing.span('push_down'):
+                    filters, local = predicates.push_down(
+                        where, self, filters)
+
+            if result_cache is not None:
+                if local is not None:
+                    raise ValueError('Result caches do not support '
+                                     'predicates that are evaluated locally')
+
+                if backend != 'pandas' or dtypes or linked is not None:
+                    raise ValueError('Result caches only support pandas '
+                                     'queries without dtypes or linked '
+                                     'datasets')
+
+                # Queries sent by the cache use the deadline of this scope.
+                return result_cache.query(
+                    self, attributes, filters, only_unique=only_unique,
+                    use_attr_names=use_attr_names, chunk_size=chunk_size,
+                    shard_by=shard_by, n_jobs=n_jobs)
+
+            with tracing.span('query', dataset=self._name):
+                # Check attributes/filters before planning any requests.
+                with tracing.span('build_query'):
+                    root = self._build_query(
+                        _with_columns(attributes, local), filters,
+                        only_unique, linked=linked)
+
+                with tracing.span('plan'):
+                    if chunk_size is None and shard_by is None:
+                        # Split queries that are too large for a request.
+                        plan = planning.plan_size(
+                            filters, self._query_size(root),
+                            self._max_query_size, n_jobs=n_jobs)
+                    elif shard_by == 'region':
+                        plan = planning.plan_regions(
+                            self, filters, n_jobs=n_jobs)
+                    else:
+                        plan = planning.plan_chunks(
+                            self, filters, chunk_size=chunk_size,
+                            n_jobs=n_jobs)
+
+                    plan = self._fit_plan(
+                        plan, _with_columns(attributes, local), only_unique,
+                        linked=linked, n_jobs=n_jobs)
+
+                if len(plan) == 1 and shard_by is None:
+                    result = self._query(attributes, plan.filters[0],
+                                         only_unique, dtypes, backend=backend,
+                                         linked=linked, where=local)
+                else:
+                    result = self._query_plan(
+                        plan, attributes, only_unique, dtypes,
+                        deduplicate=only_unique or shard_by is not None,
+                        backend=backend, linked=linked, where=local)
+
+        return self._finalize(result, attributes, use_attr_names,
+                              backend=backend, linked=linked)
+
+    def query_job(self,
+                  directory,
+                  attributes=None,
+                  filters=None,
+                  only_unique=True,
+                  chunk_size=None,
+                  shard_by=None,
+                  n_jobs=planning.DEFAULT_MAX_JOBS):
+        """Creates a resumable job for a large (chunked or sharded) query.
+
+        The query is split into sub-queries, whose progress and results
+        are recorded in the given directory. If an existing job directory
+        is given, the job is reopened, so that running it again resumes
+        from the sub-queries that did not finish. See QueryJob for details.
+
+        Args:
+            directory (str): Directory containing the manifest and results
+                of the job.
+            attributes (list[str]): Names of attributes to fetch in query.
+            filters (dict[str,any]): Dictionary of filters --> values
+                to filter the dataset by.
+            only_unique (bool): Whether to return only unique rows.
+            chunk_size (int or str): Number of filter values per sub-query
+                (or 'auto'), see query.
+            shard_by (str): If 'region', the query is sharded by genomic
+                region, see query.
+            n_jobs (int): Number of sub-queries to run in parallel.
+
+        Returns:
+            QueryJob: Job, which is run using its run method.
+
+        """
+        return jobs.QueryJob(
+            self,
+            directory,
+            attributes=attributes,
+            filters=filters,
+            only_unique=only_unique,
+            chunk_size=chunk_size,
+            shard_by=shard_by,
+            n_jobs=n_jobs)
+
+    def to_dask(self,
+                attributes=None,
+                filters=None,
+                only_unique=True,
+                use_attr_names=False,
+                dtypes=None,
+                partition_by=None,
+                chunk_size='auto'):
+        """Returns a lazy Dask DataFrame, with a partition per sub-query.
+
+        The query is planned (split into sub-queries) like a chunked or
+        sharded query, but none of the sub-queries is sent. Instead, each
+        sub-query becomes a partition of the returned Dask DataFrame, which
+        is only fetched when the partition is computed (possibly by a
+        worker of a distributed cluster). The metadata of the DataFrame is
+        derived from the dataset configuration: columns are named after the
+        attributes and are read as strings unless a dtype is given.
+
+        Args:
+            attributes (list[str]): Names of attributes to fetch in query.
+            filters (dict[str,any]): Dictionary of filters --> values
+                to filter the dataset by.
+            only_unique (bool): Whether to return only unique rows (per
+                partition, as rows of different shards may overlap).
+            use_attr_names (bool): Whether to use attribute names as column
+                names (True) or attribute display names (False).
+            dtypes (dict[str,any]): Dictionary of (display) column names -->
+                data types, see query.
+            partition_by (str): Either the name of a list filter whose
+                values are split into partitions of chunk_size values, or
+                'region' to partition the query into genomic regions (see
+                the shard_by argument of query). By default, the query is
+                only split into partitions if it is too large for a single
+                request.
+            chunk_size (int or str): Number of filter values per partition,
+                or 'auto' to choose the chunk size using a count query.
+
+        Returns:
+            dask.dataframe.DataFrame: Lazy DataFrame of the query result.
+
+        """
+        # pylint: disable=protected-access
+        dd = backends._import_dask()
+        # pylint: enable=protected-access
+
+        if attributes is None:
+            attributes = list(self.default_attributes.keys())
+
+        attributes = list(attributes)
+        filters = filters or {}
+
+        with tracing.span('build_query'):
+            root = self._build_query(attributes, filters, only_unique)
+
+        with tracing.span('plan'):
+            if partition_by is None:
+                plan = planning.plan_size(
+                    filters, self._query_size(root), self._max_query_size)
+            elif partition_by == 'region':
+                plan = planning.plan_regions(self, filters)
+            elif isinstance(filters.get(partition_by), list):
+                plan = planning.plan_chunks(
+                    self, filters, chunk_size=chunk_size,
+                    chunk_name=partition_by)
+            else:
+                raise ValueError('Partitions should be split on a list '
+                                 'filter or by region ({})'
+                                 .format(partition_by))
+
+            plan = self._fit_plan(plan, attributes, only_unique)
+
+        # Read all columns as strings unless a dtype is given, so that the
+        # types of partitions match the metadata regardless of content.
+        display_names = [self.attributes[attr].display_name
+                         for attr in attributes]
+        dtypes = {name: (dtypes or {}).get(name, str)
+                  for name in display_names}
+
+        columns = attributes if use_attr_names else display_names
+        meta = pd.DataFrame({
+            column: pd.Series([], dtype=dtypes[name])
+            for column, name in zip(columns, display_names)
+        }, columns=columns)
+
+        partition = _Partition(self, attributes, only_unique, dtypes, meta)
+
+        return dd.from_map(partition, plan.filters, meta=meta,
+                           label='biomart-' + self._name)
+
+    def query_sequences(self,
+                        attributes,
+                        filters=None,
+                        only_unique=True,
+                        path=None,
+                        deadline=None):
+        """Queries sequences (cDNA, peptides, etc.) in FASTA format.
+
+        Sequences are fetched using the FASTA formatter of biomart. The
+        attributes should contain a single sequence attribute (such as
+        'cdna', 'peptide' or 'gene_flank'), the other attributes are
+        included in the header of each record (separated by '|'). The
+        response is streamed, so that memory use does not depend on the
+        number of returned sequences.
+
+        Args:
+            attributes (list[str]): Names of attributes to fetch, including
+                the sequence attribute.
+            filters (dict[str,any]): Dictionary of filters --> values
+                to filter the dataset by.
+            only_unique (bool): Whether to return only unique records.
+            path (str): If given, the sequences are written directly to
+                this (FASTA) file, which is gzipped if the path ends with
+                '.gz'. Otherwise the records are returned as an iterator.
+            deadline (float): Maximum number of seconds that sending the
+                query may take (see query). Reading the streamed response
+                is limited by the read timeout instead.
+
+        Returns:
+            iterator[tuple[str,str]]: Iterator over the (header, sequence)
+                records, or the number of bytes written if a path is given.
+
+        """
+
+        if deadline is not None:
+            deadline = Deadline(deadline, parent=current_deadline())
+        else:
+            deadline = current_deadline()
+
+        root = self._build_query(attributes, filters, only_unique,
+                                 formatter='FASTA')
+
+        with deadline_scope(deadline), \
+                tracing.span('query_sequences', dataset=self._name):
+            response = self._submit(root, stream=True)
+
+        chunks = sequences.open_stream(response)
+
+        if path is None:
+            return _closing(sequences.read_fasta(chunks), response)
+
+        try:
+            with tracing.span('write_sequences', path=path):
+                return sequences.write_chunks(chunks, path)
+        finally:
+            response.close()
+
+    def _check_linked(self, linked):
+        """Checks a linked dataset.
 
         Returns:
-            pandas.DataFrame: DataFrame containing the query results.
+            tuple: Linked (dataset, attributes, filters).
 
         """
 
+        if len(linked) == 2:
+            dataset, attributes = linked
+            filters = None
+        elif len(linked) == 3:
+            dataset, attributes, filters = linked
+        else:
+            raise ValueError('Linked datasets should be given as a tuple of '
+                             '(dataset, attributes, filters)')
+
+        if not isinstance(dataset, Dataset):
+            raise ValueError('Invalid linked dataset ({!r})'.format(dataset))
+
+        # pylint: disable=protected-access
+        if dataset._virtual_schema != self._virtual_schema:
+            raise BiomartException(
+                'Linked datasets should be from the same virtual schema '
+                '({} != {})'.format(dataset._virtual_schema,
+                                    self._virtual_schema))
+        # pylint: enable=protected-access
+
+        if attributes is None:
+            attributes = list(dataset.default_attributes.keys())
+
+        return dataset, list(attributes), filters
+
+    def prepare(self,
+                attributes=None,
+                parameters=(),
+                filters=None,
+                only_unique=True,
+                use_attr_names=False,
+                dtypes=None,
+                backend='pandas',
+                validate=True):
+        """Prepares a query that can be executed for many filter values.
+
+        The attributes and filters of the query are validated once, after
+        which the query can be executed repeatedly for different values of
+        its parameter filters (see PreparedQuery). Prepared queries are
+        executed as a single request, without chunking or sharding.
+
+        Args:
+            attributes (list[str]): Names of attributes to fetch in query.
+            parameters (list[str]): Names of the filters whose values are
+                given when executing the query.
+            filters (dict[str,any]): Dictionary of filters --> values that
+                are fixed for all executions of the query.
+            only_unique (bool): Whether to return only rows containing
+                unique values (True) or to include duplicate rows (False).
+            use_attr_names (bool): Whether to use the attribute names
+                as column names in the result (True) or the attribute
+                display names (False).
+            dtypes (dict[str,any]): Dictionary of attributes --> data types
+                to describe to pandas how the columns should be handled
+            backend (str): Type of the returned results (see query).
+            validate (bool): Whether to validate the attributes and filters
+                against the dataset configuration. If False, the given names
+                are trusted and the configuration is not fetched, which
+                requires attributes to be given explicitly. Results of
+                unvalidated queries are always named by attribute names.
+
+        Returns:
+            PreparedQuery: Query that can be executed for filter values.
+
+        """
+
+        backends.check_backend(backend)
+
+        if validate:
+            if attributes is None:
+                attributes = list(self.default_attributes.keys())
+
+            root = self._build_query(attributes, filters, only_unique)
+
+            unknown = [name for name in parameters if name not in self.filters]
+            if unknown:
+                raise BiomartException(
+                    'Unknown filter {}, check dataset filters '
+                    'for a list of valid filters.'.format(unknown[0]))
+            params = {name: self.filters[name] for name in parameters}
+
+            if use_attr_names:
+                columns = list(attributes)
+            else:
+                columns = [self.attributes[attr].display_name
+                           for attr in attributes]
+        else:
+            if attributes is None:
+                raise ValueError('Attributes must be given for queries '
+                                 'that are not validated')
+
+            # Trust the given names, using filters of unknown type.
+            root = self._query_root(only_unique)
+            dataset = root.find('Dataset')
+
+            for name in attributes:
+                self._add_attr_node(dataset, Attribute(name))
+
+            for name, value in (filters or {}).items():
+                self._add_filter_node(dataset, Filter(name, type=''), value)
+
+            params = {name: Filter(name, type='') for name in parameters}
+            columns = list(attributes)
+
+        if not attributes:
+            raise ValueError('Prepared queries require at least one attribute')
+
+        template = split_template(ElementTree.tostring(root))
+
+        return PreparedQuery(self, template, params, columns,
+                             dtypes=dtypes, backend=backend)
+
+    def annotate(self,
+                 frame,
+                 key_column,
+                 attributes,
+                 key_attribute=None,
+                 key_filter=None,
+                 cache=None,
+                 chunk_size=None,
+                 n_jobs=planning.DEFAULT_MAX_JOBS):
+        """Annotates a DataFrame with attributes of the dataset.
+
+        The unique keys in the key column of the frame are looked up in a
+        persistent per-key cache, after which only keys missing from the
+        cache are queried (in chunks). The annotations are then joined to
+        the frame, adding a column (named after the attribute) for each
+        of the attributes. Keys matching multiple rows in the dataset
+        result in multiple rows in the annotated frame.
+
+        Args:
+            frame (pd.DataFrame): Frame to annotate.
+            key_column (str): Column of the frame containing the keys.
+            attributes (list[str]): Names of attributes to annotate.
+            key_attribute (str): Attribute whose values are the keys in the
+                key column. Defaults to the name of the key column.
+            key_filter (str): Filter used to select keys in queries.
+                Defaults to the key attribute.
+            cache (AnnotationCache or str): Cache (or the path of the cache
+                file) to use for annotations. Defaults to a cache file in
+                the working directory.
+            chunk_size (int or str): Chunk size of queries (see query).
+            n_jobs (int): Maximum number of chunks to query in parallel.
+
+        Returns:
+            pd.DataFrame: Annotated frame.
+
+        """
+        return annotation.annotate(
+            self, frame, key_column, attributes,
+            key_attribute=key_attribute, key_filter=key_filter, cache=cache,
+            chunk_size=chunk_size, n_jobs=n_jobs)
+
+    def build_interval_index(self,
+                             attributes,
+                             path=None,
+                             filters=None,
+                             coordinates=intervals.DEFAULT_COORDINATES,
+                             chunk_size=None,
+                             n_jobs=planning.DEFAULT_MAX_JOBS):
+        """Builds a local index of feature coordinates for overlap lookups.
+
+        Fetches the coordinates of all (filtered) features of the dataset
+        in a single query, together with the given attributes, and indexes
+        them per chromosome. The overlapping features of (many) regions can
+        then be looked up locally using the overlaps and annotate methods
+        of the index, instead of querying the server for each region.
+
+        Args:
+            attributes (list[str]): Names of attributes to return for
+                overlapping features.
+            path (str): Path to save the index to (optional). Saved
+                indices can be loaded using IntervalIndex.load.
+            filters (dict[str,any]): Filters selecting the indexed features.
+            coordinates (tuple[str]): Names of the attributes containing
+                the chromosome, start and end of the features. Defaults to
+                the gene coordinates of Ensembl datasets.
+            chunk_size (int or str): Chunk size of the query (see query).
+            n_jobs (int): Maximum number of chunks to query in parallel.
+
+        Returns:
+            IntervalIndex: Index of the features.
+
+        """
+        coordinates = tuple(coordinates)
+        if len(coordinates) != 3:
+            raise ValueError('Coordinates should consist of a chromosome, '
+                             'start and end attribute')
+
+        attributes = list(attributes)
+        columns = list(coordinates) + [
+            attr for attr in attributes if attr not in coordinates
+        ]
+
+        features = self.query(
+            attributes=columns,
+            filters=filters,
+            use_attr_names=True,
+            chunk_size=chunk_size,
+            n_jobs=n_jobs)
+
+        with tracing.span('build_interval_index', features=len(features)):
+            index = intervals.IntervalIndex(
+                features, attributes, coordinates=coordinates)
+
+            if path is not None:
+                index.save(path)
+
+        return index
+
+    def count(self, filters=None, only_unique=True):
+        """Counts the number of entries matching the given filters.
+
+        Uses the count mode of biomart, which only returns the number of
+        matching entries of the dataset (e.g. genes) instead of the data
+        itself. As queries may return multiple rows per entry (for example
+        when fetching transcript attributes), this count is an estimate of
+        the number of rows returned by a query with the same filters.
+
+        Args:
+            filters (dict[str,any]): Dictionary of filters --> values
+                to filter the dataset by.
+            only_unique (bool): Whether to count only unique entries.
+
+        Returns:
+            int: Number of matching entries.
+
+        """
+        root = self._build_query([], filters, only_unique, count=True)
+
+        response = self._submit(root)
+
+        try:
+            return int(response.text.strip())
+        except ValueError:
+            raise BiomartException(response.text)
+
+    def _build_query(self, attributes, filters, only_unique=True,
+                     count=False, linked=None, formatter='TSV'):
+        """Builds the xml element tree for a query."""
+
         # Example query from Ensembl biomart:
         #
         # <?xml version="1.0" encoding="UTF-8"?>
@@ -223,22 +922,21 @@ class Dataset(ServerBase):
         #   </Dataset>
         # </Query>
 
-        # Setup query element.
-        root = ElementTree.Element('Query')
-        root.set('virtualSchemaName', self._virtual_schema)
-        root.set('formatter', 'TSV')
-        root.set('header', '1')
-        root.set('uniqueRows', native_str(int(only_unique)))
-        root.set('datasetConfigVersion', '0.6')
+        root = self._query_root(only_unique, count=count, formatter=formatter)
+        self._add_query_nodes(root.find('Dataset'), attributes, filters)
 
-        # Add dataset element.
-        dataset = ElementTree.SubElement(root, 'Dataset')
-        dataset.set('name', self.name)
-        dataset.set('interface', 'default')
+        if linked is not None:
+            # Add a second dataset element, which is joined by the server.
+            # pylint: disable=protected-access
+            other, other_attributes, other_filters = linked
+            other._add_query_nodes(other._add_dataset_node(root),
+                                   other_attributes, other_filters)
+            # pylint: enable=protected-access
 
-        # Default to default attributes if none requested.
-        if attributes is None:
-            attributes = list(self.default_attributes.keys())
+        return root
+
+    def _add_query_nodes(self, dataset, attributes, filters):
+        """Adds (validated) attribute and filter nodes to a dataset node."""
 
         # Add attribute elements.
         for name in attributes:
@@ -255,33 +953,213 @@ class Dataset(ServerBase):
             for name, value in filters.items():
                 try:
                     filter_ = self.filters[name]
-                    self._add_filter_node(dataset, filter_, value)
                 except KeyError:
                     raise BiomartException(
                         'Unknown filter {}, check dataset filters '
                         'for a list of valid filters.'.format(name))
 
-        # Fetch response.
-        response = self.get(query=ElementTree.tostring(root))
+                if self._validate_options:
+                    value = filter_.normalize(value)
 
-        # Raise exception if an error occurred.
-        if 'Query ERROR' in response.text:
-            raise BiomartException(response.text)
+                self._add_filter_node(dataset, filter_, value)
 
-        # Parse results into a DataFrame.
-        try:
-            result = pd.read_csv(StringIO(response.text), sep='\t', dtype=dtypes)
-        # Type error is raised of a data type is not understood by pandas
-        except TypeError as err:
-            raise ValueError("Non valid data type is used in dtypes")
+    def _query_root(self, only_unique=True, count=False, formatter='TSV'):
+        """Builds the query element and an (empty) dataset element."""
+
+        # Setup query element.
+        root = ElementTree.Element('Query')
+        root.set('virtualSchemaName', self._virtual_schema)
+        root.set('formatter', formatter)
+        root.set('header', '1' if formatter == 'TSV' and not count else '0')
+        root.set('uniqueRows', native_str(int(only_unique)))
+        if count:
+            root.set('count', '1')
+        root.set('datasetConfigVersion', '0.6')
+
+        self._add_dataset_node(root)
+
+        return root
+
+    def _add_dataset_node(self, root):
+        """Adds an (empty) dataset node for this dataset to root."""
+
+        dataset = ElementTree.SubElement(root, 'Dataset')
+        dataset.set('name', self.name)
+        dataset.set('interface', 'default')
+
+        return dataset
 
-        if use_attr_names:
+    def _finalize(self, result, attributes, use_attr_names,
+                  backend='pandas', linked=None):
+        """Renames the columns of a result and converts it to its backend."""
+
+        if use_attr_names and linked is not None:
+            # Rename by position, as both datasets may share display names.
+            result = backends.set_columns(
+                result, list(attributes) + list(linked[1]), backend=backend)
+        elif use_attr_names:
             # Rename columns with attribute names instead of display names.
             column_map = {
                 self.attributes[attr].display_name: attr
                 for attr in attributes
             }
-            result.rename(columns=column_map, inplace=True)
+            result = backends.rename(result, column_map, backend=backend)
+
+        return backends.finalize(result, backend=backend)
+
+    @property
+    def _max_query_size(self):
+        if self.use_post:
+            return planning.MAX_POST_QUERY_SIZE
+        return planning.MAX_GET_QUERY_SIZE
+
+    def _query_size(self, root):
+        """Returns the size of query xml as submitted in a request."""
+
+        query = ElementTree.tostring(root)
+
+        if self.use_post:
+            return len(query)
+
+        # Get requests submit the query url-encoded in the url.
+        return len(urlencode({'query': query}))
+
+    def _fit_plan(self, plan, attributes, only_unique, linked=None,
+                  n_jobs=planning.DEFAULT_MAX_JOBS):
+        """Splits sub-queries of a plan that are too large for a request."""
+
+        def _size(filters):
+            return self._query_size(self._build_query(
+                attributes, filters, only_unique, linked=linked))
+
+        return planning.fit_size(plan, _size, self._max_query_size,
+                                 n_jobs=n_jobs)
+
+    def _submit(self, root, stream=False):
+        """Submits query xml, using a post request if enabled."""
+        return self._submit_query(ElementTree.tostring(root), stream=stream)
+
+    def _submit_query(self, query, stream=False):
+        """Submits a serialized query, using a post request if enabled."""
+
+        if stream:
+            method = 'post' if self.use_post else 'get'
+            return self._request(method, {'query': query}, stream=True)
+
+        if self.use_post:
+            return self.post(query=query)
+        return self.get(query=query)
+
+    def _query(self, attributes, filters, only_unique, dtypes,
+               backend='pandas', linked=None, where=None):
+        """Performs a single query, returning the parsed result."""
+
+        columns = _with_columns(attributes, where)
+
+        with tracing.span('build_query'):
+            root = self._build_query(columns, filters, only_unique,
+                                     linked=linked)
+
+        if where is not None:
+            # Stream the response, keeping only the selected rows.
+            response = self._submit(root, stream=True)
+            return self._read_filtered(response, attributes, columns, where,
+                                       dtypes, only_unique)
+
+        # Fetch response.
+        response = self._submit(root)
+
+        return self._parse_response(
+            response, dtypes, backend=backend,
+            names=self._display_names(attributes, linked=linked))
+
+    def _read_filtered(self, response, attributes, columns, where, dtypes,
+                       only_unique):
+        """Parses a streamed response, evaluating a predicate per chunk."""
+
+        # Chunks are parsed using attribute names, to evaluate predicates.
+        display_names = [self.attributes[attr].display_name
+                         for attr in attributes]
+
+        if dtypes:
+            dtypes = {
+                attr: dtypes[self.attributes[attr].display_name]
+                for attr in columns
+                if self.attributes[attr].display_name in dtypes
+            }
+
+        frames = []
+
+        with tracing.span('parse_filtered', where=where):
+            try:
+                chunks = sequences.open_stream(response)
+                for frame in backends.read_tsv_chunks(chunks, columns,
+                                                      dtypes=dtypes):
+                    frame = frame.loc[where.evaluate(frame), attributes]
+                    if only_unique:
+                        frame = frame.drop_duplicates()
+                    frames.append(frame)
+            finally:
+                response.close()
+
+        if frames:
+            result = pd.concat(frames, ignore_index=True)
+            if only_unique:
+                # Rows differing only in predicate columns are duplicates.
+                result = result.drop_duplicates().reset_index(drop=True)
+        else:
+            result = pd.DataFrame(columns=attributes)
+
+        result.columns = display_names
+
+        return result
+
+    def _display_names(self, attributes, linked=None):
+        """Returns the (display) column names of a query result."""
+
+        names = [self.attributes[attr].display_name for attr in attributes]
+
+        if linked is not None:
+            other, other_attributes, _ = linked
+            names += [other.attributes[attr].display_name
+                      for attr in other_attributes]
+
+        return names
+
+    @staticmethod
+    def _parse_response(response, dtypes, backend='pandas', names=None):
+        """Parses a query response, raising an exception for errors."""
+
+        # Raise exception if an error occurred (checking the raw content,
+        # to avoid decoding large responses that are parsed by Arrow).
+        if b'Query ERROR' in response.content:
+            raise BiomartException(response.text)
+
+        # Parse results into a DataFrame (or Arrow table).
+        with tracing.span('parse', backend=backend,
+                          bytes=len(response.content)):
+            return backends.read_tsv(response, backend=backend,
+                                     dtypes=dtypes, names=names)
+
+    def _query_plan(self, plan, attributes, only_unique, dtypes,
+                    deduplicate=True, backend='pandas', linked=None,
+                    where=None):
+        """Performs the sub-queries of a plan, combining their results."""
+
+        def _query_chunk(filters):
+            with tracing.span('sub_query', filters=filters):
+                return self._query(attributes, filters, only_unique, dtypes,
+                                   backend=backend, linked=linked,
+                                   where=where)
+
+        results = planning.run_plan(plan, _query_chunk)
+
+        with tracing.span('combine', parts=len(results)):
+            result = backends.concat(results, backend=backend)
+
+            if deduplicate:
+                # Rows may be returned by multiple sub-queries.
+                result = backends.drop_duplicates(result, backend=backend)
 
         return result
 
@@ -296,28 +1174,137 @@ class Dataset(ServerBase):
         filter_el = ElementTree.SubElement(root, 'Filter')
         filter_el.set('name', filter_.name)
 
-        # Set filter value depending on type.
-        if filter_.type == 'boolean':
+        key, value = Dataset._filter_attrib(filter_, value)
+        filter_el.set(key, value)
+
+    @staticmethod
+    def _filter_attrib(filter_, value):
+        """Returns the xml attribute (key, value) setting a filter value."""
+
+        # Set filter value depending on type (assuming booleans given
+        # for filters of unknown type are boolean filters).
+        if (filter_.type == 'boolean' or
+                (not filter_.type and isinstance(value, bool))):
             # Boolean case.
-            if value is True or value.lower() in {'included', 'only'}:
-                filter_el.set('excluded', '0')
-            elif value is False or value.lower() == 'excluded':
-                filter_el.set('excluded', '1')
+            if isinstance(value, bool):
+                value = 'included' if value else 'excluded'
+
+            if value.lower() in {'included', 'only'}:
+                return 'excluded', '0'
+            elif value.lower() == 'excluded':
+                return 'excluded', '1'
             else:
                 raise ValueError('Invalid value for boolean filter ({})'
                                  .format(value))
         elif isinstance(value, list) or isinstance(value, tuple):
             # List case.
-            filter_el.set('value', ','.join(map(str, value)))
+            return 'value', ','.join(map(str, value))
         else:
             # Default case.
-            filter_el.set('value', str(value))
+            return 'value', str(value)
 
     def __repr__(self):
         return ('<biomart.Dataset name={!r}, display_name={!r}>'
                 .format(self._name, self._display_name))
 
 
+class _Configuration(
+        namedtuple('_Configuration', ['filters', 'attributes',
+                                      'default_attributes', 'digest',
+                                      'version'])):
+    """Configuration of a dataset.
+
+    Attributes:
+        filters (dict[str,Filter]): Filters of the dataset.
+        attributes (dict[str,Attribute]): Attributes of the dataset.
+        default_attributes (dict[str,Attribute]): Default attributes.
+        digest (str): Hash of the configuration xml.
+        version (str): Hash of the server registry when the configuration
+            was fetched, or None if the configuration is revalidated using
+            http validators (or not refreshed at all).
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, filters, attributes, digest=None, version=None):
+        """Creates a configuration, determining its default attributes."""
+
+        default_attributes = {
+            name: attr
+            for name, attr in attributes.items() if attr.default is True
+        }
+
+        return cls(filters, attributes, default_attributes, digest, version)
+
+
+def _has_validators(response):
+    return 'ETag' in response.headers or 'Last-Modified' in response.headers
+
+
+def _with_columns(attributes, where):
+    """Adds the attributes used by a (local) predicate to attributes."""
+
+    if where is None:
+        return attributes
+
+    attributes = list(attributes)
+    return attributes + sorted(where.columns - set(attributes))
+
+
+class _Partition(object):
+    """Fetches the partition of a Dask DataFrame for the given filters."""
+
+    def __init__(self, dataset, attributes, only_unique, dtypes, meta):
+        self._dataset = dataset
+        self._attributes = attributes
+        self._only_unique = only_unique
+        self._dtypes = dtypes
+        self._meta = meta
+
+    def __call__(self, filters):
+        # pylint: disable=protected-access
+        with tracing.span('partition', filters=filters):
+            result = self._dataset._query(
+                self._attributes, filters, self._only_unique, self._dtypes)
+        # pylint: enable=protected-access
+
+        # Rows follow the order of the attributes in the query.
+        result.columns = list(self._meta.columns)
+        return result
+
+    def __dask_tokenize__(self):
+        # Identical queries of the same dataset yield identical partitions.
+        return (tuple(self._dataset.hosts), self._dataset.path,
+                self._dataset.name, tuple(self._attributes),
+                self._only_unique, repr(sorted(self._dtypes.items())),
+                tuple(self._meta.columns))
+
+
+def _closing(records, response):
+    """Yields records, closing the response once they are consumed."""
+
+    try:
+        for record in records:
+            yield record
+    finally:
+        response.close()
+
+
+def _pack(rows, strings):
+    """Packs rows into tuples, sharing a single copy of equal strings."""
+
+    def _intern(value):
+        if isinstance(value, tuple):
+            return tuple(_intern(item) for item in value)
+        if isinstance(value, str):
+            return strings.setdefault(value, value)
+        return value
+
+    return tuple(tuple(_intern(value) for value in row) for row in rows)
+
+
 class Attribute(object):
     """Biomart dataset attribute.
 
@@ -377,21 +1364,30 @@ class Filter(object):
         name (str): Filter name.
         type (str): Type of the filter (boolean, int, etc.).
         description (str): Filter description.
+        display_name (str): Filter display name.
+        options (tuple[str]): Values that can be selected for the filter.
 
     """
 
-    def __init__(self, name, type, description=''):
+    def __init__(self, name, type, description='', display_name='',
+                 options=()):
         """ Filter constructor.
 
         Args:
             name (str): Filter name.
             type (str): Type of the filter (boolean, int, etc.).
             description (str): Filter description.
+            display_name (str): Filter display name.
+            options (tuple[str]): Values that can be selected for
+                the filter (if listed in the configuration).
 
         """
         self._name = name
         self._type = type
         self._description = description
+        self._display_name = display_name
+        self._options = tuple(options)
+        self._lookup = None
 
     @property
     def name(self):
@@ -408,6 +1404,78 @@ class Filter(object):
         """Filter description."""
         return self._description
 
+    @property
+    def display_name(self):
+        """Filter display name."""
+        return self._display_name
+
+    @property
+    def options(self):
+        """Values that can be selected for the filter."""
+        return self._options
+
+    def normalize(self, value):
+        """Validates values of the filter against its options.
+
+        Values are matched to the options listed in the configuration,
+        ignoring case and surrounding whitespace, and are replaced by the
+        matching option. Values of filters without options (and of
+        boolean filters) are returned unchanged.
+
+        Args:
+            value (any): Value (or list of values) of the filter.
+
+        Returns:
+            any: Normalized value (or list of values).
+
+        Raises:
+            BiomartException: If any of the values is not an option.
+
+        """
+        if (not self._options or 'boolean' in self._type or
+                isinstance(value, bool)):
+            return value
+
+        if isinstance(value, (list, tuple)):
+            normalized = [self._match(item) for item in value]
+            invalid = [item for item, option in zip(value, normalized)
+                       if option is None]
+        else:
+            normalized = self._match(value)
+            invalid = [value] if normalized is None else []
+
+        if invalid:
+            message = 'Invalid value(s) {} for filter {}'.format(
+                ', '.join(repr(item) for item in invalid[:5]), self._name)
+
+            close = difflib.get_close_matches(
+                str(invalid[0]), self._options, n=1)
+            if close:
+                message += ' (did you mean {!r}?)'.format(close[0])
+
+            raise BiomartException(message)
+
+        return normalized
+
+    def _match(self, value):
+        if self._lookup is None:
+            # Options keyed by value and by case-folded value, leaving out
+            # folded values that are ambiguous or match another option.
+            lookup = {option: option for option in self._options}
+            folded = {}
+            for option in self._options:
+                folded.setdefault(option.strip().lower(), set()).add(option)
+            for key, options in folded.items():
+                if len(options) == 1 and key not in lookup:
+                    lookup[key] = options.pop()
+            self._lookup = lookup
+
+        value = str(value)
+        option = self._lookup.get(value)
+        if option is None:
+            option = self._lookup.get(value.strip().lower())
+        return option
+
     def __repr__(self):
         return ('<biomart.Filter name={!r}, type={!r}>'
                 .format(self.name, self.type))
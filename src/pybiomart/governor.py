@@ -0,0 +1,477 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+from contextlib import contextmanager
+import errno
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TARGET_LATENCY = 30.0
+DEFAULT_DECREASE = 0.5
+
+# Interval (in seconds) for polling slots released by other processes
+# and for checking deadlines whilst waiting.
+POLL_INTERVAL = 0.05
+
+# Time (in seconds) after which slots of unfinished requests are dropped.
+SLOT_LEASE = 900.0
+
+
+class Governor(object):
+    """Limits the concurrency and rate of requests to biomart hosts.
+
+    The request rate to each host is limited using a token bucket, which
+    is refilled at the given rate (in requests per second) up to burst
+    tokens. The number of concurrent requests to each host is limited to
+    an adaptive limit, which is adjusted in an AIMD fashion: each request
+    finishing within the target latency additively increases the limit
+    (by about one per round of requests), whilst slow and failed requests
+    multiplicatively decrease the limit.
+
+    If a path is given, the token buckets, concurrency limits and running
+    requests are stored in a SQLite file, so that all processes using the
+    same file share both the rate and the concurrency limit. Requests of
+    processes that exit without releasing them are dropped once the
+    process has exited (or after SLOT_LEASE seconds).
+
+    Args:
+        rate (float): Maximum (sustained) number of requests per second.
+        burst (int): Maximum number of requests in a burst.
+        max_concurrency (int): Upper bound of the concurrency limit.
+        min_concurrency (int): Lower bound of the concurrency limit.
+        target_latency (float): Request duration (in seconds) above which
+            requests are considered slow.
+        decrease (float): Factor by which the concurrency limit is
+            multiplied after a slow or failed request.
+        path (str): Path of a SQLite file for sharing the limits between
+            processes. If None, limits are only shared within the current
+            process.
+
+    Examples:
+        Sharing limits between worker processes:
+            >>> governor = Governor(rate=5, path='/tmp/biomart_rate.sqlite')
+            >>> dataset = Dataset(name='hsapiens_gene_ensembl',
+            >>>                   host='http://www.ensembl.org',
+            >>>                   governor=governor)
+
+    """
+
+    def __init__(self,
+                 rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 min_concurrency=1,
+                 target_latency=DEFAULT_TARGET_LATENCY,
+                 decrease=DEFAULT_DECREASE,
+                 path=None):
+        if rate <= 0:
+            raise ValueError('Rate should be positive ({})'.format(rate))
+
+        self._rate = rate
+        self._burst = burst
+        self._max_concurrency = max_concurrency
+        self._min_concurrency = min_concurrency
+        self._target_latency = target_latency
+        self._decrease = decrease
+        self._path = path
+
+        if path is None:
+            self._state = _MemoryState()
+            self._poll_interval = None
+        else:
+            self._state = _SqliteState(path)
+            self._poll_interval = POLL_INTERVAL
+
+        # Wakes up threads of this process waiting for a slot.
+        self._condition = threading.Condition()
+
+    @property
+    def rate(self):
+        """Maximum (sustained) number of requests per second."""
+        return self._rate
+
+    @property
+    def path(self):
+        """Path of the SQLite file shared between processes."""
+        return self._path
+
+    def __getstate__(self):
+        # Only the configuration is pickled. Unpickled governors using the
+        # same path share their limits with the original governor.
+        return {'rate': self._rate,
+                'burst': self._burst,
+                'max_concurrency': self._max_concurrency,
+                'min_concurrency': self._min_concurrency,
+                'target_latency': self._target_latency,
+                'decrease': self._decrease,
+                'path': self._path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def limit(self, host):
+        """Returns the current concurrency limit for the given host."""
+        return int(self._state.limit(host, self._min_concurrency))
+
+    def in_flight(self, host):
+        """Returns the number of running requests to the given host."""
+        return self._state.in_flight(host)
+
+    def acquire(self, host, deadline=None):
+        """Waits until a request to the given host is allowed.
+
+        Blocks until the number of running requests to the host is
+        below its concurrency limit, after which a token is taken from
+        the token bucket of the host (waiting for it to refill if needed).
+        Each call should be paired with a call to release.
+
+        Args:
+            host (str): Host that the request is sent to.
+            deadline (Deadline): Deadline of the request. If given, the
+                deadline is checked whilst waiting, raising
+                DeadlineExceeded if it expires or is cancelled.
+
+        Returns:
+            str: Identifier of the slot taken by the request.
+
+        """
+        with self._condition:
+            while True:
+                if deadline is not None:
+                    deadline.check()
+
+                slot = self._state.take_slot(host, self._min_concurrency)
+                if slot is not None:
+                    break
+
+                self._condition.wait(
+                    _wait_time(self._poll_interval, deadline))
+
+        try:
+            wait = self._state.reserve(host, self._rate, self._burst)
+            if wait > 0:
+                _sleep(wait, deadline)
+        except BaseException:
+            self._release_slot(host, slot)
+            raise
+
+        return slot
+
+    def release(self, host, latency=None, error=False, slot=None):
+        """Marks a request to the given host as finished.
+
+        Args:
+            host (str): Host that the request was sent to.
+            latency (float): Duration of the request in seconds.
+            error (bool): Whether the request failed.
+            slot (str): Slot returned by acquire. If None, any slot of
+                this process for the host is released.
+
+        """
+
+        def _adjust(limit):
+            if error or (latency is not None and
+                         latency > self._target_latency):
+                return max(self._min_concurrency, limit * self._decrease)
+            return min(self._max_concurrency, limit + 1.0 / limit)
+
+        self._state.update_limit(host, self._min_concurrency, _adjust)
+        self._release_slot(host, slot)
+
+    def _release_slot(self, host, slot):
+        self._state.release_slot(host, slot)
+        with self._condition:
+            self._condition.notify_all()
+
+    @contextmanager
+    def request(self, host, deadline=None):
+        """Context manager wrapping a request in acquire and release.
+
+        Only errors indicating an overloaded host (connection errors,
+        timeouts and 429 or 5xx responses) decrease the concurrency limit.
+        Other errors (such as invalid queries) leave the limit unchanged.
+
+        Args:
+            host (str): Host that the request is sent to.
+            deadline (Deadline): Deadline of the request (see acquire).
+
+        """
+        slot = self.acquire(host, deadline=deadline)
+        start = time.time()
+
+        try:
+            yield
+        except BaseException as err:
+            if _is_overloaded(err):
+                self.release(host, error=True, slot=slot)
+            else:
+                self._release_slot(host, slot)
+            raise
+        else:
+            self.release(host, latency=time.time() - start, slot=slot)
+
+    def __repr__(self):
+        return ('<biomart.Governor rate={!r}, burst={!r}, path={!r}>'
+                .format(self._rate, self._burst, self._path))
+
+
+class _MemoryState(object):
+    """Limits shared between threads of a single process."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._limits = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host, rate, burst):
+        """Takes a token, returning the time to wait before it is valid."""
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(host, (burst, now))
+            tokens, wait = _take_token(tokens, updated, now, rate, burst)
+            self._buckets[host] = (tokens, now)
+        return wait
+
+    def limit(self, host, default):
+        """Returns the concurrency limit of a host."""
+        with self._lock:
+            return self._limits.get(host, default)
+
+    def update_limit(self, host, default, func):
+        """Replaces the concurrency limit of a host by func(limit)."""
+        with self._lock:
+            self._limits[host] = func(self._limits.get(host, default))
+
+    def in_flight(self, host):
+        """Returns the number of taken slots of a host."""
+        with self._lock:
+            return len(self._slots.get(host, ()))
+
+    def take_slot(self, host, default):
+        """Takes a slot if the host is below its limit (None otherwise)."""
+        with self._lock:
+            slots = self._slots.setdefault(host, set())
+            if len(slots) >= int(self._limits.get(host, default)):
+                return None
+            slot = uuid.uuid4().hex
+            slots.add(slot)
+            return slot
+
+    def release_slot(self, host, slot=None):
+        """Releases a slot taken by take_slot."""
+        with self._lock:
+            slots = self._slots[host]
+            slots.remove(slot if slot is not None else next(iter(slots)))
+
+
+class _SqliteState(object):
+    """Limits shared between processes using a SQLite file."""
+
+    def __init__(self, path):
+        self._path = path
+        self._local = threading.local()
+
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets ('
+                         'host TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS limits ('
+                         'host TEXT PRIMARY KEY, value REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS slots ('
+                         'id TEXT PRIMARY KEY, host TEXT, pid INTEGER, '
+                         'acquired REAL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self._path, timeout=60, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Locks the database for a (short) read-modify-write."""
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def reserve(self, host, rate, burst):
+        """Takes a token, returning the time to wait before it is valid."""
+
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets '
+                               'WHERE host = ?', (host, )).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+
+            tokens, wait = _take_token(tokens, updated, now, rate, burst)
+
+            conn.execute('INSERT OR REPLACE INTO buckets (host, tokens, '
+                         'updated) VALUES (?, ?, ?)', (host, tokens, now))
+
+        return wait
+
+    def limit(self, host, default):
+        """Returns the concurrency limit of a host."""
+        row = self._connection().execute(
+            'SELECT value FROM limits WHERE host = ?', (host, )).fetchone()
+        return row[0] if row is not None else default
+
+    def update_limit(self, host, default, func):
+        """Replaces the concurrency limit of a host by func(limit)."""
+
+        with self._transaction() as conn:
+            row = conn.execute('SELECT value FROM limits WHERE host = ?',
+                               (host, )).fetchone()
+            limit = func(row[0] if row is not None else default)
+            conn.execute('INSERT OR REPLACE INTO limits (host, value) '
+                         'VALUES (?, ?)', (host, limit))
+
+    def in_flight(self, host):
+        """Returns the number of taken slots of a host."""
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM slots WHERE host = ?',
+            (host, )).fetchone()[0]
+
+    def take_slot(self, host, default):
+        """Takes a slot if the host is below its limit (None otherwise)."""
+
+        with self._transaction() as conn:
+            self._drop_stale_slots(conn, host)
+
+            row = conn.execute('SELECT value FROM limits WHERE host = ?',
+                               (host, )).fetchone()
+            limit = row[0] if row is not None else default
+
+            taken = conn.execute('SELECT COUNT(*) FROM slots WHERE host = ?',
+                                 (host, )).fetchone()[0]
+            if taken >= int(limit):
+                return None
+
+            slot = uuid.uuid4().hex
+            conn.execute('INSERT INTO slots (id, host, pid, acquired) '
+                         'VALUES (?, ?, ?, ?)',
+                         (slot, host, os.getpid(), time.time()))
+
+        return slot
+
+    @staticmethod
+    def _drop_stale_slots(conn, host):
+        """Drops slots of exited processes and expired slots."""
+
+        conn.execute('DELETE FROM slots WHERE host = ? AND acquired < ?',
+                     (host, time.time() - SLOT_LEASE))
+
+        pids = [pid for pid, in conn.execute(
+            'SELECT DISTINCT pid FROM slots WHERE host = ? AND pid != ?',
+            (host, os.getpid()))]
+
+        for pid in pids:
+            if not _process_exists(pid):
+                conn.execute('DELETE FROM slots WHERE host = ? AND pid = ?',
+                             (host, pid))
+
+    def release_slot(self, host, slot=None):
+        """Releases a slot taken by take_slot."""
+
+        with self._transaction() as conn:
+            if slot is None:
+                slot = conn.execute(
+                    'SELECT id FROM slots WHERE host = ? AND pid = ? '
+                    'LIMIT 1', (host, os.getpid())).fetchone()[0]
+            conn.execute('DELETE FROM slots WHERE id = ?', (slot, ))
+
+
+def _is_overloaded(err):
+    """Checks if a request error indicates that the host is overloaded."""
+
+    if isinstance(err, (requests.ConnectionError, requests.Timeout)):
+        return True
+
+    if isinstance(err, requests.HTTPError):
+        status = getattr(err.response, 'status_code', None)
+        return status is not None and (status == 429 or status >= 500)
+
+    return False
+
+
+def _wait_time(poll_interval, deadline):
+    """Returns the time to wait for a slot before checking again."""
+
+    if deadline is None:
+        return poll_interval
+
+    # Wake up regularly to notice cancellation of the deadline.
+    remaining = deadline.remaining()
+    if remaining is None:
+        return POLL_INTERVAL
+
+    return max(0.0, min(remaining, POLL_INTERVAL))
+
+
+def _sleep(seconds, deadline):
+    """Sleeps for the given time, checking the deadline whilst sleeping."""
+
+    if deadline is None:
+        time.sleep(seconds)
+        return
+
+    end = time.time() + seconds
+
+    while True:
+        deadline.check()
+
+        left = end - time.time()
+        if left <= 0:
+            return
+
+        time.sleep(min(left, _wait_time(POLL_INTERVAL, deadline)))
+
+
+def _process_exists(pid):
+    """Checks if a process is running (only supported on POSIX)."""
+
+    if os.name != 'posix':
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+
+    return True
+
+
+def _take_token(tokens, updated, now, rate, burst):
+    """Refills a bucket and takes a token from it.
+
+    Tokens may be reserved ahead of time, in which case the bucket goes
+    negative and the caller needs to wait until the token is refilled.
+
+    Returns:
+        tuple[float,float]: Remaining tokens and time to wait.
+
+    """
+    tokens = min(burst, tokens + (now - updated) * rate) - 1
+    wait = -tokens / rate if tokens < 0 else 0.0
+    return tokens, wait
@@ -0,0 +1,261 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# pylint: disable=import-error
+from .base import BiomartException
+from .cache import _replace
+# pylint: enable=import-error
+
+# Attributes containing the chromosome, start and end of features.
+DEFAULT_COORDINATES = ('chromosome_name', 'start_position', 'end_position')
+
+# Version of the file format, checked when loading an index.
+_FORMAT_VERSION = 1
+
+
+class IntervalIndex(object):
+    """Index of feature coordinates, for looking up overlapping features.
+
+    Features (for example genes) are sorted by their start position per
+    chromosome. Together with the running maximum of their end positions,
+    this allows the overlapping features of many regions to be found using
+    vectorized binary searches, without querying the server for each
+    region. Coordinates are 1-based and inclusive (like those of biomart),
+    so a region overlaps a feature if it starts before the end of the
+    feature and ends after its start.
+
+    Indices are typically built using Dataset.build_interval_index, which
+    fetches the coordinates of all features once. Indices can be saved to a
+    file and loaded again for later use.
+
+    Args:
+        features (pd.DataFrame): Features, with attribute names as columns.
+        attributes (list[str]): Attributes of the features that are
+            returned when annotating regions.
+        coordinates (tuple[str]): Names of the attributes containing the
+            chromosome, start and end of the features.
+
+    Examples:
+        Annotating regions with the genes they overlap:
+            >>> index = dataset.build_interval_index(
+            >>>     attributes=['ensembl_gene_id', 'external_gene_name'],
+            >>>     path='genes.idx')
+            >>> index.annotate(regions, chrom_column='chrom',
+            >>>                start_column='start', end_column='end')
+
+    """
+
+    def __init__(self, features, attributes,
+                 coordinates=DEFAULT_COORDINATES):
+        chrom, start, end = coordinates
+
+        # Features without coordinates cannot overlap any region.
+        features = features.dropna(subset=[chrom, start, end])
+        features = features.assign(**{chrom: features[chrom].astype(str)})
+        features = features.sort_values(
+            [chrom, start], kind='mergesort').reset_index(drop=True)
+
+        self._features = features
+        self._attributes = list(attributes)
+        self._coordinates = tuple(coordinates)
+
+        starts = features[start].values.astype(np.int64)
+        ends = features[end].values.astype(np.int64)
+
+        # Features of a chromosome are contiguous after sorting.
+        self._chromosomes = {}
+        for name, rows in features.groupby(chrom, sort=False).indices.items():
+            first, last = rows[0], rows[-1] + 1
+            self._chromosomes[name] = (
+                first, starts[first:last], ends[first:last],
+                np.maximum.accumulate(ends[first:last]))
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index that was saved using save.
+
+        Args:
+            path (str): Path of the index file.
+
+        Returns:
+            IntervalIndex: Loaded index.
+
+        """
+        with open(path, 'rb') as file_:
+            state = pickle.load(file_)
+
+        if state.get('version') != _FORMAT_VERSION:
+            raise BiomartException(
+                'Unsupported interval index version in {!r}'.format(path))
+
+        return cls(state['features'], state['attributes'],
+                   coordinates=state['coordinates'])
+
+    def save(self, path):
+        """Saves the index to a file (atomically).
+
+        Args:
+            path (str): Path of the index file.
+
+        """
+        state = {
+            'version': _FORMAT_VERSION,
+            'features': self._features,
+            'attributes': self._attributes,
+            'coordinates': self._coordinates
+        }
+
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.' + os.path.basename(path), suffix='.tmp',
+            dir=os.path.dirname(os.path.abspath(path)))
+
+        try:
+            with os.fdopen(fd, 'wb') as file_:
+                pickle.dump(state, file_, protocol=pickle.HIGHEST_PROTOCOL)
+            _replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @property
+    def features(self):
+        """Indexed features, sorted by chromosome and start position."""
+        return self._features
+
+    @property
+    def attributes(self):
+        """Attributes returned when annotating regions."""
+        return self._attributes
+
+    @property
+    def coordinates(self):
+        """Attributes containing the chromosome, start and end."""
+        return self._coordinates
+
+    @property
+    def chromosomes(self):
+        """Names of the chromosomes containing features."""
+        return sorted(self._chromosomes)
+
+    def overlaps(self, chromosomes, starts, ends):
+        """Finds the features overlapping each of the given regions.
+
+        Args:
+            chromosomes (array-like): Chromosome of each region.
+            starts (array-like): Start position of each region.
+            ends (array-like): End position of each region.
+
+        Returns:
+            tuple(np.ndarray, np.ndarray): Positions of the regions and
+                of the overlapping features (in features), sorted by region.
+                Regions overlapping multiple features are repeated.
+
+        """
+        chromosomes = np.asarray(chromosomes).astype(str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        groups = pd.Series(np.arange(len(chromosomes))).groupby(
+            chromosomes, sort=False).indices
+
+        region_parts, feature_parts = [], []
+
+        for name, regions in groups.items():
+            if name not in self._chromosomes:
+                continue
+
+            offset, feat_starts, feat_ends, max_ends = \
+                self._chromosomes[name]
+            reg_starts, reg_ends = starts[regions], ends[regions]
+
+            # Candidates lie between the first feature that may still end
+            # after the region start and the last feature starting before
+            # the region end.
+            lower = np.searchsorted(max_ends, reg_starts, side='left')
+            upper = np.searchsorted(feat_starts, reg_ends, side='right')
+            counts = np.maximum(upper - lower, 0)
+
+            total = counts.sum()
+            if total == 0:
+                continue
+
+            # Expand the candidate ranges into (region, feature) pairs.
+            repeat = np.repeat(np.arange(len(regions)), counts)
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+            candidates = lower[repeat] + within
+
+            keep = feat_ends[candidates] >= reg_starts[repeat]
+            region_parts.append(regions[repeat[keep]])
+            feature_parts.append(candidates[keep] + offset)
+
+        if not region_parts:
+            return (np.array([], dtype=np.int64),
+                    np.array([], dtype=np.int64))
+
+        regions = np.concatenate(region_parts)
+        features = np.concatenate(feature_parts)
+
+        order = np.lexsort((features, regions))
+        return regions[order], features[order]
+
+    def annotate(self, frame, chrom_column, start_column, end_column,
+                 how='left'):
+        """Annotates regions with attributes of the overlapping features.
+
+        Args:
+            frame (pd.DataFrame): Frame containing the regions.
+            chrom_column (str): Column containing the chromosome names,
+                which should match the chromosome names of the dataset.
+            start_column (str): Column containing the start positions.
+            end_column (str): Column containing the end positions.
+            how (str): Whether to keep regions without overlapping
+                features (with missing annotations, 'left') or to drop
+                them ('inner').
+
+        Returns:
+            pd.DataFrame: Annotated frame, with a column (named after the
+                attribute) for each of the attributes. Regions overlapping
+                multiple features result in multiple rows.
+
+        """
+        if how not in {'left', 'inner'}:
+            raise ValueError('Unknown value for how: {!r}'.format(how))
+
+        regions, features = self.overlaps(
+            frame[chrom_column], frame[start_column], frame[end_column])
+
+        if how == 'left':
+            # Keep regions without features, annotated using missing values.
+            missing = np.setdiff1d(np.arange(len(frame)), regions)
+            regions = np.concatenate([regions, missing])
+            features = np.concatenate(
+                [features, np.full(len(missing), -1, dtype=np.int64)])
+
+            order = np.argsort(regions, kind='mergesort')
+            regions, features = regions[order], features[order]
+
+        result = frame.iloc[regions].reset_index(drop=True)
+
+        annotations = self._features[self._attributes].reindex(features)
+        for attr in self._attributes:
+            result[attr] = annotations[attr].values
+
+        return result
+
+    def __len__(self):
+        return len(self._features)
+
+    def __repr__(self):
+        return ('<biomart.IntervalIndex features={!r}, chromosomes={!r}>'
+                .format(len(self), len(self._chromosomes)))
@@ -0,0 +1,428 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+# pylint: disable=import-error
+from . import backends, planning, tracing
+from .base import (BiomartException, Deadline, DeadlineExceeded,
+                   current_deadline, deadline_scope)
+from .cache import _makedirs, _replace
+# pylint: enable=import-error
+
+MANIFEST_NAME = 'manifest.sqlite'
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parts (
+    id INTEGER PRIMARY KEY,
+    filters TEXT NOT NULL,
+    state TEXT NOT NULL,
+    path TEXT,
+    rows INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    token TEXT,
+    updated REAL
+);
+"""
+
+
+class QueryJob(object):
+    """Resumable query, split into sub-queries tracked in a manifest.
+
+    The query is planned once (into chunks or shards, see Dataset.query),
+    after which the state of each sub-query is recorded in a SQLite
+    manifest in the job directory. Sub-queries are claimed from the
+    manifest by parallel workers and the response of each finished
+    sub-query is stored as a TSV file next to the manifest. If the job is
+    interrupted (by a crash, preemption or an expired deadline), running
+    it again only fetches the sub-queries that did not finish.
+
+    Reopening a job directory does not plan the query again, which keeps
+    the sub-queries identical between runs. The query of an existing job
+    must match the given query, otherwise an exception is raised.
+
+    Jobs are normally created using Dataset.query_job. A job should be
+    run by a single process at a time, running it with multiple workers
+    (threads) is controlled using n_jobs.
+
+    Args:
+        dataset (Dataset): Dataset that is queried.
+        directory (str): Directory containing the manifest and results.
+        attributes (list[str]): Names of attributes to fetch.
+        filters (dict[str,any]): Filters of the full query.
+        only_unique (bool): Whether to return only unique rows.
+        chunk_size (int or str): Number of filter values per sub-query
+            (or 'auto'), see Dataset.query.
+        shard_by (str): If 'region', the query is sharded by genomic
+            region, see Dataset.query.
+        n_jobs (int): Number of sub-queries to run in parallel.
+
+    Examples:
+        Exporting all genes, resuming any previous (interrupted) run:
+            >>> job = dataset.query_job(
+            >>>     'genes_export', attributes=['ensembl_gene_id'],
+            >>>     shard_by='region')
+            >>> job.run()
+            >>> result = job.result()
+
+    """
+
+    def __init__(self,
+                 dataset,
+                 directory,
+                 attributes=None,
+                 filters=None,
+                 only_unique=True,
+                 chunk_size=None,
+                 shard_by=None,
+                 n_jobs=planning.DEFAULT_MAX_JOBS):
+        if shard_by not in {None, 'region'}:
+            raise ValueError('Invalid value for shard_by ({})'
+                             .format(shard_by))
+
+        if chunk_size is not None and shard_by is not None:
+            raise ValueError('Queries cannot be both chunked and sharded')
+
+        if attributes is None:
+            attributes = list(dataset.default_attributes.keys())
+
+        self._dataset = dataset
+        self._directory = directory
+        self._attributes = list(attributes)
+        self._filters = filters or {}
+        self._only_unique = only_unique
+        self._shard_by = shard_by
+        self._n_jobs = n_jobs
+
+        # Check attributes/filters before creating the manifest.
+        dataset._build_query(  # pylint: disable=protected-access
+            self._attributes, self._filters, only_unique)
+
+        _makedirs(directory)
+
+        with self._transaction() as conn:
+            conn.executescript(_SCHEMA)
+
+        self._open(chunk_size, shard_by)
+
+    @property
+    def directory(self):
+        """Directory containing the manifest and results."""
+        return self._directory
+
+    @property
+    def manifest(self):
+        """Path of the manifest."""
+        return os.path.join(self._directory, MANIFEST_NAME)
+
+    @property
+    def attributes(self):
+        """Names of the queried attributes."""
+        return self._attributes
+
+    @property
+    def done(self):
+        """Whether all sub-queries have finished."""
+        return self.status().get(DONE, 0) == len(self)
+
+    def _open(self, chunk_size, shard_by):
+        """Reads the query of an existing job, or plans a new job."""
+
+        query = _normalize({
+            'dataset': self._dataset.name,
+            'attributes': self._attributes,
+            'filters': self._filters,
+            'only_unique': self._only_unique,
+            'chunk_size': chunk_size,
+            'shard_by': shard_by
+        })
+
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM job WHERE key = 'query'").fetchone()
+
+        if row is not None:
+            if json.loads(row[0]) != query:
+                raise BiomartException(
+                    'Job directory {} contains a different query'
+                    .format(self._directory))
+            return
+
+        # Plan the query (which may require count queries).
+        with tracing.span('plan'):
+            if shard_by == 'region':
+                plan = planning.plan_regions(
+                    self._dataset, self._filters, n_jobs=self._n_jobs)
+            elif chunk_size is not None:
+                plan = planning.plan_chunks(
+                    self._dataset, self._filters, chunk_size=chunk_size,
+                    n_jobs=self._n_jobs)
+            else:
+                # pylint: disable=protected-access
+                root = self._dataset._build_query(
+                    self._attributes, self._filters, self._only_unique)
+                plan = planning.plan_size(
+                    self._filters, self._dataset._query_size(root),
+                    self._dataset._max_query_size, n_jobs=self._n_jobs)
+                # pylint: enable=protected-access
+
+            # pylint: disable=protected-access
+            plan = self._dataset._fit_plan(
+                plan, self._attributes, self._only_unique,
+                n_jobs=self._n_jobs)
+            # pylint: enable=protected-access
+
+        # Store the query and its plan in a single transaction, so that
+        # an interrupted planning results in an empty manifest.
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO parts (id, filters, state) VALUES (?, ?, ?)',
+                ((i, json.dumps(_normalize(filters)), PENDING)
+                 for i, filters in enumerate(plan.filters)))
+            conn.execute("INSERT INTO job (key, value) VALUES ('query', ?)",
+                         (json.dumps(query), ))
+
+    def run(self, n_jobs=None, deadline=None):
+        """Runs the sub-queries that have not finished yet.
+
+        Sub-queries that were running when a previous run was interrupted,
+        or that failed in a previous run, are run again.
+
+        Args:
+            n_jobs (int): Number of sub-queries to run in parallel.
+                Defaults to the value given when creating the job.
+            deadline (float): Maximum number of seconds the run may take.
+                Sub-queries that do not finish before the deadline remain
+                pending and are run by the next run.
+
+        Raises:
+            BiomartException: If any of the sub-queries failed.
+
+        """
+        self._reset()
+
+        n_jobs = n_jobs or self._n_jobs
+
+        if deadline is not None:
+            deadline = Deadline(deadline, parent=current_deadline())
+        else:
+            deadline = current_deadline()
+
+        with deadline_scope(deadline), \
+                tracing.span('query_job', directory=self._directory):
+            planning.map_parallel(self._work, range(n_jobs), n_jobs=n_jobs)
+
+        failed = self.errors()
+        if failed:
+            raise BiomartException(
+                '{} of {} sub-queries failed (run the job again to retry '
+                'them): {}'.format(len(failed), len(self),
+                                   next(iter(failed.values()))))
+
+    def _reset(self):
+        """Returns interrupted and failed sub-queries to the queue."""
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE parts SET state = ?, token = NULL '
+                'WHERE state IN (?, ?)', (PENDING, RUNNING, FAILED))
+
+    def _work(self, _):
+        """Worker claiming and running sub-queries until none are left."""
+
+        while True:
+            deadline = current_deadline()
+            if deadline is not None:
+                deadline.check()
+
+            part = self._claim()
+            if part is None:
+                return
+
+            part_id, filters = part
+
+            try:
+                with tracing.span('sub_query', part=part_id, filters=filters):
+                    path, rows = self._fetch(part_id, filters)
+            except DeadlineExceeded:
+                self._update(part_id, PENDING)
+                raise
+            except Exception as err:  # pylint: disable=broad-except
+                self._update(part_id, FAILED, error=str(err))
+            else:
+                self._update(part_id, DONE, path=path, rows=rows)
+
+    def _claim(self):
+        """Claims the next pending sub-query (atomically)."""
+
+        token = uuid.uuid4().hex
+
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE parts SET state = ?, token = ?, '
+                'attempts = attempts + 1, updated = ? WHERE id = ('
+                'SELECT id FROM parts WHERE state = ? ORDER BY id LIMIT 1)',
+                (RUNNING, token, time.time(), PENDING))
+
+            if cursor.rowcount == 0:
+                return None
+
+            part_id, filters = conn.execute(
+                'SELECT id, filters FROM parts WHERE token = ?',
+                (token, )).fetchone()
+
+        return part_id, json.loads(filters)
+
+    def _fetch(self, part_id, filters):
+        """Fetches a sub-query, storing its response in a TSV file."""
+
+        # pylint: disable=protected-access
+        root = self._dataset._build_query(self._attributes, filters,
+                                          self._only_unique)
+        response = self._dataset._submit(root)
+        # pylint: enable=protected-access
+
+        content = response.content
+        if b'Query ERROR' in content:
+            raise BiomartException(response.text)
+
+        # Write atomically, so that a stored part is always complete.
+        name = 'part-{:05d}.tsv'.format(part_id)
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.' + name, suffix='.tmp', dir=self._directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as file_:
+                file_.write(content)
+            _replace(tmp_path, os.path.join(self._directory, name))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        # Rows excluding the header line.
+        rows = max(content.count(b'\n') - 1, 0)
+
+        return name, rows
+
+    def _update(self, part_id, state, path=None, rows=None, error=None):
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE parts SET state = ?, path = ?, rows = ?, error = ?, '
+                'token = NULL, updated = ? WHERE id = ?',
+                (state, path, rows, error, time.time(), part_id))
+
+    def status(self):
+        """Returns the number of sub-queries in each state.
+
+        Returns:
+            dict[str,int]: Number of sub-queries per state ('pending',
+                'running', 'done' or 'failed').
+
+        """
+        with self._transaction() as conn:
+            return dict(conn.execute(
+                'SELECT state, COUNT(*) FROM parts GROUP BY state'))
+
+    def errors(self):
+        """Returns the errors of failed sub-queries.
+
+        Returns:
+            dict[int,str]: Error message of each failed sub-query.
+
+        """
+        with self._transaction() as conn:
+            return dict(conn.execute(
+                'SELECT id, error FROM parts WHERE state = ? ORDER BY id',
+                (FAILED, )))
+
+    def result(self, use_attr_names=False, dtypes=None, backend='pandas'):
+        """Combines the results of the finished job.
+
+        Args:
+            use_attr_names (bool): Whether to use the attribute names
+                as column names in the result (True) or the attribute
+                display names (False).
+            dtypes (dict[str,any]): Dictionary of attributes --> data types
+                to describe to pandas how the columns should be handled.
+            backend (str): Type of the returned result (see Dataset.query).
+
+        Returns:
+            pandas.DataFrame: DataFrame containing the query results (or
+                a result of the given backend).
+
+        """
+        backends.check_backend(backend)
+
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT state, path FROM parts ORDER BY id').fetchall()
+
+        if any(state != DONE for state, _ in rows):
+            raise BiomartException('Job {} has not finished, run the job '
+                                   'first'.format(self._directory))
+
+        # Parts without any rows are stored as empty files (without header).
+        # pylint: disable=protected-access
+        names = self._dataset._display_names(self._attributes)
+        # pylint: enable=protected-access
+
+        with tracing.span('combine', parts=len(rows)):
+            results = [
+                backends.read_tsv_file(
+                    os.path.join(self._directory, path),
+                    backend=backend,
+                    dtypes=dtypes,
+                    names=names) for _, path in rows
+            ]
+
+            result = backends.concat(results, backend=backend)
+
+            if self._only_unique or self._shard_by is not None:
+                # Rows may be returned by multiple sub-queries.
+                result = backends.drop_duplicates(result, backend=backend)
+
+        # pylint: disable=protected-access
+        return self._dataset._finalize(result, self._attributes,
+                                       use_attr_names, backend=backend)
+
+    @contextmanager
+    def _transaction(self):
+        """Connects to the manifest, committing any changes on exit."""
+
+        conn = sqlite3.connect(self.manifest, timeout=60)
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __len__(self):
+        with self._transaction() as conn:
+            return conn.execute('SELECT COUNT(*) FROM parts').fetchone()[0]
+
+    def __repr__(self):
+        return '<biomart.QueryJob directory={!r}>'.format(self._directory)
+
+
+def _normalize(value):
+    """Normalizes a value into its json representation (lists for tuples)."""
+    return json.loads(json.dumps(value, sort_keys=True))
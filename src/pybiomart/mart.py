@@ -9,8 +9,9 @@ from io import StringIO
 import pandas as pd
 
 # pylint: disable=import-error
-from .base import ServerBase, DEFAULT_SCHEMA
+from .base import ServerBase, DEFAULT_SCHEMA, DEFAULT_TIMEOUT
 from .dataset import Dataset
+from . import tracing
 # pylint: enable=import-error
 
 
@@ -26,11 +27,19 @@ class Mart(ServerBase):
         name (str): Name of the mart.
         database_name (str): ID of the mart on the host.
         display_name (str): Display name of the mart.
-        host (str): Url of host to connect to.
+        host (str or list[str]): Url of host to connect to, or a list of
+            urls of equivalent mirrors (see ServerBase).
         path (str): Path on the host to access to the biomart service.
         port (int): Port to use for the connection.
         use_cache (bool): Whether to cache requests.
         virtual_schema (str): The virtual schema of the dataset.
+        governor (Governor): Governor limiting the rate of requests.
+        timeout (tuple[float,float]): Connect and read timeouts (seconds).
+        use_post (bool): Whether to submit queries using post requests.
+        metadata_ttl (float): Number of seconds after which metadata is
+            refreshed in the background (see ServerBase).
+        transport (Transport): Transport used to send requests (see
+            ServerBase).
 
     Examples:
 
@@ -49,9 +58,13 @@ class Mart(ServerBase):
 
     def __init__(self, name, database_name, display_name,
                  host=None, path=None, port=None, use_cache=True,
-                 virtual_schema=DEFAULT_SCHEMA, extra_params=None):
-        super().__init__(host=host, path=path,
-                         port=port, use_cache=use_cache)
+                 virtual_schema=DEFAULT_SCHEMA, extra_params=None,
+                 governor=None, timeout=DEFAULT_TIMEOUT, use_post=True,
+                 metadata_ttl=None, transport=None):
+        super().__init__(host=host, path=path, port=port,
+                         use_cache=use_cache, governor=governor,
+                         timeout=timeout, use_post=use_post,
+                         metadata_ttl=metadata_ttl, transport=transport)
 
         self._name = name
         self._database_name = database_name
@@ -83,9 +96,7 @@ class Mart(ServerBase):
     @property
     def datasets(self):
         """List of datasets in this mart."""
-        if self._datasets is None:
-            self._datasets = self._fetch_datasets()
-        return self._datasets
+        return self._metadata('_datasets', self._fetch_datasets)
 
     def list_datasets(self):
         """Lists available datasets in a readable DataFrame format.
@@ -102,24 +113,25 @@ class Mart(ServerBase):
             columns=['name', 'display_name'])
 
     def _fetch_datasets(self):
-        # Get datasets using biomart.
-        response = self.get(type='datasets', mart=self._name)
+        with tracing.span('fetch_datasets', mart=self._name):
+            # Get datasets using biomart.
+            response = self.get(type='datasets', mart=self._name)
 
-        # Read result frame from response.
-        result = pd.read_csv(StringIO(response.text), sep='\t',
-                             header=None, names=self.RESULT_COLNAMES)
+            # Read result frame from response.
+            result = pd.read_csv(StringIO(response.text), sep='\t',
+                                 header=None, names=self.RESULT_COLNAMES)
 
-        # Convert result to a dict of datasets.
-        datasets = (self._dataset_from_row(row)
-                    for _, row in result.iterrows())
+            # Convert result to a dict of datasets.
+            datasets = (self._dataset_from_row(row)
+                        for _, row in result.iterrows())
 
-        return {d.name: d for d in datasets}
+            return {d.name: d for d in datasets}
 
     def _dataset_from_row(self, row):
         return Dataset(name=row['name'], display_name=row['display_name'],
-                       host=self.host, path=self.path,
-                       port=self.port, use_cache=self.use_cache,
-                       virtual_schema=row['virtual_schema'])
+                       host=self.hosts, path=self.path, port=self.port,
+                       virtual_schema=row['virtual_schema'],
+                       **self._client_params())
 
     def __repr__(self):
         return (('<biomart.Mart name={!r}, display_name={!r},'
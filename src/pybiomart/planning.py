@@ -0,0 +1,495 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import math
+
+from .base import (BiomartException, Deadline, DeadlineExceeded,
+                   current_deadline, deadline_scope)
+
+DEFAULT_CHUNK_ROWS = 50000
+DEFAULT_MAX_JOBS = 4
+DEFAULT_REGION_RESOLUTION = 1000000
+
+# Maximum size (in bytes) of query xml submitted using get/post requests.
+MAX_GET_QUERY_SIZE = 2000
+MAX_POST_QUERY_SIZE = 500000
+
+
+class QueryPlan(object):
+    """Plan describing how a query is split into sub-queries.
+
+    Attributes:
+        filters (list[dict[str,any]]): Filters of each of the sub-queries.
+        n_jobs (int): Number of sub-queries to run in parallel.
+        estimated_rows (int): Estimated number of rows returned by the
+            query, or None if no estimate is available.
+
+    """
+
+    def __init__(self, filters, n_jobs=1, estimated_rows=None):
+        self._filters = list(filters)
+        self._n_jobs = max(1, min(n_jobs, len(self._filters)))
+        self._estimated_rows = estimated_rows
+
+    @property
+    def filters(self):
+        """Filters of each of the sub-queries."""
+        return self._filters
+
+    @property
+    def n_jobs(self):
+        """Number of sub-queries to run in parallel."""
+        return self._n_jobs
+
+    @property
+    def estimated_rows(self):
+        """Estimated number of rows returned by the query."""
+        return self._estimated_rows
+
+    def __len__(self):
+        return len(self._filters)
+
+    def __repr__(self):
+        return ('<biomart.QueryPlan n_queries={!r}, n_jobs={!r}, '
+                'estimated_rows={!r}>'.format(
+                    len(self._filters), self._n_jobs, self._estimated_rows))
+
+
+def plan_chunks(dataset,
+                filters,
+                chunk_size='auto',
+                n_jobs=DEFAULT_MAX_JOBS,
+                chunk_name=None,
+                chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Plans a query by splitting the values of a list filter into chunks.
+
+    If chunk_size is 'auto', the number of rows returned by the full query
+    is first estimated using a count query. The chunk size is then chosen
+    so that each sub-query returns approximately chunk_rows rows, and the
+    number of parallel jobs is limited to the number of chunks.
+
+    Args:
+        dataset (Dataset): Dataset that is queried.
+        filters (dict[str,any]): Filters of the full query.
+        chunk_size (int or str): Number of filter values per sub-query,
+            or 'auto' to choose the chunk size from the estimated row count.
+        n_jobs (int): Maximum number of sub-queries to run in parallel.
+        chunk_name (str): Name of the filter whose values are split.
+            Defaults to the list filter with the most values.
+        chunk_rows (int): Targeted number of rows per sub-query, used
+            if chunk_size is 'auto'.
+
+    Returns:
+        QueryPlan: Plan describing the sub-queries.
+
+    """
+    filters = filters or {}
+
+    if chunk_name is None:
+        chunk_name = _largest_list_filter(filters)
+
+    n_values = len(filters[chunk_name]) if chunk_name is not None else 0
+
+    if n_values == 0:
+        # Nothing to split, run as a single query.
+        return QueryPlan([filters], n_jobs=1)
+
+    estimated_rows = None
+
+    if chunk_size == 'auto':
+        estimated_rows = dataset.count(filters=filters)
+        rows_per_value = estimated_rows / n_values
+        chunk_size = max(1, int(chunk_rows / max(rows_per_value, 1e-6)))
+    elif chunk_size < 1:
+        raise ValueError('Chunk size should be positive ({})'
+                         .format(chunk_size))
+
+    return QueryPlan(
+        split_filter(filters, chunk_name, chunk_size),
+        n_jobs=n_jobs,
+        estimated_rows=estimated_rows)
+
+
+def plan_size(filters, query_size, max_size, n_jobs=DEFAULT_MAX_JOBS,
+              chunk_name=None):
+    """Plans a query by splitting a list filter to limit the query size.
+
+    The values of the filter are split into chunks, such that the query
+    xml of each sub-query is (approximately) at most max_size bytes.
+
+    Args:
+        filters (dict[str,any]): Filters of the full query.
+        query_size (int): Size (in bytes) of the full query xml.
+        max_size (int): Maximum size of the query xml of sub-queries.
+        n_jobs (int): Maximum number of sub-queries to run in parallel.
+        chunk_name (str): Name of the filter whose values are split.
+            Defaults to the list filter with the most values.
+
+    Returns:
+        QueryPlan: Plan describing the sub-queries.
+
+    """
+    filters = filters or {}
+
+    if chunk_name is None:
+        chunk_name = _largest_list_filter(filters)
+
+    if query_size <= max_size or chunk_name is None:
+        return QueryPlan([filters], n_jobs=1)
+
+    # Values are joined by commas in the query xml.
+    values = list(filters[chunk_name])
+    sizes = [len(str(value).encode('utf-8')) + 1 for value in values]
+    budget = max(max_size - (query_size - sum(sizes)), 1)
+
+    chunks, chunk, chunk_bytes = [], [], 0
+    for value, size in zip(values, sizes):
+        if chunk and chunk_bytes + size > budget:
+            chunks.append(dict(filters, **{chunk_name: chunk}))
+            chunk, chunk_bytes = [], 0
+        chunk.append(value)
+        chunk_bytes += size
+
+    if chunk:
+        chunks.append(dict(filters, **{chunk_name: chunk}))
+
+    return QueryPlan(chunks, n_jobs=n_jobs)
+
+
+def fit_size(plan, query_size, max_size, n_jobs=DEFAULT_MAX_JOBS):
+    """Splits the sub-queries of a plan that exceed the maximum query size.
+
+    Sub-queries whose query size is larger than max_size are split further
+    on their largest list filter (see plan_size), until all sub-queries fit
+    or cannot be split any further.
+
+    Args:
+        plan (QueryPlan): Plan whose sub-queries are checked.
+        query_size (callable): Function returning the size (in bytes) of
+            the query for the filters of a sub-query.
+        max_size (int): Maximum size of the query of sub-queries.
+        n_jobs (int): Maximum number of sub-queries to run in parallel.
+
+    Returns:
+        QueryPlan: Plan whose sub-queries fit within the size limit.
+
+    """
+    filters = []
+    for sub_filters in plan.filters:
+        filters.extend(_fit_filters(sub_filters, query_size, max_size))
+
+    if len(filters) == len(plan):
+        return plan
+
+    return QueryPlan(filters, n_jobs=n_jobs,
+                     estimated_rows=plan.estimated_rows)
+
+
+def _fit_filters(filters, query_size, max_size):
+    size = query_size(filters)
+    name = _largest_list_filter(filters)
+
+    if size <= max_size or name is None or len(filters[name]) < 2:
+        return [filters]
+
+    # Sizes are estimated from the filter values, which may underestimate
+    # the size of encoded queries, so chunks are checked again.
+    chunks = plan_size(filters, size, max_size, chunk_name=name).filters
+    if len(chunks) == 1:
+        n_values = len(filters[name])
+        chunks = split_filter(filters, name, (n_values + 1) // 2)
+
+    fitted = []
+    for chunk in chunks:
+        fitted.extend(_fit_filters(chunk, query_size, max_size))
+
+    return fitted
+
+
+def split_filter(filters, name, chunk_size):
+    """Splits the values of a list filter into chunks.
+
+    Args:
+        filters (dict[str,any]): Filters to split.
+        name (str): Name of the filter whose values are split.
+        chunk_size (int): Maximum number of values per chunk.
+
+    Returns:
+        list[dict[str,any]]: Filters for each of the chunks.
+
+    """
+    values = list(filters[name])
+
+    chunks = []
+    for start in range(0, len(values), chunk_size):
+        chunk = dict(filters)
+        chunk[name] = values[start:start + chunk_size]
+        chunks.append(chunk)
+
+    return chunks
+
+
+def _largest_list_filter(filters):
+    list_filters = [(len(value), name) for name, value in filters.items()
+                    if isinstance(value, (list, tuple))]
+    return max(list_filters)[1] if list_filters else None
+
+
+def plan_regions(dataset,
+                 filters,
+                 n_jobs=DEFAULT_MAX_JOBS,
+                 shard_rows=DEFAULT_CHUNK_ROWS,
+                 resolution=DEFAULT_REGION_RESOLUTION):
+    """Plans a query by sharding it into genomic regions.
+
+    The number of entries of the chromosomes is first determined using
+    count queries on groups of chromosomes. Starting from a single group
+    containing all chromosomes, groups with more than shard_rows entries
+    are recursively split in halves, whilst groups without entries are
+    dropped. Adjacent groups with few entries are combined into shards of
+    at most shard_rows entries, using the chromosome_name filter. Single
+    chromosomes with more entries are split into windows using the start
+    and end filters. As the extent of a chromosome is not part of the
+    dataset configuration, it is determined by searching for the largest
+    start position that still overlaps any entries (up to the given
+    resolution).
+
+    Planning therefore costs a single count query if the query returns at
+    most shard_rows entries. Otherwise, it costs about two count queries
+    per level of splitting for each large chromosome (i.e. logarithmic in
+    the number of chromosomes, which matters for datasets listing many
+    scaffolds), plus one count query per step of the search for the
+    extent of each large chromosome (unless the end filter is given).
+
+    Windows are split on the start/end filters, which select entries
+    overlapping the window. Entries crossing a window boundary are
+    therefore returned by both adjacent shards and should be deduplicated
+    when combining the results.
+
+    Args:
+        dataset (Dataset): Dataset that is queried.
+        filters (dict[str,any]): Filters of the full query. If the
+            chromosome_name filter is not given, all chromosomes listed
+            in the dataset configuration are used.
+        n_jobs (int): Maximum number of sub-queries to run in parallel.
+        shard_rows (int): Targeted number of entries per shard.
+        resolution (int): Resolution (in bp) used when determining the
+            extent of a chromosome.
+
+    Returns:
+        QueryPlan: Plan describing the sub-queries.
+
+    """
+    filters = dict(filters or {})
+
+    chromosomes = filters.pop('chromosome_name', None)
+    if chromosomes is None:
+        try:
+            chromosomes = dataset.filters['chromosome_name'].options
+        except KeyError:
+            raise BiomartException(
+                'Dataset {} has no chromosome_name filter, which is '
+                'required for sharding by region.'.format(dataset.name))
+    elif not isinstance(chromosomes, (list, tuple)):
+        chromosomes = [chromosomes]
+
+    chromosomes = list(chromosomes)
+    if not chromosomes:
+        raise BiomartException('No chromosomes available for sharding '
+                               'dataset {} by region.'.format(dataset.name))
+
+    # Restrict windows to the requested region (if any).
+    start = int(filters.pop('start', 1))
+    end = filters.pop('end', None)
+    end = int(end) if end is not None else None
+
+    region = {'start': start} if start > 1 else {}
+    if end is not None:
+        region['end'] = end
+
+    def _count(chroms):
+        return dataset.count(
+            filters=dict(filters, chromosome_name=list(chroms), **region))
+
+    total = _count(chromosomes)
+
+    if total == 0:
+        # No matching entries, run a single query for the region.
+        return QueryPlan([dict(filters, chromosome_name=chromosomes,
+                               **region)], n_jobs=n_jobs, estimated_rows=0)
+
+    groups = _count_groups(chromosomes, total, _count, shard_rows, n_jobs)
+
+    shards = []
+    group, group_rows = [], 0
+
+    for chroms, count in groups:
+        if count > shard_rows:
+            # Split large chromosomes into windows.
+            chrom = chroms[0]
+
+            stop = end
+            if stop is None:
+                stop = _region_extent(dataset, dict(filters,
+                                                    chromosome_name=chrom),
+                                      start, resolution)
+
+            n_windows = int(math.ceil(count / shard_rows))
+            for win_start, win_end in _windows(start, stop, n_windows):
+                shards.append(dict(filters, chromosome_name=chrom,
+                                   start=win_start, end=win_end))
+        else:
+            # Group smaller chromosomes together.
+            if group and group_rows + count > shard_rows:
+                shards.append(dict(filters, chromosome_name=group, **region))
+                group, group_rows = [], 0
+
+            group.extend(chroms)
+            group_rows += count
+
+    if group:
+        shards.append(dict(filters, chromosome_name=group, **region))
+
+    return QueryPlan(shards, n_jobs=n_jobs, estimated_rows=total)
+
+
+def _count_groups(chromosomes, total, count, shard_rows, n_jobs):
+    """Splits chromosomes into groups of at most shard_rows entries.
+
+    Groups are split in halves until they contain at most shard_rows
+    entries or a single chromosome. Groups without entries are dropped.
+    Returns (chromosomes, count) tuples in the order of the chromosomes.
+    """
+
+    groups = []
+    pending = [(chromosomes, total)]
+
+    while pending:
+        halves = []
+        for chroms, rows in pending:
+            if rows == 0:
+                continue
+
+            if rows <= shard_rows or len(chroms) == 1:
+                groups.append((chroms, rows))
+            else:
+                middle = len(chroms) // 2
+                halves.extend([chroms[:middle], chroms[middle:]])
+
+        # Count all halves of this level in parallel.
+        pending = list(zip(halves, map_parallel(count, halves,
+                                                n_jobs=n_jobs)))
+
+    order = {chrom: i for i, chrom in enumerate(chromosomes)}
+    return sorted(groups, key=lambda group: order[group[0][0]])
+
+
+def _region_extent(dataset, filters, start, resolution):
+    """Determines the position beyond which no entries are found."""
+
+    def _has_entries(position):
+        return dataset.count(filters=dict(filters, start=position)) > 0
+
+    # Exponential search for an upper bound, followed by a binary search.
+    lower, upper = start, start + resolution
+    while _has_entries(upper):
+        lower, upper = upper, start + 2 * (upper - start)
+
+    while upper - lower > resolution:
+        middle = (lower + upper) // 2
+        if _has_entries(middle):
+            lower = middle
+        else:
+            upper = middle
+
+    return upper
+
+
+def _windows(start, stop, n_windows):
+    """Splits the region [start, stop] into n_windows windows."""
+
+    size = int(math.ceil((stop - start + 1) / n_windows))
+
+    windows = []
+    for win_start in range(start, stop + 1, size):
+        windows.append((win_start, min(win_start + size - 1, stop)))
+
+    return windows
+
+
+def run_plan(plan, func):
+    """Runs func for the filters of each sub-query in the plan.
+
+    Sub-queries are run in parallel threads if the plan specifies more
+    than one job. See map_parallel for the handling of deadlines.
+
+    Args:
+        plan (QueryPlan): Plan to execute.
+        func (callable): Function called with the filters of a sub-query.
+
+    Returns:
+        list: Results of each of the sub-queries, in order of the plan.
+
+    """
+    return map_parallel(func, plan.filters, n_jobs=plan.n_jobs)
+
+
+def map_parallel(func, items, n_jobs=DEFAULT_MAX_JOBS):
+    """Applies func to items using (at most) n_jobs threads.
+
+    The deadline of the calling thread is propagated to the worker
+    threads, so that all requests made by func are limited by the same
+    deadline. If the deadline passes or one of the calls fails, calls
+    that have not started yet are cancelled and running calls are
+    signalled to stop before sending any further requests.
+
+    Args:
+        func (callable): Function to apply.
+        items (list): Items to apply the function to.
+        n_jobs (int): Maximum number of threads to use.
+
+    Returns:
+        list: Results of func for each of the items, in order.
+
+    """
+    items = list(items)
+    n_jobs = max(1, min(n_jobs, len(items)))
+
+    if n_jobs == 1:
+        return [func(item) for item in items]
+
+    # Child deadline, used to cancel the remaining calls of this map
+    # without cancelling the deadline of the caller.
+    deadline = Deadline(parent=current_deadline())
+
+    def _call(item):
+        with deadline_scope(deadline):
+            deadline.check()
+            return func(item)
+
+    executor = ThreadPoolExecutor(max_workers=n_jobs)
+
+    try:
+        futures = [executor.submit(_call, item) for item in items]
+        done, not_done = wait(futures, timeout=deadline.remaining(),
+                              return_when=FIRST_EXCEPTION)
+
+        if not_done:
+            # Deadline passed or a call failed, cancel outstanding calls.
+            deadline.cancel()
+            for future in not_done:
+                future.cancel()
+
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+
+            raise DeadlineExceeded('Query did not finish before its deadline')
+
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,357 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import operator
+
+import pandas as pd
+
+_COMPARISONS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+
+class Column(object):
+    """Reference to an attribute, used to build predicates.
+
+    Comparing a column (using ==, !=, <, <=, > or >=) or calling one of
+    its methods returns a Predicate, which can be combined with other
+    predicates using & (and), | (or) and ~ (not).
+
+    Args:
+        name (str): Name of the attribute.
+
+    Examples:
+        Protein coding genes on chromosome 1 or 2, starting beyond 1 Mb:
+            >>> where = (col('chromosome_name').isin(['1', '2']) &
+            >>>          (col('start_position') > 1000000) &
+            >>>          ~col('external_gene_name').matches('^Gm[0-9]'))
+
+    """
+
+    # Columns override ==, and are therefore not hashable.
+    __hash__ = None
+
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def name(self):
+        """Name of the attribute."""
+        return self._name
+
+    def __eq__(self, value):
+        return In(self._name, [value])
+
+    def __ne__(self, value):
+        return Not(In(self._name, [value]))
+
+    def __lt__(self, value):
+        return Compare(self._name, '<', value)
+
+    def __le__(self, value):
+        return Compare(self._name, '<=', value)
+
+    def __gt__(self, value):
+        return Compare(self._name, '>', value)
+
+    def __ge__(self, value):
+        return Compare(self._name, '>=', value)
+
+    def isin(self, values):
+        """Selects rows whose value is one of the given values."""
+        return In(self._name, values)
+
+    def between(self, lower, upper):
+        """Selects rows whose value lies in [lower, upper]."""
+        return And([Compare(self._name, '>=', lower),
+                    Compare(self._name, '<=', upper)])
+
+    def matches(self, pattern):
+        """Selects rows whose value matches the (regex) pattern anywhere."""
+        return Matches(self._name, pattern)
+
+    def isnull(self):
+        """Selects rows without a value."""
+        return IsNull(self._name)
+
+    def __repr__(self):
+        return 'col({!r})'.format(self._name)
+
+
+def col(name):
+    """Returns a reference to an attribute, used to build predicates.
+
+    Args:
+        name (str): Name of the attribute.
+
+    Returns:
+        Column: Column, which can be compared to build predicates.
+
+    """
+    return Column(name)
+
+
+class Predicate(object):
+    """Base class of predicates selecting rows of a query result."""
+
+    def __and__(self, other):
+        return And([self, other])
+
+    def __or__(self, other):
+        return Or([self, other])
+
+    def __invert__(self):
+        return Not(self)
+
+    @property
+    def columns(self):
+        """Names of the attributes used by the predicate."""
+        raise NotImplementedError()
+
+    def evaluate(self, frame):
+        """Evaluates the predicate on a DataFrame.
+
+        Args:
+            frame (pandas.DataFrame): Frame with attribute names as columns.
+
+        Returns:
+            pandas.Series: Boolean mask of the selected rows.
+
+        """
+        raise NotImplementedError()
+
+    def conjuncts(self):
+        """Splits the predicate into predicates that should all hold."""
+        return [self]
+
+    def as_filter(self):
+        """Returns the (name, values) of an equivalent list filter.
+
+        Returns:
+            tuple: Filter name and values, or None if the predicate
+                cannot be expressed as a single list filter.
+
+        """
+        return None
+
+
+class In(Predicate):
+    """Predicate selecting rows whose value is one of the given values."""
+
+    def __init__(self, name, values):
+        self._name = name
+        self._values = list(values)
+
+    @property
+    def columns(self):
+        return {self._name}
+
+    def evaluate(self, frame):
+        series = frame[self._name]
+
+        if all(isinstance(value, str) for value in self._values):
+            # Values of numeric columns are compared as strings.
+            return series.astype(str).isin(self._values) & series.notnull()
+
+        return series.isin(self._values)
+
+    def as_filter(self):
+        return self._name, self._values
+
+    def __repr__(self):
+        return 'col({!r}).isin({!r})'.format(self._name, self._values)
+
+
+class Compare(Predicate):
+    """Predicate comparing values to a bound (<, <=, > or >=)."""
+
+    def __init__(self, name, op, value):
+        self._name = name
+        self._op = op
+        self._value = value
+
+    @property
+    def columns(self):
+        return {self._name}
+
+    def evaluate(self, frame):
+        series = frame[self._name]
+
+        if isinstance(self._value, (int, float)):
+            series = pd.to_numeric(series, errors='coerce')
+
+        # Missing values never satisfy the comparison.
+        return _COMPARISONS[self._op](series, self._value) & series.notnull()
+
+    def __repr__(self):
+        return 'col({!r}) {} {!r}'.format(self._name, self._op, self._value)
+
+
+class Matches(Predicate):
+    """Predicate selecting values matching a regular expression."""
+
+    def __init__(self, name, pattern):
+        self._name = name
+        self._pattern = pattern
+
+    @property
+    def columns(self):
+        return {self._name}
+
+    def evaluate(self, frame):
+        series = frame[self._name]
+        return (series.astype(str).str.contains(self._pattern, regex=True) &
+                series.notnull())
+
+    def __repr__(self):
+        return 'col({!r}).matches({!r})'.format(self._name, self._pattern)
+
+
+class IsNull(Predicate):
+    """Predicate selecting rows without a value."""
+
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def columns(self):
+        return {self._name}
+
+    def evaluate(self, frame):
+        return frame[self._name].isnull()
+
+    def __repr__(self):
+        return 'col({!r}).isnull()'.format(self._name)
+
+
+class Not(Predicate):
+    """Negation of a predicate."""
+
+    def __init__(self, predicate):
+        self._predicate = predicate
+
+    @property
+    def columns(self):
+        return self._predicate.columns
+
+    def evaluate(self, frame):
+        return ~self._predicate.evaluate(frame)
+
+    def __repr__(self):
+        return '~({!r})'.format(self._predicate)
+
+
+class And(Predicate):
+    """Conjunction of predicates."""
+
+    def __init__(self, predicates):
+        self._predicates = list(predicates)
+
+    @property
+    def columns(self):
+        return set().union(*(pred.columns for pred in self._predicates))
+
+    def evaluate(self, frame):
+        mask = pd.Series(True, index=frame.index)
+        for pred in self._predicates:
+            mask &= pred.evaluate(frame)
+        return mask
+
+    def conjuncts(self):
+        return [conjunct for pred in self._predicates
+                for conjunct in pred.conjuncts()]
+
+    def __repr__(self):
+        return ' & '.join('({!r})'.format(pred) for pred in self._predicates)
+
+
+class Or(Predicate):
+    """Disjunction of predicates."""
+
+    def __init__(self, predicates):
+        self._predicates = list(predicates)
+
+    @property
+    def columns(self):
+        return set().union(*(pred.columns for pred in self._predicates))
+
+    def evaluate(self, frame):
+        mask = pd.Series(False, index=frame.index)
+        for pred in self._predicates:
+            mask |= pred.evaluate(frame)
+        return mask
+
+    def as_filter(self):
+        # Alternatives on the same attribute are a single list filter.
+        filters = [pred.as_filter() for pred in self._predicates]
+
+        if any(filter_ is None for filter_ in filters):
+            return None
+
+        names = {name for name, _ in filters}
+        if len(names) != 1:
+            return None
+
+        return names.pop(), [value for _, values in filters
+                             for value in values]
+
+    def __repr__(self):
+        return ' | '.join('({!r})'.format(pred) for pred in self._predicates)
+
+
+def push_down(where, dataset, filters=None):
+    """Splits a predicate into filters for the server and a local remainder.
+
+    The predicate is split into its conjuncts. Conjuncts selecting a list
+    of values of an attribute (using ==, isin or alternatives combined
+    using ``|``) are pushed down to the server if the dataset has a filter
+    with the same name as the attribute, which is not already used in
+    filters.
+    The other conjuncts (ranges, regular expressions, negations, etc.) are
+    returned as predicate that has to be evaluated locally.
+
+    Args:
+        where (Predicate): Predicate to plan.
+        dataset (Dataset): Dataset that is queried.
+        filters (dict[str,any]): Filters of the query.
+
+    Returns:
+        tuple(dict[str,any], Predicate): Filters including the pushed down
+            filters and the predicate to evaluate locally (None if the
+            complete predicate was pushed down).
+
+    """
+    filters = dict(filters or {})
+    local = []
+
+    for conjunct in where.conjuncts():
+        filter_ = conjunct.as_filter()
+
+        if filter_ is not None and _can_push(dataset, filters, *filter_):
+            name, values = filter_
+            filters[name] = values[0] if len(values) == 1 else values
+        else:
+            local.append(conjunct)
+
+    if not local:
+        return filters, None
+
+    return filters, local[0] if len(local) == 1 else And(local)
+
+
+def _can_push(dataset, filters, name, values):
+    if name in filters or name not in dataset.filters:
+        return False
+
+    # Boolean filters select entries with/without a value, which is not
+    # equivalent to comparing values of the attribute.
+    if 'boolean' in dataset.filters[name].type:
+        return False
+
+    return not any(isinstance(value, bool) for value in values)
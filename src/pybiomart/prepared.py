@@ -0,0 +1,174 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+from xml.sax.saxutils import escape
+
+# pylint: disable=import-error
+from .base import (BiomartException, Deadline, current_deadline,
+                   deadline_scope)
+from . import backends, tracing
+# pylint: enable=import-error
+
+# Characters escaped in attribute values (matching ElementTree).
+_ATTRIB_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;',
+                    '\t': '&#09;'}
+
+
+class PreparedQuery(object):
+    """Query that is validated once and executed for many filter values.
+
+    Prepared queries are created using the prepare method of a dataset.
+    The attributes and fixed filters of the query are validated and
+    serialized into a template when the query is prepared, together with
+    the names of the result columns. Executing the query only renders the
+    values of its parameter filters into the template, avoiding repeated
+    validation of the query against the dataset configuration.
+
+    Args:
+        dataset (Dataset): Dataset that is queried.
+        template (tuple[bytes,bytes]): Serialized query before and after
+            the position at which parameter filters are inserted.
+        parameters (dict[str,Filter]): Filters that can be bound when
+            executing the query. Filters have an empty type if their type
+            is not known (for queries prepared without validation).
+        columns (list[str]): Names of the result columns.
+        dtypes (dict[str,any]): Dictionary of columns --> data types.
+        backend (str): Type of the returned results.
+
+    Examples:
+        Preparing a query and executing it for several chromosomes:
+            >>> query = dataset.prepare(
+            >>>     attributes=['ensembl_gene_id', 'external_gene_name'],
+            >>>     parameters=['chromosome_name'])
+            >>> query.execute(chromosome_name='1')
+            >>> query.execute(chromosome_name=['2', '3'])
+
+    """
+
+    def __init__(self, dataset, template, parameters, columns, dtypes=None,
+                 backend='pandas'):
+        self._dataset = dataset
+        self._prefix, self._suffix = template
+        self._parameters = parameters
+        self._columns = list(columns)
+        self._dtypes = dtypes
+        self._backend = backend
+
+    @property
+    def parameters(self):
+        """Names of the filters that can be bound when executing."""
+        return list(self._parameters.keys())
+
+    @property
+    def columns(self):
+        """Names of the result columns."""
+        return list(self._columns)
+
+    def render(self, **values):
+        """Renders the query xml for the given filter values.
+
+        Args:
+            **values: Values of the parameter filters. Parameters that
+                are not given (or None) are left out of the query.
+
+        Returns:
+            bytes: Serialized query.
+
+        """
+        unknown = set(values) - set(self._parameters)
+        if unknown:
+            raise BiomartException(
+                'Unknown parameter(s) {}, prepared query takes: {}'.format(
+                    ', '.join(sorted(unknown)),
+                    ', '.join(self._parameters)))
+
+        filters = []
+        for name, filter_ in self._parameters.items():
+            value = values.get(name)
+            if value is not None:
+                filters.append(self._render_filter(filter_, value))
+
+        return self._prefix + b''.join(filters) + self._suffix
+
+    def execute(self, deadline=None, **values):
+        """Executes the query with the given filter values.
+
+        Args:
+            deadline (float): Maximum number of seconds the query may take.
+            **values: Values of the parameter filters. Parameters that
+                are not given (or None) are left out of the query.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing the query results (or
+                a pyarrow.Table/polars.DataFrame for other backends).
+
+        """
+        with tracing.span('render_query'):
+            query = self.render(**values)
+
+        if deadline is not None:
+            deadline = Deadline(deadline, parent=current_deadline())
+        else:
+            deadline = current_deadline()
+
+        # pylint: disable=protected-access
+        with deadline_scope(deadline), \
+                tracing.span('prepared_query', dataset=self._dataset.name):
+            response = self._dataset._submit_query(query)
+
+        result = self._dataset._parse_response(
+            response, self._dtypes, backend=self._backend,
+            names=self._columns)
+        # pylint: enable=protected-access
+
+        if len(self._columns) != _num_columns(result, self._backend):
+            raise BiomartException(
+                'Unexpected number of columns in query result')
+
+        result = backends.set_columns(
+            result, self._columns, backend=self._backend)
+
+        return backends.finalize(result, backend=self._backend)
+
+    def _render_filter(self, filter_, value):
+        if self._dataset.validate_options:
+            value = filter_.normalize(value)
+
+        # pylint: disable=protected-access
+        key, value = self._dataset._filter_attrib(filter_, value)
+        # pylint: enable=protected-access
+
+        element = u'<Filter name="{}" {}="{}" />'.format(
+            escape(filter_.name, _ATTRIB_ENTITIES), key,
+            escape(value, _ATTRIB_ENTITIES))
+
+        return element.encode('ascii', 'xmlcharrefreplace')
+
+    def __repr__(self):
+        return ('<biomart.PreparedQuery dataset={!r}, parameters={!r}>'
+                .format(self._dataset.name, self.parameters))
+
+
+def split_template(query):
+    """Splits a serialized query at the end of its dataset element.
+
+    Args:
+        query (bytes): Serialized query, whose dataset element should
+            contain at least one attribute.
+
+    Returns:
+        tuple[bytes,bytes]: Query before and after the end of the
+            dataset element.
+
+    """
+    index = query.rindex(b'</Dataset>')
+    return query[:index], query[index:]
+
+
+def _num_columns(result, backend):
+    if backend == 'pandas':
+        return len(result.columns)
+    return result.num_columns
@@ -0,0 +1,325 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import pandas as pd
+
+# pylint: disable=import-error
+from . import tracing
+# pylint: enable=import-error
+
+DEFAULT_MAX_ENTRIES = 32
+
+# Types of filters selecting rows with values equal to the filter values.
+LOCAL_FILTER_TYPES = {'list', 'text', 'id_list'}
+
+
+class ResultCache(object):
+    """In-memory cache of query results, answering contained queries.
+
+    Besides repeated queries, the cache answers queries that are contained
+    in a cached result. A query is contained if the cached result has (a
+    superset of) the requested attributes and its filters cover the
+    requested filter values. Such queries are answered locally, by
+    selecting the requested rows and columns from the cached result.
+    Filters that were not used by the cached query can be applied locally
+    if the filtered attribute (with the same name as the filter) is part of
+    the cached result.
+
+    Filters are only applied locally if their type (list, text or id_list)
+    selects the rows whose attribute equals one of the filter values. It is
+    assumed that such a filter selects on the attribute with its name.
+    Queries using other filters (such as ranges or booleans) are only
+    answered by cached results of queries with identical filter values.
+
+    If the values of a list filter are only partially covered by a cached
+    result, the covered values are answered locally and only the remaining
+    values are fetched from the server.
+
+    Results are cached for pandas queries without dtypes or linked
+    datasets. The least recently used results are removed once the cache
+    holds more than max_entries results.
+
+    Args:
+        max_entries (int): Maximum number of cached results.
+
+    Examples:
+        Answering a narrower query from a broad one:
+            >>> cache = ResultCache()
+            >>> dataset.query(attributes=['ensembl_gene_id',
+            >>>                           'external_gene_name',
+            >>>                           'gene_biotype'],
+            >>>               filters={'ensembl_gene_id': gene_ids},
+            >>>               result_cache=cache)
+            >>> dataset.query(attributes=['ensembl_gene_id',
+            >>>                           'external_gene_name'],
+            >>>               filters={'ensembl_gene_id': gene_ids[:10]},
+            >>>               result_cache=cache)
+
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        """Maximum number of cached results."""
+        return self._max_entries
+
+    def query(self, dataset, attributes, filters=None, only_unique=True,
+              use_attr_names=False, **kwargs):
+        """Queries a dataset, answering the query from cache if possible.
+
+        Args:
+            dataset (Dataset): Dataset to query.
+            attributes (list[str]): Names of attributes to fetch.
+            filters (dict[str,any]): Filters of the query.
+            only_unique (bool): Whether to return only unique rows.
+            use_attr_names (bool): Whether to use attribute names as column
+                names (True) or attribute display names (False).
+            **kwargs: Other arguments passed to Dataset.query for queries
+                that are (partially) sent to the server.
+
+        Returns:
+            pandas.DataFrame: Query result.
+
+        """
+        attributes = list(attributes)
+        filters = {
+            name: _normalize(value)
+            for name, value in (filters or {}).items()
+        }
+
+        scope = (tuple(dataset.hosts), dataset.path, dataset.name)
+        request = _Entry(attributes, filters, only_unique)
+
+        with tracing.span('result_cache', dataset=dataset.name):
+            match = None
+            for key, entry in self._candidates(scope):
+                match = entry.match(request, dataset)
+                if match is not None:
+                    self._touch(key)
+                    break
+
+            if match is None:
+                result = self._fetch(dataset, request, **kwargs)
+            else:
+                result, remainder = match
+                if remainder is not None:
+                    fetched = self._fetch(dataset, remainder, **kwargs)
+                    result = pd.concat([result, fetched], ignore_index=True)
+                    if only_unique:
+                        result = result.drop_duplicates().reset_index(
+                            drop=True)
+
+        if match is None or match[1] is not None:
+            self._store(scope, _Entry(attributes, filters, only_unique,
+                                      result=result))
+
+        result = result.copy()
+
+        if not use_attr_names:
+            # Cached results use attribute names as column names.
+            result.columns = [
+                dataset.attributes[attr].display_name for attr in attributes
+            ]
+
+        return result
+
+    @staticmethod
+    def _fetch(dataset, request, **kwargs):
+        filters = {name: _denormalize(value)
+                   for name, value in request.filters.items()}
+
+        return dataset.query(
+            attributes=request.attributes,
+            filters=filters,
+            only_unique=request.only_unique,
+            use_attr_names=True,
+            **kwargs)
+
+    def _candidates(self, scope):
+        """Returns cached entries for the scope, most recent first."""
+        with self._lock:
+            return [(key, entry)
+                    for key, entry in reversed(list(self._entries.items()))
+                    if key[0] == scope]
+
+    def _touch(self, key):
+        with self._lock:
+            if key in self._entries:
+                entry = self._entries.pop(key)
+                self._entries[key] = entry
+
+    def _store(self, scope, entry):
+        key = (scope, entry.key)
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes all cached results."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<biomart.ResultCache entries={!r}>'.format(len(self))
+
+
+class _Entry(object):
+    """Query (and its result, if cached) with normalized filter values."""
+
+    def __init__(self, attributes, filters, only_unique, result=None):
+        self.attributes = attributes
+        self.filters = filters
+        self.only_unique = only_unique
+        self.result = result
+
+    @property
+    def key(self):
+        """Hashable key identifying the query."""
+        return (tuple(self.attributes),
+                tuple(sorted(self.filters.items())), self.only_unique)
+
+    def match(self, request, dataset):
+        """Matches a request against the cached query.
+
+        Returns:
+            tuple: Result answering the (covered part of the) request and
+                the request for the remaining filter values (None if fully
+                covered), or None if the request is not contained.
+
+        """
+        columns = set(self.attributes)
+
+        if not set(request.attributes) <= columns:
+            return None
+
+        # Projecting unique rows cannot reproduce duplicate rows.
+        if self.only_unique and not request.only_unique:
+            return None
+
+        local, remainder = {}, None
+
+        for name, cached in self.filters.items():
+            value = request.filters.get(name)
+
+            # Single values are equivalent to a list of one value.
+            if isinstance(cached, frozenset) and isinstance(value, str):
+                value = frozenset([value])
+
+            if value == cached:
+                continue
+
+            # Narrower list filters can only be answered by filtering
+            # the cached result, which requires the filtered column.
+            if (not isinstance(value, frozenset) or
+                    not isinstance(cached, frozenset) or
+                    not _is_local(name, columns, dataset)):
+                return None
+
+            covered = value & cached
+            if not covered:
+                return None
+
+            if covered != value:
+                # Only a single filter can be split into a remainder.
+                if remainder is not None:
+                    return None
+                remainder = dict(request.filters, **{name: value - cached})
+
+            local[name] = covered
+
+        for name, value in request.filters.items():
+            if name in self.filters:
+                continue
+
+            # Apply additional filters locally (if possible).
+            if (not _is_local(name, columns, dataset) or
+                    isinstance(value, bool)):
+                return None
+
+            if not isinstance(value, frozenset):
+                value = frozenset([value])
+
+            local[name] = value
+
+        result = self.result
+
+        if local:
+            mask = pd.Series(True, index=result.index)
+            for name, values in local.items():
+                mask &= _format_column(result[name]).isin(values)
+            result = result.loc[mask]
+
+        result = result[request.attributes]
+
+        if request.only_unique:
+            result = result.drop_duplicates()
+
+        result = result.reset_index(drop=True)
+
+        if remainder is not None:
+            remainder = _Entry(request.attributes, remainder,
+                               request.only_unique)
+
+        return result, remainder
+
+
+def _is_local(name, columns, dataset):
+    """Checks if a filter can be applied locally on the given columns."""
+
+    if name not in columns or name not in dataset.filters:
+        return False
+
+    return dataset.filters[name].type in LOCAL_FILTER_TYPES
+
+
+def _normalize(value):
+    """Normalizes filter values for comparison."""
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(_format_value(item) for item in value)
+
+    if isinstance(value, bool):
+        return value
+
+    return _format_value(value)
+
+
+def _format_value(value):
+    # Integral floats (such as integer columns with missing values, which
+    # pandas reads as floats) are formatted as integers.
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return '{:d}'.format(int(value))
+    return str(value)
+
+
+def _format_column(column):
+    """Formats the values of a column like normalized filter values."""
+
+    if pd.api.types.is_float_dtype(column):
+        return column.map(_format_value, na_action='ignore')
+
+    return column.astype(str)
+
+
+def _denormalize(value):
+    if isinstance(value, frozenset):
+        return sorted(value)
+    return value
@@ -0,0 +1,156 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import threading
+import time
+
+DEFAULT_COOLDOWN = 60.0
+DEFAULT_SMOOTHING = 0.3
+
+_ROUTERS = {}
+_ROUTERS_LOCK = threading.Lock()
+
+
+class HostRouter(object):
+    """Routing table for a set of equivalent (mirror) hosts.
+
+    Keeps track of the latency of each host, using an exponentially
+    weighted moving average of observed request times, and of hosts that
+    recently failed. Hosts are ranked by latency, with failed hosts being
+    moved to the end of the ranking until their cooldown period expires.
+    Hosts without any latency measurements keep their given order.
+
+    Args:
+        hosts (list[str]): Equivalent hosts, in order of preference.
+        cooldown (float): Number of seconds a failed host is avoided.
+        smoothing (float): Weight of new latency observations.
+
+    """
+
+    def __init__(self, hosts, cooldown=DEFAULT_COOLDOWN,
+                 smoothing=DEFAULT_SMOOTHING):
+        self._hosts = list(hosts)
+        self._cooldown = cooldown
+        self._smoothing = smoothing
+
+        self._latencies = {}
+        self._failed_until = {}
+        self._probed = len(self._hosts) < 2
+
+        self._lock = threading.Lock()
+
+    @property
+    def hosts(self):
+        """Equivalent hosts, in order of preference."""
+        return list(self._hosts)
+
+    @property
+    def latencies(self):
+        """Smoothed latency (in seconds) of each measured host."""
+        with self._lock:
+            return dict(self._latencies)
+
+    @property
+    def needs_probe(self):
+        """Whether the hosts should be probed before routing requests."""
+        return not self._probed
+
+    def ranked(self):
+        """Returns hosts ordered from most to least preferred.
+
+        Returns:
+            list[str]: Hosts ranked by health and latency.
+
+        """
+        now = time.time()
+
+        with self._lock:
+            def _key(item):
+                index, host = item
+                failed = self._failed_until.get(host, 0) > now
+                latency = self._latencies.get(host, float('inf'))
+                return (failed, latency, index)
+
+            ranking = sorted(enumerate(self._hosts), key=_key)
+
+        return [host for _, host in ranking]
+
+    def best(self):
+        """Returns the currently preferred host."""
+        return self.ranked()[0]
+
+    def record_success(self, host, latency):
+        """Records a successful request to the given host.
+
+        Args:
+            host (str): Host the request was sent to.
+            latency (float): Duration of the request in seconds.
+
+        """
+        with self._lock:
+            previous = self._latencies.get(host)
+            if previous is None:
+                self._latencies[host] = latency
+            else:
+                self._latencies[host] = (self._smoothing * latency +
+                                         (1 - self._smoothing) * previous)
+            self._failed_until.pop(host, None)
+
+    def record_failure(self, host):
+        """Records a failed request to the given host.
+
+        Args:
+            host (str): Host the request was sent to.
+
+        """
+        with self._lock:
+            self._failed_until[host] = time.time() + self._cooldown
+
+    def probe(self, measure):
+        """Probes all hosts, recording their latency or failure.
+
+        Args:
+            measure (callable): Function that sends a (lightweight) request
+                to the given host and returns its latency in seconds. Should
+                raise an exception if the host is unavailable.
+
+        """
+        for host in self._hosts:
+            try:
+                latency = measure(host)
+            except Exception:  # pylint: disable=broad-except
+                self.record_failure(host)
+            else:
+                self.record_success(host, latency)
+
+        self._probed = True
+
+    def __repr__(self):
+        return '<biomart.HostRouter hosts={!r}>'.format(self._hosts)
+
+
+def get_router(hosts):
+    """Returns the (shared) router for the given set of hosts.
+
+    Objects connecting to the same set of equivalent hosts share a
+    single router, so that latency measurements and failures observed by
+    one object are used for routing requests of all others.
+
+    Args:
+        hosts (list[str]): Equivalent hosts, in order of preference.
+
+    Returns:
+        HostRouter: Router for the hosts.
+
+    """
+    key = tuple(hosts)
+
+    with _ROUTERS_LOCK:
+        try:
+            return _ROUTERS[key]
+        except KeyError:
+            router = _ROUTERS[key] = HostRouter(hosts)
+            return router
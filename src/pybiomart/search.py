@@ -0,0 +1,266 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import re
+import sqlite3
+
+import pandas as pd
+
+DEFAULT_INDEX_PATH = '.pybiomart_index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    mart TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    display_name TEXT,
+    PRIMARY KEY (mart, dataset)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    mart TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    display_name TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_dataset ON entries (mart, dataset);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    entry INTEGER NOT NULL,
+    PRIMARY KEY (token, entry)
+) WITHOUT ROWID;
+"""
+
+_TOKEN_SPLIT = re.compile(r'[^0-9a-z]+')
+
+
+class SearchIndex(object):
+    """Persistent inverted index of attributes and filters on a server.
+
+    The index maps the words occurring in the names, display names and
+    descriptions of attributes and filters to the datasets that expose
+    them. It is stored in a SQLite file and built incrementally: datasets
+    that are already indexed are skipped when the index is updated, so
+    an interrupted build can simply be resumed. Searches only touch the
+    local index and never access the network.
+
+    Args:
+        path (str): Path of the file used to store the index.
+
+    Examples:
+        Building an index for a server:
+            >>> server = Server(host='http://www.ensembl.org')
+            >>> index = SearchIndex('ensembl_index.sqlite')
+            >>> index.update(server, marts=['ENSEMBL_MART_ENSEMBL'])
+
+        Finding datasets exposing uniprot attributes:
+            >>> index.search('uniprot', kind='attribute')
+
+    """
+
+    KINDS = ('attribute', 'filter')
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self._path = path
+
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    @property
+    def path(self):
+        """Path of the file used to store the index."""
+        return self._path
+
+    @property
+    def datasets(self):
+        """List of (mart, dataset) tuples that have been indexed."""
+        cursor = self._conn.execute(
+            'SELECT mart, dataset FROM datasets ORDER BY mart, dataset')
+        return [tuple(row) for row in cursor]
+
+    def update(self, server, marts=None, refresh=False):
+        """Adds all datasets of the given server to the index.
+
+        Args:
+            server (Server): Server whose datasets should be indexed.
+            marts (list[str]): Names of the marts to index. Defaults
+                to all marts available on the server.
+            refresh (bool): Whether to re-index datasets that are
+                already present in the index.
+
+        """
+        if marts is None:
+            marts = list(server.marts.keys())
+
+        for mart_name in marts:
+            mart = server[mart_name]
+            for dataset in mart.datasets.values():
+                self.add_dataset(dataset, mart=mart.name, refresh=refresh)
+
+    def add_dataset(self, dataset, mart='', refresh=False):
+        """Adds the attributes and filters of a dataset to the index.
+
+        Args:
+            dataset (Dataset): Dataset to index.
+            mart (str): Name of the mart containing the dataset.
+            refresh (bool): Whether to re-index the dataset if it is
+                already present in the index.
+
+        Returns:
+            bool: Whether the dataset was (re-)indexed.
+
+        """
+        if not refresh and self.contains(dataset.name, mart=mart):
+            return False
+
+        # Fetch the configuration before touching the index, so that a
+        # failing request does not leave a partially indexed dataset.
+        entries = [('attribute', attr.name, attr.display_name,
+                    attr.description)
+                   for attr in dataset.attributes.values()]
+        entries += [('filter', filt.name, filt.display_name,
+                     filt.description)
+                    for filt in dataset.filters.values()]
+
+        with self._conn:
+            self._remove(mart, dataset.name)
+
+            for kind, name, display_name, description in entries:
+                cursor = self._conn.execute(
+                    'INSERT INTO entries (mart, dataset, kind, name, '
+                    'display_name, description) VALUES (?, ?, ?, ?, ?, ?)',
+                    (mart, dataset.name, kind, name, display_name,
+                     description))
+
+                tokens = _tokenize(name, display_name, description)
+                self._conn.executemany(
+                    'INSERT INTO postings (token, entry) VALUES (?, ?)',
+                    ((token, cursor.lastrowid) for token in tokens))
+
+            self._conn.execute(
+                'INSERT INTO datasets (mart, dataset, display_name) '
+                'VALUES (?, ?, ?)', (mart, dataset.name, dataset.display_name))
+
+        return True
+
+    def contains(self, dataset, mart=''):
+        """Checks whether the given dataset has been indexed.
+
+        Args:
+            dataset (str): Name of the dataset.
+            mart (str): Name of the mart containing the dataset.
+
+        Returns:
+            bool: Whether the dataset is present in the index.
+
+        """
+        cursor = self._conn.execute(
+            'SELECT 1 FROM datasets WHERE mart = ? AND dataset = ?',
+            (mart, dataset))
+        return cursor.fetchone() is not None
+
+    def _remove(self, mart, dataset):
+        self._conn.execute(
+            'DELETE FROM postings WHERE entry IN (SELECT id FROM entries '
+            'WHERE mart = ? AND dataset = ?)', (mart, dataset))
+        self._conn.execute(
+            'DELETE FROM entries WHERE mart = ? AND dataset = ?',
+            (mart, dataset))
+        self._conn.execute(
+            'DELETE FROM datasets WHERE mart = ? AND dataset = ?',
+            (mart, dataset))
+
+    def search(self, query, kind=None, mart=None):
+        """Searches the index for attributes and filters matching a query.
+
+        The query is split into words, each of which should match (the
+        start of) a word in the name, display name or description of an
+        attribute or filter. Matching is case-insensitive.
+
+        Args:
+            query (str): Words to search for.
+            kind (str): Restrict results to 'attribute' or 'filter' entries.
+            mart (str): Restrict results to datasets from the given mart.
+
+        Returns:
+            pd.DataFrame: Frame listing the matching entries, with columns
+                mart, dataset, kind, name, display_name and description.
+
+        """
+        if kind is not None and kind not in self.KINDS:
+            raise ValueError('Invalid kind {!r}, should be one of {}'
+                             .format(kind, ', '.join(self.KINDS)))
+
+        columns = ['mart', 'dataset', 'kind', 'name', 'display_name',
+                   'description']
+
+        tokens = sorted(_tokenize(query))
+        if not tokens:
+            return pd.DataFrame([], columns=columns)
+
+        # Select entries matching each of the query tokens (as prefix).
+        sql = 'SELECT {} FROM entries WHERE '.format(', '.join(columns))
+        sql += ' AND '.join(
+            'id IN (SELECT entry FROM postings '
+            'WHERE token >= ? AND token < ?)' for _ in tokens)
+
+        params = []
+        for token in tokens:
+            params += [token, token + u'\uffff']
+
+        if kind is not None:
+            sql += ' AND kind = ?'
+            params.append(kind)
+
+        if mart is not None:
+            sql += ' AND mart = ?'
+            params.append(mart)
+
+        sql += ' ORDER BY mart, dataset, kind, name'
+
+        return pd.DataFrame.from_records(
+            self._conn.execute(sql, params).fetchall(), columns=columns)
+
+    def search_datasets(self, query, kind=None, mart=None):
+        """Lists the datasets exposing attributes or filters matching a query.
+
+        Args:
+            query (str): Words to search for.
+            kind (str): Restrict matches to 'attribute' or 'filter' entries.
+            mart (str): Restrict results to datasets from the given mart.
+
+        Returns:
+            pd.DataFrame: Frame listing the matching datasets, with columns
+                mart, dataset and the number of matching entries (hits).
+
+        """
+        matches = self.search(query, kind=kind, mart=mart)
+
+        counts = (matches.groupby(['mart', 'dataset']).size()
+                  .reset_index(name='hits'))
+        counts = counts.sort_values(
+            ['hits', 'mart', 'dataset'], ascending=[False, True, True])
+
+        return counts.reset_index(drop=True)
+
+    def close(self):
+        """Closes the connection to the index file."""
+        self._conn.close()
+
+    def __repr__(self):
+        return '<biomart.SearchIndex path={!r}>'.format(self._path)
+
+
+def _tokenize(*texts):
+    """Splits texts into a set of lowercase alphanumeric tokens."""
+
+    tokens = set()
+    for text in texts:
+        if text:
+            tokens.update(_TOKEN_SPLIT.split(text.lower()))
+    tokens.discard('')
+    return tokens
@@ -0,0 +1,105 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import gzip
+import itertools
+
+# pylint: disable=import-error
+from .base import BiomartException
+# pylint: enable=import-error
+
+# Number of bytes read from streamed responses at once.
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+def open_stream(response):
+    """Opens a streamed query response, checking it for errors.
+
+    Args:
+        response (requests.models.Response): Streamed query response.
+
+    Returns:
+        iterator[bytes]: Chunks of the response content.
+
+    """
+    chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+    first = next(chunks, b'')
+
+    # Errors are reported at the start of the response.
+    if b'Query ERROR' in first:
+        response.close()
+        raise BiomartException(first.decode('utf-8', 'replace'))
+
+    return itertools.chain([first], chunks)
+
+
+def read_fasta(chunks):
+    """Parses FASTA records from chunks of (streamed) content.
+
+    Only a single record is kept in memory at a time.
+
+    Args:
+        chunks (iterable[bytes]): Chunks of FASTA content.
+
+    Yields:
+        tuple[str,str]: Header (without '>') and sequence of each record.
+
+    """
+    header, sequence = None, []
+
+    for line in _iter_lines(chunks):
+        if line.startswith(b'>'):
+            if header is not None:
+                yield header, b''.join(sequence).decode('ascii')
+            header, sequence = line[1:].decode('utf-8'), []
+        elif line and header is not None:
+            sequence.append(line)
+
+    if header is not None:
+        yield header, b''.join(sequence).decode('ascii')
+
+
+def _iter_lines(chunks):
+    """Splits chunks into lines, without copying long lines repeatedly."""
+
+    parts = []
+    for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start)
+            if end < 0:
+                parts.append(chunk[start:])
+                break
+            parts.append(chunk[start:end])
+            yield b''.join(parts).rstrip(b'\r')
+            parts = []
+            start = end + 1
+
+    if any(parts):
+        yield b''.join(parts).rstrip(b'\r')
+
+
+def write_chunks(chunks, path):
+    """Writes chunks of (streamed) content to a file.
+
+    Args:
+        chunks (iterable[bytes]): Chunks of content.
+        path (str): Path of the file to write. The file is gzipped if
+            the path ends with '.gz'.
+
+    Returns:
+        int: Number of bytes written (before compression).
+
+    """
+    open_ = gzip.open if path.endswith('.gz') else open
+
+    size = 0
+    with open_(path, 'wb') as file_:
+        for chunk in chunks:
+            file_.write(chunk)
+            size += len(chunk)
+
+    return size
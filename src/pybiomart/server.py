@@ -9,8 +9,9 @@ from xml.etree.ElementTree import fromstring as xml_from_string
 import pandas as pd
 
 # pylint: disable=import-error
-from .base import ServerBase
+from .base import ServerBase, DEFAULT_TIMEOUT
 from .mart import Mart
+from . import tracing
 
 # pylint: enable=import-error
 
@@ -23,10 +24,18 @@ class Server(ServerBase):
     on the server.
 
     Args:
-        host (str): Url of host to connect to.
+        host (str or list[str]): Url of host to connect to, or a list of
+            urls of equivalent mirrors (see ServerBase).
         path (str): Path on the host to access to the biomart service.
         port (int): Port to use for the connection.
         use_cache (bool): Whether to cache requests.
+        governor (Governor): Governor limiting the rate of requests.
+        timeout (tuple[float,float]): Connect and read timeouts (seconds).
+        use_post (bool): Whether to submit queries using post requests.
+        metadata_ttl (float): Number of seconds after which metadata is
+            refreshed in the background (see ServerBase).
+        transport (Transport): Transport used to send requests (see
+            ServerBase).
 
     Examples:
         Connecting to a server and listing available marts:
@@ -36,6 +45,11 @@ class Server(ServerBase):
         Retrieving a mart:
             >>> mart = server['ENSEMBL_MART_ENSEMBL']
 
+        Connecting to the fastest of several mirrors:
+            >>> server = Server(host=['http://www.ensembl.org',
+            >>>                       'http://useast.ensembl.org',
+            >>>                       'http://asia.ensembl.org'])
+
     """
 
     _MART_XML_MAP = {
@@ -47,8 +61,13 @@ class Server(ServerBase):
         'virtual_schema': 'serverVirtualSchema'
     }
 
-    def __init__(self, host=None, path=None, port=None, use_cache=True):
-        super().__init__(host=host, path=path, port=port, use_cache=use_cache)
+    def __init__(self, host=None, path=None, port=None, use_cache=True,
+                 governor=None, timeout=DEFAULT_TIMEOUT, use_post=True,
+                 metadata_ttl=None, transport=None):
+        super().__init__(host=host, path=path, port=port,
+                         use_cache=use_cache, governor=governor,
+                         timeout=timeout, use_post=use_post,
+                         metadata_ttl=metadata_ttl, transport=transport)
         self._marts = None
 
     def __getitem__(self, name):
@@ -57,9 +76,7 @@ class Server(ServerBase):
     @property
     def marts(self):
         """List of available marts."""
-        if self._marts is None:
-            self._marts = self._fetch_marts()
-        return self._marts
+        return self._metadata('_marts', self._fetch_marts)
 
     def list_marts(self):
         """Lists available marts in a readable DataFrame format.
@@ -76,15 +93,16 @@ class Server(ServerBase):
             _row_gen(self.marts), columns=['name', 'display_name'])
 
     def _fetch_marts(self):
-        response = self.get(type='registry')
+        with tracing.span('fetch_marts'):
+            response = self.get(type='registry')
 
-        xml = xml_from_string(response.content)
-        marts = [
-            self._mart_from_xml(child)
-            for child in xml.findall('MartURLLocation')
-        ]
+            xml = xml_from_string(response.content)
+            marts = [
+                self._mart_from_xml(child)
+                for child in xml.findall('MartURLLocation')
+            ]
 
-        return {m.name: m for m in marts}
+            return {m.name: m for m in marts}
 
     def _mart_from_xml(self, node):
         params = {k: node.attrib[v] for k, v in self._MART_XML_MAP.items()}
@@ -93,7 +111,14 @@ class Server(ServerBase):
             for k, v in node.attrib.items()
             if k not in set(self._MART_XML_MAP.values())
         }
-        return Mart(use_cache=self.use_cache, **params)
+
+        if len(self.hosts) > 1:
+            # Mirrors serve identical content, so marts listed by the
+            # registry are also available on the other mirrors.
+            params['host'] = self.hosts
+
+        params.update(self._client_params())
+        return Mart(**params)
 
     def __repr__(self):
         return ('<biomart.Server host={!r}, path={!r}, port={!r}>'
@@ -0,0 +1,135 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import os
+import tempfile
+
+# pylint: disable=import-error
+from . import backends
+# pylint: enable=import-error
+
+# Directory backed by memory (if available) for storing shared results.
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class SharedResult(object):
+    """Query result stored as an Arrow IPC file for sharing between processes.
+
+    The result is written once to a file (in shared memory if available),
+    after which any process can attach to it by memory mapping the file.
+    Attaching does not copy the data, which avoids duplicating a large
+    result for each process it is sent to. SharedResult objects only pickle
+    the path of the file and can therefore be sent cheaply to workers.
+
+    The file is not removed automatically, as workers may still use it
+    after the creating process is done with the result. Call unlink (or use
+    the result as a context manager) once all processes are finished.
+
+    Args:
+        path (str): Path of the Arrow IPC file containing the result.
+
+    Examples:
+        Sharing a query result with worker processes:
+            >>> with dataset.query(attributes=['ensembl_gene_id'],
+            >>>                    backend='shared') as result:
+            >>>     with ProcessPoolExecutor() as executor:
+            >>>         executor.map(analyze, [result] * 4)
+
+        Attaching to the result in a worker:
+            >>> def analyze(result):
+            >>>     table = result.table
+            >>>     frame = result.to_pandas()
+
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._table = None
+
+    @classmethod
+    def from_table(cls, table, path=None):
+        """Writes an Arrow table to a (shared memory) file.
+
+        Args:
+            table (pyarrow.Table): Table to share.
+            path (str): Path of the file to write. Defaults to a new
+                file in shared memory (or the temporary directory).
+
+        Returns:
+            SharedResult: Handle of the written result.
+
+        """
+        # pylint: disable=protected-access
+        pa, _ = backends._import_pyarrow()
+        # pylint: enable=protected-access
+
+        if path is None:
+            fd, path = tempfile.mkstemp(
+                prefix='pybiomart-', suffix='.arrow', dir=SHARED_DIR)
+            os.close(fd)
+
+        # Dictionaries cannot differ between batches of an IPC file.
+        table = table.unify_dictionaries()
+
+        try:
+            with pa.OSFile(path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        except BaseException:
+            os.remove(path)
+            raise
+
+        return cls(path)
+
+    @property
+    def path(self):
+        """Path of the Arrow IPC file containing the result."""
+        return self._path
+
+    @property
+    def table(self):
+        """Result as a (memory mapped) Arrow table."""
+        if self._table is None:
+            # pylint: disable=protected-access
+            pa, _ = backends._import_pyarrow()
+            # pylint: enable=protected-access
+            source = pa.memory_map(self._path, 'r')
+            self._table = pa.ipc.open_file(source).read_all()
+        return self._table
+
+    def to_pandas(self, **kwargs):
+        """Converts the result into a pandas DataFrame (copying the data)."""
+        return self.table.to_pandas(**kwargs)
+
+    def to_polars(self):
+        """Converts the result into a polars DataFrame."""
+        return backends.finalize(self.table, backend='polars')
+
+    def unlink(self):
+        """Removes the file containing the result."""
+        self._table = None
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
+
+    def __getstate__(self):
+        return {'path': self._path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __repr__(self):
+        return '<biomart.SharedResult path={!r}>'.format(self._path)
@@ -0,0 +1,216 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+_TRACER = None
+
+# Maximum length of (formatted) span attributes.
+MAX_ARG_LENGTH = 200
+
+
+class Tracer(object):
+    """Records timed spans of the phases of query execution.
+
+    Spans are recorded for metadata fetches, query building, cache lookups,
+    http requests and parsing of results, including those of sub-queries
+    running in other threads. Recording is enabled by using the tracer as a
+    context manager (or using set_tracer), after which the recorded spans
+    can be exported in the Chrome trace-event format. Such traces can be
+    inspected using chrome://tracing or https://ui.perfetto.dev.
+
+    Tracing is disabled by default, in which case spans are not recorded
+    and their overhead is limited to a single check.
+
+    Examples:
+        Tracing a query:
+            >>> tracer = Tracer()
+            >>> with tracer:
+            >>>     dataset.query(attributes=['ensembl_gene_id'],
+            >>>                   shard_by='region')
+            >>> tracer.export_chrome_trace('query_trace.json')
+
+    """
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._previous = []
+
+    @property
+    def spans(self):
+        """Recorded spans, as (name, start, duration, thread, args) tuples.
+
+        Start times are given in seconds since the epoch and durations in
+        seconds.
+        """
+        with self._lock:
+            return list(self._spans)
+
+    @contextmanager
+    def span(self, name, **args):
+        """Context manager recording a span.
+
+        Args:
+            name (str): Name of the span.
+            **args: Attributes describing the span.
+
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            with self._lock:
+                self._spans.append((name, start, duration,
+                                    threading.current_thread().ident, args))
+
+    def clear(self):
+        """Removes all recorded spans."""
+        with self._lock:
+            del self._spans[:]
+
+    def to_chrome_trace(self):
+        """Returns the recorded spans as Chrome trace events.
+
+        Returns:
+            dict: Trace in the Chrome trace-event format.
+
+        """
+        pid = os.getpid()
+
+        events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': duration * 1e6,
+            'pid': pid,
+            'tid': thread,
+            'args': {key: _format(value) for key, value in args.items()}
+        } for name, start, duration, thread, args in self.spans]
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        """Writes the recorded spans to a Chrome trace (json) file.
+
+        Args:
+            path (str): Path of the file to write.
+
+        """
+        with open(path, 'w') as file_:
+            json.dump(self.to_chrome_trace(), file_)
+
+    def __enter__(self):
+        self._previous.append(set_tracer(self))
+        return self
+
+    def __exit__(self, *args):
+        set_tracer(self._previous.pop())
+
+    def __repr__(self):
+        return '<biomart.Tracer spans={!r}>'.format(len(self._spans))
+
+
+class OpenTelemetryTracer(Tracer):
+    """Tracer forwarding spans to OpenTelemetry.
+
+    Spans are started as OpenTelemetry spans (using the tracer provider
+    configured for the application) instead of being recorded locally.
+    Note that spans of sub-queries running in other threads are not
+    nested under the span of their query, as the OpenTelemetry context is
+    not passed on to these threads.
+
+    Args:
+        tracer (opentelemetry.trace.Tracer): OpenTelemetry tracer to use.
+            Defaults to the tracer named 'pybiomart' from the global
+            tracer provider.
+
+    """
+
+    def __init__(self, tracer=None):
+        super().__init__()
+
+        if tracer is None:
+            try:
+                # pylint: disable=import-error
+                from opentelemetry import trace
+                # pylint: enable=import-error
+            except ImportError:
+                raise ImportError('OpenTelemetryTracer requires '
+                                  'opentelemetry-api to be installed')
+            tracer = trace.get_tracer('pybiomart')
+
+        self._tracer = tracer
+
+    @contextmanager
+    def span(self, name, **args):
+        attributes = {key: _format(value) for key, value in args.items()}
+        with self._tracer.start_as_current_span(name, attributes=attributes):
+            yield
+
+
+class _NullSpan(object):
+    """Span that does nothing, used if tracing is disabled."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def set_tracer(tracer):
+    """Sets the tracer recording spans (None disables tracing).
+
+    Args:
+        tracer (Tracer): Tracer to use for all threads.
+
+    Returns:
+        Tracer: The previously used tracer.
+
+    """
+    global _TRACER  # pylint: disable=global-statement
+    previous, _TRACER = _TRACER, tracer
+    return previous
+
+
+def get_tracer():
+    """Returns the current tracer (None if tracing is disabled)."""
+    return _TRACER
+
+
+def span(name, **args):
+    """Returns a context manager recording a span with the current tracer.
+
+    Args:
+        name (str): Name of the span.
+        **args: Attributes describing the span.
+
+    """
+    tracer = _TRACER
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, **args)
+
+
+def _format(value):
+    """Formats a span attribute, truncating long values."""
+
+    if isinstance(value, (int, float, bool)):
+        return value
+
+    value = str(value)
+    if len(value) > MAX_ARG_LENGTH:
+        value = value[:MAX_ARG_LENGTH - 3] + '...'
+    return value
@@ -0,0 +1,280 @@
+from __future__ import absolute_import, division, print_function
+
+# pylint: disable=wildcard-import,redefined-builtin,unused-wildcard-import
+from builtins import *
+# pylint: enable=wildcard-import,redefined-builtin,unused-wildcard-import
+
+import json
+import sqlite3
+import threading
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# pylint: disable=import-error
+from .cache import ResponseCache
+# pylint: enable=import-error
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    encoding TEXT,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class ReplayMiss(requests.ConnectionError):
+    """Exception raised if a replayed request is missing from the archive.
+
+    Misses are raised as connection errors, so that requests are retried
+    on the next mirror (which may have served the recorded request).
+    """
+    pass
+
+
+class Transport(object):
+    """Base class of transports, which send requests to biomart.
+
+    Every request of ServerBase (and therefore of servers, marts and
+    datasets) is sent using its transport, which allows requests to be
+    recorded or replayed without a network connection.
+    """
+
+    def send(self, method, url, params, timeout=None, stream=False,
+             headers=None):
+        """Sends a request.
+
+        Args:
+            method (str): Request method (get or post).
+            url (str): Url of the biomart service.
+            params (dict[str,any]): Parameters (or form data) of the request.
+            timeout (tuple[float,float]): Connect and read timeouts.
+            stream (bool): Whether to stream the response content.
+            headers (dict[str,str]): Additional headers of the request.
+
+        Returns:
+            requests.models.Response: Response to the request.
+
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Releases the resources held by the transport."""
+        pass
+
+
+class HttpTransport(Transport):
+    """Transport sending requests over http (the default transport)."""
+
+    def send(self, method, url, params, timeout=None, stream=False,
+             headers=None):
+        kwargs = {'stream': True} if stream else {}
+        if headers:
+            kwargs['headers'] = headers
+        if method == 'post':
+            return requests.post(url, data=params, timeout=timeout, **kwargs)
+        return requests.get(url, params=params, timeout=timeout, **kwargs)
+
+    def __repr__(self):
+        return '<biomart.HttpTransport>'
+
+
+class RecordingTransport(Transport):
+    """Transport recording requests and their responses in an archive.
+
+    Requests are sent using the wrapped transport, after which the request
+    and (zlib compressed) response are stored in a SQLite archive, which
+    can later be served by a ReplayTransport without a network connection.
+    Repeated requests are stored once, keeping their latest response.
+    Streamed responses are read completely before they are returned.
+
+    As cached responses are not sent using the transport, a session should
+    be recorded without (or with an empty) response cache to capture all
+    of its requests.
+
+    Args:
+        path (str): Path of the archive, which is created if needed.
+        transport (Transport): Transport used to send the requests.
+            Defaults to a HttpTransport.
+
+    Examples:
+        Recording a session:
+            >>> transport = RecordingTransport('session.sqlite')
+            >>> server = Server(host='http://www.ensembl.org',
+            >>>                 use_cache=False, transport=transport)
+            >>> mart = server['ENSEMBL_MART_ENSEMBL']
+            >>> dataset = mart['hsapiens_gene_ensembl']
+            >>> dataset.query(attributes=['ensembl_gene_id'])
+
+    """
+
+    def __init__(self, path, transport=None):
+        self._archive = _Archive(path)
+        self._transport = HttpTransport() if transport is None else transport
+
+    @property
+    def path(self):
+        """Path of the archive."""
+        return self._archive.path
+
+    def send(self, method, url, params, timeout=None, stream=False,
+             headers=None):
+        response = self._transport.send(method, url, params, timeout=timeout,
+                                        stream=stream, headers=headers)
+
+        # Reads the (streamed) content, which the response keeps in memory.
+        self._archive.store(method, url, params, response)
+
+        return response
+
+    def close(self):
+        self._archive.close()
+        self._transport.close()
+
+    def __repr__(self):
+        return '<biomart.RecordingTransport path={!r}>'.format(self.path)
+
+
+class ReplayTransport(Transport):
+    """Transport serving recorded responses from an archive.
+
+    Requests are answered using the responses recorded by a
+    RecordingTransport, without sending any requests. Requests that were
+    not recorded raise a ReplayMiss error.
+
+    Args:
+        path (str): Path of the archive.
+
+    Examples:
+        Replaying a recorded session:
+            >>> transport = ReplayTransport('session.sqlite')
+            >>> server = Server(host='http://www.ensembl.org',
+            >>>                 use_cache=False, transport=transport)
+
+    """
+
+    def __init__(self, path):
+        self._archive = _Archive(path)
+
+    @property
+    def path(self):
+        """Path of the archive."""
+        return self._archive.path
+
+    def send(self, method, url, params, timeout=None, stream=False,
+             headers=None):
+        response = self._archive.load(method, url, params)
+
+        if response is None:
+            raise ReplayMiss('Request to {} ({!r}) is not in archive {}'
+                             .format(url, params, self.path))
+
+        return response
+
+    def __len__(self):
+        return len(self._archive)
+
+    def close(self):
+        self._archive.close()
+
+    def __repr__(self):
+        return '<biomart.ReplayTransport path={!r}>'.format(self.path)
+
+
+class _Archive(object):
+    """SQLite archive of requests and (compressed) responses."""
+
+    def __init__(self, path):
+        self._path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        """Path of the archive."""
+        return self._path
+
+    def _connect(self):
+        # Called with the lock held; requests are sent from many threads.
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                self._path, timeout=60, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def store(self, method, url, params, response):
+        """Stores the response to a request."""
+
+        row = (ResponseCache.key(method, url, params), method.lower(), url,
+               json.dumps(_jsonable(params), sort_keys=True),
+               response.status_code, response.encoding,
+               json.dumps(dict(response.headers)),
+               zlib.compress(response.content))
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO exchanges (key, method, '
+                             'url, params, status, encoding, headers, '
+                             'content) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+
+    def load(self, method, url, params):
+        """Loads the recorded response to a request (None if missing)."""
+
+        key = ResponseCache.key(method, url, params)
+
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT status, encoding, headers, content FROM exchanges '
+                'WHERE key = ?', (key, )).fetchone()
+
+        if row is None:
+            return None
+
+        status, encoding, headers, content = row
+
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response.encoding = encoding
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        # pylint: disable=protected-access
+        response._content = zlib.decompress(content)
+        response._content_consumed = True
+        # pylint: enable=protected-access
+
+        return response
+
+    def close(self):
+        """Closes the connection to the archive."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute(
+                'SELECT COUNT(*) FROM exchanges').fetchone()[0]
+
+    def __getstate__(self):
+        # Connections are reopened by (unpickled) copies in other processes.
+        return {'path': self._path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+def _jsonable(params):
+    return {
+        name: value.decode('utf-8') if isinstance(value, bytes) else value
+        for name, value in params.items()
+    }
@@ -4,7 +4,8 @@ import pkg_resources
 
 import pytest
 
-from pybiomart import Server
+from pybiomart import Server, base
+from pybiomart.cache import ResponseCache
 
 BASE_DIR = path.dirname(__file__)
 
@@ -16,12 +17,25 @@ def data_path(relative_path, relative_to=BASE_DIR):
     return path.join(relative_to, 'data', relative_path)
 
 
+@pytest.fixture(autouse=True)
+def default_cache(mocker, tmpdir):
+    """Replaces the default response cache with an empty cache per test."""
+
+    cache = ResponseCache(str(tmpdir.join('default_cache')))
+    mocker.patch.object(base, 'DEFAULT_CACHE', cache)
+    return cache
+
+
 class MockResponse(object):
     """Mock response class."""
 
-    def __init__(self, text=''):
+    def __init__(self, text='', headers=None, status_code=200):
         self.text = text
         self.content = text.encode('utf-8')
+        self.headers = headers or {}
+        self.status_code = status_code
+        self.url = ''
+        self.encoding = 'utf-8'
 
     def raise_for_status(self):
         """Mock raise_for_status function."""
@@ -29,9 +43,34 @@ class MockResponse(object):
 
 
 @pytest.helpers.register
-def mock_response(text=''):
+def mock_response(text='', headers=None, status_code=200):
     """Helper function for creating a mock response."""
-    return MockResponse(text=text)
+    return MockResponse(text=text, headers=headers, status_code=status_code)
+
+
+class MockStreamResponse(object):
+    """Mock streamed response."""
+
+    def __init__(self, content, chunk_size=5):
+        self._content = content
+        self._chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        """Yields the content in (small) chunks."""
+        # pylint: disable=unused-argument
+        for i in range(0, len(self._content), self._chunk_size):
+            yield self._content[i:i + self._chunk_size]
+
+    def close(self):
+        """Marks the response as closed."""
+        self.closed = True
+
+
+@pytest.helpers.register
+def mock_stream_response(content, chunk_size=5):
+    """Helper function for creating a mock streamed response."""
+    return MockStreamResponse(content, chunk_size=chunk_size)
 
 
 @pytest.fixture
@@ -0,0 +1,182 @@
+import pandas as pd
+import pytest
+
+from pybiomart.annotation import AnnotationCache
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+GENES = {
+    'ENSMUSG01': [('Gene1', 'protein_coding')],
+    'ENSMUSG02': [('Gene2', 'lncRNA')],
+    'ENSMUSG03': [('Gene3a', 'protein_coding'), ('Gene3b', 'protein_coding')]
+}
+
+
+@pytest.fixture
+def cache(tmpdir):
+    """Annotation cache in a temporary directory."""
+    cache = AnnotationCache(str(tmpdir.join('annotations.sqlite')))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def mock_query(mocker, mock_dataset_with_config):
+    """Mocks dataset queries, returning rows for the requested genes."""
+
+    def _query(attributes, filters, **kwargs):
+        keys, = filters.values()
+        records = [(key, ) + row[:len(attributes) - 1]
+                   for key in keys for row in GENES.get(key, [])]
+        return pd.DataFrame.from_records(records, columns=attributes)
+
+    return mocker.patch.object(
+        mock_dataset_with_config, 'query', side_effect=_query)
+
+
+class TestAnnotate(object):
+    """Tests for the annotate method of datasets."""
+
+    def test_annotate(self, mock_dataset_with_config, mock_query, cache):
+        """Tests annotating a frame."""
+
+        frame = pd.DataFrame({'gene': ['ENSMUSG01', 'ENSMUSG03', 'ENSMUSG01',
+                                       'ENSMUSG04', None],
+                              'value': [1, 2, 3, 4, 5]})
+
+        result = mock_dataset_with_config.annotate(
+            frame, 'gene', ['external_gene_name', 'gene_biotype'],
+            key_attribute='ensembl_gene_id',
+            key_filter='link_ensembl_gene_id', cache=cache)
+
+        assert list(result.columns) == ['gene', 'value', 'external_gene_name',
+                                        'gene_biotype']
+        assert list(result['value']) == [1, 2, 2, 3, 4, 5]
+        assert list(result['external_gene_name'].fillna('-')) == [
+            'Gene1', 'Gene3a', 'Gene3b', 'Gene1', '-', '-']
+
+        # Keys are deduplicated before querying.
+        _, kwargs = mock_query.call_args
+        assert sorted(kwargs['filters']['link_ensembl_gene_id']) == [
+            'ENSMUSG01', 'ENSMUSG03', 'ENSMUSG04']
+        assert kwargs['attributes'] == ['ensembl_gene_id',
+                                        'external_gene_name', 'gene_biotype']
+
+    def test_cached(self, mock_dataset_with_config, mock_query, cache):
+        """Tests if only keys missing from the cache are queried."""
+
+        dataset = mock_dataset_with_config
+        args = (['external_gene_name'], )
+        kwargs = {'key_attribute': 'ensembl_gene_id',
+                  'key_filter': 'link_ensembl_gene_id', 'cache': cache}
+
+        first = pd.DataFrame({'gene': ['ENSMUSG01', 'ENSMUSG04']})
+        dataset.annotate(first, 'gene', *args, **kwargs)
+
+        # Second annotation only queries the unseen key.
+        second = pd.DataFrame({'gene': ['ENSMUSG01', 'ENSMUSG02',
+                                        'ENSMUSG04']})
+        result = dataset.annotate(second, 'gene', *args, **kwargs)
+
+        assert mock_query.call_count == 2
+        _, call_kwargs = mock_query.call_args
+        assert call_kwargs['filters'] == {'link_ensembl_gene_id':
+                                          ['ENSMUSG02']}
+
+        assert list(result['external_gene_name'].fillna('-')) == [
+            'Gene1', 'Gene2', '-']
+
+        # Fully cached annotations do not query at all.
+        dataset.annotate(second, 'gene', *args, **kwargs)
+        assert mock_query.call_count == 2
+
+    def test_cache_scope(self, mock_dataset_with_config, mock_query, cache):
+        """Tests if annotations of other attributes are not reused."""
+
+        dataset = mock_dataset_with_config
+        frame = pd.DataFrame({'ensembl_gene_id': ['ENSMUSG01']})
+
+        dataset.annotate(frame, 'ensembl_gene_id', ['external_gene_name'],
+                         key_filter='link_ensembl_gene_id', cache=cache)
+        result = dataset.annotate(
+            frame, 'ensembl_gene_id', ['external_gene_name', 'gene_biotype'],
+            key_filter='link_ensembl_gene_id', cache=cache)
+
+        assert mock_query.call_count == 2
+        assert list(result['gene_biotype']) == ['protein_coding']
+
+    def test_cache_path(self, mock_dataset_with_config, mock_query, tmpdir):
+        """Tests using a cache given by its path."""
+
+        dataset = mock_dataset_with_config
+        path = str(tmpdir.join('annotations.sqlite'))
+        frame = pd.DataFrame({'ensembl_gene_id': ['ENSMUSG02']})
+
+        for _ in range(2):
+            result = dataset.annotate(
+                frame, 'ensembl_gene_id', ['external_gene_name'],
+                key_filter='link_ensembl_gene_id', cache=path)
+
+        assert mock_query.call_count == 1
+        assert list(result['external_gene_name']) == ['Gene2']
+
+    def test_query(self, mocker, mock_dataset_with_config, cache):
+        """Tests annotation using an actual (mocked) query."""
+
+        dataset = mock_dataset_with_config
+
+        response = pytest.helpers.mock_response(
+            'Ensembl Gene ID\tAssociated Gene Name\n'
+            'ENSMUSG01\tGene1\nENSMUSG02\tGene2\n')
+        mocker.patch.object(dataset, 'post', return_value=response)
+
+        frame = pd.DataFrame({'ensembl_gene_id': ['ENSMUSG02', 'ENSMUSG01']})
+        result = dataset.annotate(
+            frame, 'ensembl_gene_id', ['external_gene_name'],
+            key_filter='link_ensembl_gene_id', cache=cache)
+
+        assert list(result['external_gene_name']) == ['Gene2', 'Gene1']
+
+    def test_float_keys(self, mocker, mock_dataset_with_config, cache):
+        """Tests annotation using integer keys in a float column."""
+
+        dataset = mock_dataset_with_config
+        mock_query = mocker.patch.object(
+            dataset, 'query', return_value=pd.DataFrame(
+                {'entrezgene': [19208], 'external_gene_name': ['Gene1']}))
+
+        # Missing values turn integer key columns into floats.
+        frame = pd.DataFrame({'entrezgene': [19208, None, 12345]})
+        assert frame['entrezgene'].dtype == 'float64'
+
+        for _ in range(2):
+            result = dataset.annotate(frame, 'entrezgene',
+                                      ['external_gene_name'], cache=cache)
+            assert list(result['external_gene_name'].fillna('-')) == [
+                'Gene1', '-', '-']
+
+        # Keys are queried as integers and cached once.
+        assert mock_query.call_count == 1
+        _, kwargs = mock_query.call_args
+        assert kwargs['filters'] == {'entrezgene': ['19208', '12345']}
+
+
+class TestAnnotationCache(object):
+    """Tests for the AnnotationCache class."""
+
+    def test_get_set(self, cache):
+        """Tests storing and looking up rows."""
+
+        cache.set('scope', {'a': [['x', 1]], 'b': []})
+
+        assert cache.get('scope', ['a', 'b', 'c']) == {'a': [['x', 1]],
+                                                       'b': []}
+        assert cache.get('other', ['a']) == {}
+
+    def test_many_keys(self, cache):
+        """Tests looking up more keys than fit in a single statement."""
+
+        keys = [str(i) for i in range(2000)]
+        cache.set('scope', {key: [[key]] for key in keys})
+
+        assert len(cache.get('scope', keys)) == 2000
@@ -0,0 +1,142 @@
+import pandas as pd
+import pytest
+
+from pybiomart import backends
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+pa = pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def tsv_response():
+    """Example TSV response with a low cardinality column."""
+
+    rows = ['ENSG{}\t{}\t{}'.format(i, 'protein_coding' if i % 2 else 'lncRNA',
+                                    i * 100) for i in range(10)]
+    text = '\n'.join(['Gene stable ID\tBiotype\tStart'] + rows) + '\n'
+    return pytest.helpers.mock_response(text)
+
+
+class TestReadTsv(object):
+    """Tests for the read_tsv function."""
+
+    def test_pandas(self, tsv_response):
+        """Tests parsing into a pandas DataFrame."""
+
+        result = backends.read_tsv(tsv_response)
+
+        assert isinstance(result, pd.DataFrame)
+        assert result.shape == (10, 3)
+
+    def test_arrow(self, tsv_response):
+        """Tests parsing into a dictionary encoded Arrow table."""
+
+        result = backends.read_tsv(tsv_response, backend='arrow')
+
+        assert result.num_rows == 10
+        assert pa.types.is_dictionary(result.schema.field('Biotype').type)
+        assert pa.types.is_integer(result.schema.field('Start').type)
+
+    def test_arrow_dtypes(self, tsv_response):
+        """Tests parsing into an Arrow table with given types."""
+
+        result = backends.read_tsv(
+            tsv_response, backend='arrow', dtypes={'Start': str})
+
+        assert pa.types.is_string(result.schema.field('Start').type)
+
+    def test_arrow_invalid_dtypes(self, tsv_response):
+        """Tests parsing into an Arrow table with invalid types."""
+
+        with pytest.raises(ValueError):
+            backends.read_tsv(
+                tsv_response, backend='arrow', dtypes={'Start': 'hello'})
+
+    @pytest.mark.parametrize('backend', ['pandas', 'arrow'])
+    def test_empty(self, backend):
+        """Tests parsing an empty response into an empty result."""
+
+        result = backends.read_tsv(
+            pytest.helpers.mock_response(''), backend=backend,
+            names=['Gene stable ID', 'Start'], dtypes={'Start': 'int64'})
+
+        if backend == 'pandas':
+            assert list(result.columns) == ['Gene stable ID', 'Start']
+            assert len(result) == 0
+            assert result.dtypes['Start'] == 'int64'
+        else:
+            assert result.column_names == ['Gene stable ID', 'Start']
+            assert result.num_rows == 0
+            assert pa.types.is_integer(result.schema.field('Start').type)
+
+    def test_empty_file(self, tmpdir):
+        """Tests parsing an empty file into an empty result."""
+
+        path = tmpdir.join('part.tsv')
+        path.write('')
+
+        result = backends.read_tsv_file(str(path), names=['Gene stable ID'])
+
+        assert list(result.columns) == ['Gene stable ID']
+        assert len(result) == 0
+
+
+class TestConcat(object):
+    """Tests for combining Arrow results."""
+
+    def test_mixed_encoding(self):
+        """Tests concatenating tables with differently encoded columns."""
+
+        encoded = pa.table({'a': pa.array(['x', 'y']).dictionary_encode()})
+        plain = pa.table({'a': pa.array(['z'])})
+
+        result = backends.concat([encoded, plain], backend='arrow')
+
+        assert result.column('a').to_pylist() == ['x', 'y', 'z']
+
+    def test_empty(self, tsv_response):
+        """Tests concatenating tables with an empty table."""
+
+        table = backends.read_tsv(tsv_response, backend='arrow')
+        empty = backends.empty(table.column_names, backend='arrow')
+
+        result = backends.concat([empty, table], backend='arrow')
+
+        assert result.num_rows == 10
+        assert result.schema == table.schema
+
+    def test_drop_duplicates(self):
+        """Tests dropping duplicate rows from tables."""
+
+        tables = [pa.table({'a': pa.array(['x', 'y']).dictionary_encode()}),
+                  pa.table({'a': pa.array(['y', 'x']).dictionary_encode()})]
+
+        result = backends.drop_duplicates(
+            backends.concat(tables, backend='arrow'), backend='arrow')
+
+        assert result.column('a').to_pylist() == ['x', 'y']
+        assert pa.types.is_dictionary(result.schema.field('a').type)
+
+    def test_drop_duplicates_order(self):
+        """Tests if rows keep the order of their first occurrence."""
+
+        frame = pd.DataFrame({'a': ['z', 'x', 'z', 'y', 'x', None, None],
+                              'b': [3, 1, 3, 2, 1, 0, 0]})
+
+        result = backends.drop_duplicates(
+            pa.Table.from_pandas(frame, preserve_index=False),
+            backend='arrow')
+        expected = backends.drop_duplicates(frame)
+
+        assert result.to_pandas().equals(expected)
+
+
+class TestCheckBackend(object):
+    """Tests for the check_backend function."""
+
+    def test_invalid(self):
+        """Tests checking an invalid backend."""
+
+        with pytest.raises(ValueError):
+            backends.check_backend('invalid')
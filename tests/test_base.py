@@ -1,7 +1,11 @@
+import threading
+
 import pytest
 import requests
 
-from pybiomart import base
+from pybiomart import base, routing
+from pybiomart.cache import ResponseCache
+from pybiomart.governor import Governor
 
 # pylint: disable=redefined-outer-name, no-self-use
 
@@ -65,7 +69,8 @@ class TestBase(object):
         base_obj = base.ServerBase()
         base_obj.get()
 
-        mock_get.assert_called_once_with(default_url, params={})
+        mock_get.assert_called_once_with(
+            default_url, params={}, timeout=base.DEFAULT_TIMEOUT)
 
     def test_get_with_params(self, mocker, default_url):
         """Tests get invocation with custom parameters."""
@@ -77,4 +82,467 @@ class TestBase(object):
         base_obj = base.ServerBase()
         base_obj.get(test=True)
 
-        mock_get.assert_called_once_with(default_url, params={'test': True})
+        mock_get.assert_called_once_with(
+            default_url, params={'test': True}, timeout=base.DEFAULT_TIMEOUT)
+
+    def test_mirrors(self):
+        """Tests instantation with multiple hosts."""
+
+        base_obj = base.ServerBase(
+            host=['www.ensembl.org', 'http://useast.ensembl.org/'])
+
+        assert base_obj.hosts == ['http://www.ensembl.org',
+                                  'http://useast.ensembl.org']
+
+    def test_get_mirrors(self, mocker):
+        """Tests routing of requests to the fastest mirror."""
+
+        mocker.patch.dict(routing._ROUTERS, clear=True)
+
+        req = pytest.helpers.mock_response()
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase(host=['http://a', 'http://b'])
+        router = routing.get_router(base_obj.hosts)
+        router.record_success('http://a', 1.0)
+        router.record_success('http://b', 0.1)
+        router._probed = True
+
+        base_obj.get(test=True)
+
+        assert base_obj.host == 'http://b'
+        mock_get.assert_called_once_with(
+            'http://b:80/biomart/martservice', params={'test': True},
+            timeout=base.DEFAULT_TIMEOUT)
+
+    def test_get_failover(self, mocker):
+        """Tests failing over to another mirror."""
+
+        mocker.patch.dict(routing._ROUTERS, clear=True)
+
+        req = pytest.helpers.mock_response()
+        mock_get = mocker.patch.object(
+            requests, 'get', side_effect=[requests.ConnectionError(), req])
+
+        base_obj = base.ServerBase(host=['http://a', 'http://b'])
+        routing.get_router(base_obj.hosts)._probed = True
+
+        assert base_obj.get() is req
+        assert mock_get.call_count == 2
+        assert base_obj.host == 'http://b'
+
+    def test_get_failover_all(self, mocker):
+        """Tests failure of all mirrors."""
+
+        mocker.patch.dict(routing._ROUTERS, clear=True)
+
+        mocker.patch.object(
+            requests, 'get', side_effect=requests.ConnectionError())
+
+        base_obj = base.ServerBase(host=['http://a', 'http://b'])
+        routing.get_router(base_obj.hosts)._probed = True
+
+        with pytest.raises(requests.ConnectionError):
+            base_obj.get()
+
+    def test_probe_hosts(self, mocker):
+        """Tests probing of mirrors before the first request."""
+
+        mocker.patch.dict(routing._ROUTERS, clear=True)
+
+        req = pytest.helpers.mock_response()
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase(host=['http://a', 'http://b'])
+        base_obj.get()
+
+        # Two probes, followed by the actual request.
+        assert mock_get.call_count == 3
+        assert set(routing.get_router(base_obj.hosts).latencies) == {
+            'http://a', 'http://b'
+        }
+
+    def test_get_governor(self, mocker, default_url):
+        """Tests get invocation limited by a governor."""
+
+        req = pytest.helpers.mock_response()
+        mocker.patch.object(requests, 'get', return_value=req)
+
+        governor = Governor()
+        mock_acquire = mocker.spy(governor, 'acquire')
+        mock_release = mocker.spy(governor, 'release')
+
+        base_obj = base.ServerBase(governor=governor)
+        base_obj.get()
+
+        mock_acquire.assert_called_once_with(base.DEFAULT_HOST, deadline=None)
+        assert mock_release.call_count == 1
+
+    def test_get_governor_deadline(self, mocker):
+        """Tests limiting timeouts after waiting for the governor."""
+
+        req = pytest.helpers.mock_response()
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        governor = Governor()
+        acquire = governor.acquire
+
+        def _slow_acquire(host, deadline=None):
+            base.time.sleep(0.3)
+            return acquire(host, deadline=deadline)
+
+        mocker.patch.object(governor, 'acquire', side_effect=_slow_acquire)
+
+        base_obj = base.ServerBase(timeout=(10, 300), governor=governor)
+
+        with base.deadline_scope(base.Deadline(1)):
+            base_obj.get()
+
+        _, kwargs = mock_get.call_args
+        assert kwargs['timeout'][1] <= 0.7
+
+    def test_get_governor_latency(self, mocker):
+        """Tests that routing latencies exclude waiting for the governor."""
+
+        mocker.patch.dict(routing._ROUTERS, clear=True)
+        mocker.patch.object(requests, 'get',
+                            return_value=pytest.helpers.mock_response())
+
+        governor = Governor()
+        acquire = governor.acquire
+
+        def _slow_acquire(host, deadline=None):
+            base.time.sleep(0.3)
+            return acquire(host, deadline=deadline)
+
+        mocker.patch.object(governor, 'acquire', side_effect=_slow_acquire)
+
+        base_obj = base.ServerBase(governor=governor)
+        router = routing.get_router(base_obj.hosts)
+        mock_record = mocker.spy(router, 'record_success')
+
+        base_obj.get()
+
+        host, latency = mock_record.call_args[0]
+        assert host == base.DEFAULT_HOST
+        assert latency < 0.3
+
+    def test_get_governor_deadline_expired(self, mocker):
+        """Tests that requests waiting for the governor stop at deadlines."""
+
+        mock_get = mocker.patch.object(requests, 'get')
+
+        governor = Governor()
+        governor.acquire(base.DEFAULT_HOST)
+
+        base_obj = base.ServerBase(governor=governor)
+
+        with pytest.raises(base.DeadlineExceeded):
+            with base.deadline_scope(base.Deadline(0.2)):
+                base_obj.get()
+
+        assert not mock_get.called
+
+    def test_get_timeout(self, mocker, default_url):
+        """Tests get invocation with custom timeout."""
+
+        req = pytest.helpers.mock_response()
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase(timeout=20)
+        base_obj.get()
+
+        assert base_obj.timeout == (20, 20)
+        mock_get.assert_called_once_with(
+            default_url, params={}, timeout=(20, 20))
+
+    def test_get_deadline(self, mocker, default_url):
+        """Tests limiting timeouts to the remaining time of a deadline."""
+
+        req = pytest.helpers.mock_response()
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase(timeout=(10, 300))
+
+        with base.deadline_scope(base.Deadline(30)):
+            base_obj.get()
+
+        _, kwargs = mock_get.call_args
+        assert kwargs['timeout'][0] == 10
+        assert 29 < kwargs['timeout'][1] <= 30
+
+    def test_get_deadline_expired(self, mocker):
+        """Tests get invocation after a deadline has passed."""
+
+        mock_get = mocker.patch.object(requests, 'get')
+
+        base_obj = base.ServerBase()
+
+        with pytest.raises(base.DeadlineExceeded):
+            with base.deadline_scope(base.Deadline(-1)):
+                base_obj.get()
+
+        assert not mock_get.called
+
+    def test_get_deadline_timeout(self, mocker):
+        """Tests that request timeouts after the deadline are reported."""
+
+        def _timeout(*args, **kwargs):
+            deadline.cancel()
+            raise requests.Timeout()
+
+        mocker.patch.object(requests, 'get', side_effect=_timeout)
+
+        base_obj = base.ServerBase()
+        deadline = base.Deadline(60)
+
+        with pytest.raises(base.DeadlineExceeded):
+            with base.deadline_scope(deadline):
+                base_obj.get()
+
+    def test_post(self, mocker, default_url):
+        """Tests post invocation."""
+
+        req = pytest.helpers.mock_response()
+        mock_post = mocker.patch.object(requests, 'post', return_value=req)
+
+        base_obj = base.ServerBase()
+        base_obj.post(query='<Query />')
+
+        mock_post.assert_called_once_with(
+            default_url, data={'query': '<Query />'},
+            timeout=base.DEFAULT_TIMEOUT)
+
+    def test_get_cached(self, mocker, tmpdir, default_url):
+        """Tests if repeated requests are served from the cache."""
+
+        req = requests.Response()
+        req.status_code = 200
+        req._content = b'test'
+        req.encoding = 'utf-8'
+
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        cache = ResponseCache(str(tmpdir))
+        base_obj = base.ServerBase(use_cache=cache)
+
+        assert base_obj.use_cache
+        assert base_obj.cache is cache
+
+        assert base_obj.get(type='registry').text == 'test'
+        cached = base_obj.get(type='registry')
+
+        assert cached.text == 'test'
+        assert cached.from_cache
+        assert mock_get.call_count == 1
+
+    def test_get_cached_default(self, mocker, default_cache):
+        """Tests if responses are stored in the default cache."""
+
+        req = pytest.helpers.mock_response('test')
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase()
+        assert base_obj.cache is default_cache
+
+        base_obj.get(type='registry')
+        cached = base_obj.get(type='registry')
+
+        assert cached.text == 'test'
+        assert cached.from_cache
+        assert mock_get.call_count == 1
+
+    def test_get_not_cached_error(self, mocker, tmpdir):
+        """Tests if responses other than 200 OK are not cached."""
+
+        req = pytest.helpers.mock_response('busy', status_code=202)
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase(use_cache=ResponseCache(str(tmpdir)))
+        base_obj.get(type='registry')
+        base_obj.get(type='registry')
+
+        assert mock_get.call_count == 2
+
+    def test_get_uncached(self, mocker, tmpdir):
+        """Tests if errors and disabled caches are not cached."""
+
+        req = requests.Response()
+        req.status_code = 200
+        req._content = b'test'
+
+        mock_get = mocker.patch.object(requests, 'get', return_value=req)
+
+        base_obj = base.ServerBase(use_cache=False)
+
+        assert not base_obj.use_cache
+        assert base_obj.cache is None
+
+        base_obj.get(type='registry')
+        base_obj.get(type='registry')
+
+        assert mock_get.call_count == 2
+
+    def test_metadata_stale(self, mocker):
+        """Tests if stale metadata is returned whilst it is refreshed."""
+
+        base_obj = base.ServerBase(metadata_ttl=60)
+        base_obj._marts = None
+
+        load = mocker.Mock(side_effect=[{'old': 1}, {'new': 2}])
+
+        assert base_obj._metadata('_marts', load) == {'old': 1}
+        assert base_obj._metadata('_marts', load) == {'old': 1}
+        assert load.call_count == 1
+
+        # Expire the metadata, which should start a background refresh.
+        base_obj._loaded['_marts'] -= 120
+
+        assert base_obj._metadata('_marts', load) == {'old': 1}
+        _join_refresh()
+
+        assert base_obj._metadata('_marts', load) == {'new': 2}
+        assert load.call_count == 2
+
+    def test_metadata_refresh_failed(self, mocker):
+        """Tests if stale metadata is kept if the refresh fails."""
+
+        base_obj = base.ServerBase(metadata_ttl=60)
+        base_obj._marts = None
+
+        load = mocker.Mock(side_effect=[{'old': 1}, IOError('Unavailable')])
+
+        base_obj._metadata('_marts', load)
+        base_obj._loaded['_marts'] -= 120
+
+        with pytest.warns(RuntimeWarning):
+            base_obj._metadata('_marts', load)
+            _join_refresh()
+
+        assert base_obj._metadata('_marts', load) == {'old': 1}
+        assert load.call_count == 2
+
+    def test_metadata_refresh_uncached(self, mocker, tmpdir):
+        """Tests if refreshes bypass (and update) cached responses."""
+
+        responses = []
+        for content in [b'old', b'new']:
+            req = requests.Response()
+            req.status_code = 200
+            req._content = content
+            req.encoding = 'utf-8'
+            responses.append(req)
+
+        mock_get = mocker.patch.object(
+            requests, 'get', side_effect=responses)
+
+        base_obj = base.ServerBase(
+            use_cache=ResponseCache(str(tmpdir)), metadata_ttl=60)
+        base_obj._marts = None
+
+        def _load():
+            return base_obj.get(type='registry').text
+
+        assert base_obj._metadata('_marts', _load) == 'old'
+
+        base_obj._loaded['_marts'] -= 120
+        base_obj._metadata('_marts', _load)
+        _join_refresh()
+
+        assert base_obj._metadata('_marts', _load) == 'new'
+        assert base_obj.get(type='registry').text == 'new'
+        assert mock_get.call_count == 2
+
+    def test_metadata_refresh_conditional(self, mocker, tmpdir,
+                                          default_url):
+        """Tests if refreshes revalidate cached responses with validators."""
+
+        req = requests.Response()
+        req.status_code = 200
+        req._content = b'config'
+        req.encoding = 'utf-8'
+        req.headers['ETag'] = '"v1"'
+
+        not_modified = requests.Response()
+        not_modified.status_code = 304
+
+        mock_get = mocker.patch.object(
+            requests, 'get', side_effect=[req, not_modified])
+
+        base_obj = base.ServerBase(
+            use_cache=ResponseCache(str(tmpdir)), metadata_ttl=60)
+        base_obj._marts = None
+
+        def _load():
+            return base_obj.get(type='registry').text
+
+        assert base_obj._metadata('_marts', _load) == 'config'
+
+        base_obj._loaded['_marts'] -= 120
+        base_obj._metadata('_marts', _load)
+        _join_refresh()
+
+        assert base_obj._metadata('_marts', _load) == 'config'
+        mock_get.assert_called_with(
+            default_url, params={'type': 'registry'},
+            timeout=base.DEFAULT_TIMEOUT, headers={'If-None-Match': '"v1"'})
+
+
+def _join_refresh():
+    """Waits for background refreshes to finish."""
+    for thread in threading.enumerate():
+        if thread.name == 'pybiomart-refresh':
+            thread.join()
+
+
+class TestDeadline(object):
+    """Tests for the Deadline class."""
+
+    def test_unbounded(self):
+        """Tests deadline without time limit."""
+
+        deadline = base.Deadline()
+
+        assert deadline.remaining() is None
+        assert not deadline.expired
+        assert deadline.limit_timeout((1, 2)) == (1, 2)
+
+    def test_expiry(self):
+        """Tests expiry of a deadline."""
+
+        assert base.Deadline(-1).expired
+        assert not base.Deadline(60).expired
+
+        with pytest.raises(base.DeadlineExceeded):
+            base.Deadline(-1).check()
+
+    def test_parent(self):
+        """Tests deadlines limited by their parent."""
+
+        parent = base.Deadline(10)
+        child = base.Deadline(60, parent=parent)
+
+        assert child.remaining() <= 10
+
+        parent.cancel()
+        assert child.expired
+
+    def test_cancel_child(self):
+        """Tests that cancelling a child does not cancel its parent."""
+
+        parent = base.Deadline()
+        child = base.Deadline(parent=parent)
+        child.cancel()
+
+        assert child.cancelled
+        assert not parent.cancelled
+
+    def test_scope(self):
+        """Tests setting the deadline of the current thread."""
+
+        deadline = base.Deadline()
+
+        assert base.current_deadline() is None
+        with base.deadline_scope(deadline):
+            assert base.current_deadline() is deadline
+        assert base.current_deadline() is None
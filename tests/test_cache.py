@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+
+import requests
+
+from pybiomart.cache import ResponseCache
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+def _response(content, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = 'http://www.ensembl.org/biomart/martservice'
+    response.encoding = 'utf-8'
+    response.headers['Content-Type'] = 'text/plain'
+    response._content = content
+    return response
+
+
+def _read_write(args):
+    path, index = args
+
+    cache = ResponseCache(path)
+    key = ResponseCache.key('get', 'url', {'index': index % 4})
+
+    cache.set(key, _response(u'value {}'.format(index % 4).encode('utf-8')))
+    return cache.get(key).text
+
+
+class TestResponseCache(object):
+    """Tests for the ResponseCache class."""
+
+    def test_get_set(self, tmpdir):
+        """Tests storing and retrieving a response."""
+
+        cache = ResponseCache(str(tmpdir.join('cache')))
+        key = cache.key('post', 'url', {'query': b'<Query />'})
+
+        assert cache.get(key) is None
+
+        cache.set(key, _response(b'a\tb\n'))
+        response = cache.get(key)
+
+        assert response.from_cache
+        assert response.status_code == 200
+        assert response.content == b'a\tb\n'
+        assert response.text == 'a\tb\n'
+        assert response.headers['content-type'] == 'text/plain'
+
+    def test_key(self):
+        """Tests if keys depend on method, url and (unordered) params."""
+
+        key = ResponseCache.key('get', 'url', {'a': 1, 'b': 2})
+
+        assert key == ResponseCache.key('GET', 'url', {'b': 2, 'a': 1})
+        assert key != ResponseCache.key('post', 'url', {'a': 1, 'b': 2})
+        assert key != ResponseCache.key('get', 'other', {'a': 1, 'b': 2})
+        assert key != ResponseCache.key('get', 'url', {'a': 1, 'b': 3})
+
+    def test_sharded(self, tmpdir):
+        """Tests if entries are stored in shards without temporary files."""
+
+        cache = ResponseCache(str(tmpdir))
+        key = cache.key('get', 'url', {})
+
+        cache.set(key, _response(b'first'))
+        cache.set(key, _response(b'second'))
+
+        assert os.listdir(str(tmpdir)) == [key[:2]]
+        assert os.listdir(str(tmpdir.join(key[:2]))) == [key[2:]]
+        assert cache.get(key).content == b'second'
+
+    def test_corrupt(self, tmpdir):
+        """Tests if unreadable entries are treated as missing."""
+
+        cache = ResponseCache(str(tmpdir))
+        key = cache.key('get', 'url', {})
+
+        tmpdir.mkdir(key[:2]).join(key[2:]).write(b'invalid\n', mode='wb')
+
+        assert cache.get(key) is None
+
+    def test_clear(self, tmpdir):
+        """Tests clearing the cache."""
+
+        cache = ResponseCache(str(tmpdir.join('cache')))
+        key = cache.key('get', 'url', {})
+
+        cache.set(key, _response(b'test'))
+        cache.clear()
+
+        assert cache.get(key) is None
+
+    def test_processes(self, tmpdir):
+        """Tests concurrent use of the cache by several processes."""
+
+        pool = multiprocessing.Pool(4)
+        try:
+            results = pool.map(_read_write,
+                               [(str(tmpdir), i) for i in range(40)])
+        finally:
+            pool.close()
+            pool.join()
+
+        assert results == ['value {}'.format(i % 4) for i in range(40)]
@@ -1,7 +1,16 @@
+from functools import partial
+import pickle
+import threading
+
+from future.moves.urllib.parse import urlencode
 import pytest
+import requests
 
-from pybiomart import Dataset
+from pybiomart import Dataset, Governor, planning, routing
+from pybiomart.base import (BiomartException, DeadlineExceeded, ServerBase,
+                            current_deadline)
 from pybiomart.server import Server
+from pybiomart.shared import SharedResult
 
 # pylint: disable=redefined-outer-name, no-self-use
 
@@ -65,6 +74,116 @@ class TestDatasetStatic(object):
         assert filt.name == 'chromosome_name'
         assert filt.type == 'list'
         assert filt.description == ''
+        assert {'1', 'X', 'MT'} <= set(filt.options)
+
+    def test_pickle(self, mocker, mock_dataset_with_config):
+        """Tests if pickled datasets keep their configuration."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_dataset._governor = Governor()
+
+        # Remove mocked methods, which cannot be pickled.
+        mocker.stopall()
+
+        pickled = pickle.dumps(mock_dataset)
+        restored = pickle.loads(pickled)
+
+        # Configuration is stored in a packed form.
+        assert len(pickled) < len(pickle.dumps(
+            (mock_dataset.attributes, mock_dataset.filters)))
+
+        mock_get = mocker.patch.object(restored, 'get')
+
+        assert restored.name == mock_dataset.name
+        assert restored.hosts == mock_dataset.hosts
+        assert restored.governor.rate == mock_dataset.governor.rate
+        assert restored._router is routing.get_router(restored.hosts)
+
+        assert (sorted(restored.attributes) ==
+                sorted(mock_dataset.attributes))
+        assert (sorted(restored.default_attributes) ==
+                sorted(mock_dataset.default_attributes))
+
+        attr = restored.attributes['ensembl_gene_id']
+        assert attr.display_name == 'Ensembl Gene ID'
+
+        filter_ = restored.filters['chromosome_name']
+        assert filter_.options == mock_dataset.filters[
+            'chromosome_name'].options
+
+        assert not mock_get.called
+
+    def test_pickle_without_config(self, mocker, mock_dataset):
+        """Tests pickling datasets whose configuration was not fetched."""
+
+        restored = pickle.loads(pickle.dumps(mock_dataset))
+
+        mock_get = mocker.patch.object(restored, 'get')
+        mock_get.side_effect = BiomartException('fetched')
+
+        with pytest.raises(BiomartException):
+            restored.attributes
+
+    def test_refresh_configuration(self, mocker, mock_dataset_with_config):
+        """Tests if stale configurations are refreshed in the background."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_dataset._metadata_ttl = 60
+
+        assert 'ensembl_gene_id' in mock_dataset.attributes
+
+        _mock_metadata(mocker, mock_dataset, registry='v2', config=(
+            '<DatasetConfig><AttributePage><AttributeDescription '
+            'internalName="new_id" default="true"/></AttributePage>'
+            '</DatasetConfig>'))
+        mock_dataset._loaded['_configuration'] -= 120
+
+        # Stale configuration is returned until the refresh completes.
+        assert 'ensembl_gene_id' in mock_dataset.attributes
+        _join_refresh()
+
+        assert list(mock_dataset.attributes) == ['new_id']
+        assert list(mock_dataset.default_attributes) == ['new_id']
+        assert mock_dataset.filters == {}
+
+    def test_refresh_unchanged_registry(self, mocker, mock_dataset,
+                                        dataset_config_response):
+        """Tests if configurations are reused if the registry is unchanged."""
+
+        mock_dataset._metadata_ttl = 60
+
+        mock_get = _mock_metadata(mocker, mock_dataset, registry='v1',
+                                  config=dataset_config_response.text)
+        configuration = mock_dataset._fetch_configuration()
+        mock_dataset._configuration = configuration
+
+        assert mock_dataset._fetch_configuration() is configuration
+
+        # Only the registry should have been fetched again.
+        assert mock_get.call_count == 3
+
+    def test_refresh_unchanged_content(self, mocker, mock_dataset,
+                                       dataset_config_response):
+        """Tests if unchanged configurations are not parsed again."""
+
+        mock_dataset._metadata_ttl = 60
+
+        _mock_metadata(mocker, mock_dataset, registry='v1',
+                       config=dataset_config_response.text)
+        configuration = mock_dataset._fetch_configuration()
+        mock_dataset._configuration = configuration
+
+        # New registry, but identical configuration.
+        _mock_metadata(mocker, mock_dataset, registry='v2',
+                       config=dataset_config_response.text)
+        mock_parse = mocker.patch.object(
+            mock_dataset, '_filters_from_xml', return_value=[])
+
+        refreshed = mock_dataset._fetch_configuration()
+
+        assert refreshed.filters is configuration.filters
+        assert refreshed.version != configuration.version
+        assert not mock_parse.called
 
     def test_query(self, mocker, mock_dataset_with_config, query_params,
                    dataset_query_response):
@@ -72,8 +191,8 @@ class TestDatasetStatic(object):
 
         mock_dataset = mock_dataset_with_config
 
-        mock_get = mocker.patch.object(
-            mock_dataset, 'get', return_value=dataset_query_response)
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
 
         # Perform query.
         res = mock_dataset.query(**query_params)
@@ -83,15 +202,83 @@ class TestDatasetStatic(object):
         assert 'Ensembl Gene ID' in res
 
         # Check query xml.
-        query = b"""<Query datasetConfigVersion="0.6" formatter="TSV"
- header="1" uniqueRows="1" virtualSchemaName="default">
-<Dataset interface="default" name="mmusculus_gene_ensembl">
+        query = b"""<Query virtualSchemaName="default" formatter="TSV"
+ header="1" uniqueRows="1" datasetConfigVersion="0.6">
+<Dataset name="mmusculus_gene_ensembl" interface="default">
 <Attribute name="ensembl_gene_id" />
 <Filter name="chromosome_name" value="1" />
 </Dataset></Query>"""
         query = b''.join(query.split(b'\n'))
 
-        mock_get.assert_called_once_with(query=query)
+        mock_post.assert_called_once_with(query=query)
+
+    def test_query_get(self, mocker, mock_dataset_with_config, query_params,
+                       dataset_query_response):
+        """Tests example query submitted using a get request."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_dataset._use_post = False
+
+        mock_get = mocker.patch.object(
+            mock_dataset, 'get', return_value=dataset_query_response)
+
+        res = mock_dataset.query(**query_params)
+
+        assert len(res) > 0
+        assert mock_get.call_count == 1
+        assert b'<Query' in mock_get.call_args[1]['query']
+
+    @pytest.mark.parametrize('use_post,max_size',
+                             [(True, planning.MAX_POST_QUERY_SIZE),
+                              (False, planning.MAX_GET_QUERY_SIZE)])
+    def test_query_size_chunks(self, mocker, mock_dataset_with_config,
+                               dataset_query_response, use_post, max_size):
+        """Tests splitting of queries exceeding the maximum request size."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_dataset._use_post = use_post
+
+        mock_submit = mocker.patch.object(
+            mock_dataset, 'get' if not use_post else 'post',
+            return_value=dataset_query_response)
+
+        gene_ids = ['ENSMUSG{:011d}'.format(i) for i in range(5000)]
+        mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'link_ensembl_gene_id': gene_ids})
+
+        queries = [args[1]['query'] for args in mock_submit.call_args_list]
+
+        if use_post:
+            assert all(len(query) <= max_size for query in queries)
+            assert mock_submit.call_count == 1
+        else:
+            # Get requests are limited by the size of the encoded query.
+            assert all(len(urlencode({'query': query})) <= max_size
+                       for query in queries)
+            assert mock_submit.call_count > 1
+
+    def test_query_size_chunked(self, mocker, mock_dataset_with_config,
+                                dataset_query_response):
+        """Tests splitting of chunks exceeding the maximum request size."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_dataset._use_post = False
+
+        mock_get = mocker.patch.object(
+            mock_dataset, 'get', return_value=dataset_query_response)
+
+        gene_ids = ['ENSMUSG{:011d}'.format(i) for i in range(500)]
+        mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'link_ensembl_gene_id': gene_ids},
+            chunk_size=250, n_jobs=1)
+
+        queries = [args[1]['query'] for args in mock_get.call_args_list]
+
+        assert mock_get.call_count > 2
+        assert all(len(urlencode({'query': query})) <=
+                   planning.MAX_GET_QUERY_SIZE for query in queries)
 
     def test_query_attr_name(self, mocker, mock_dataset_with_config,
                              query_params, dataset_query_response):
@@ -100,7 +287,7 @@ class TestDatasetStatic(object):
         mock_dataset = mock_dataset_with_config
 
         mocker.patch.object(
-            mock_dataset, 'get', return_value=dataset_query_response)
+            mock_dataset, 'post', return_value=dataset_query_response)
 
         # Perform query.
         res = mock_dataset.query(use_attr_names=True, **query_params)
@@ -116,7 +303,7 @@ class TestDatasetStatic(object):
         mock_dataset = mock_dataset_with_config
 
         mock_get = mocker.patch.object(
-            mock_dataset, 'get', return_value=dataset_query_response)
+            mock_dataset, 'post', return_value=dataset_query_response)
 
         data_types = {'Ensembl Gene ID': str}
         query_params['dtypes'] = data_types
@@ -135,7 +322,7 @@ class TestDatasetStatic(object):
         mock_dataset = mock_dataset_with_config
 
         mock_get = mocker.patch.object(
-            mock_dataset, 'get', return_value=dataset_query_response)
+            mock_dataset, 'post', return_value=dataset_query_response)
 
         data_types = {'Ensembl Gene ID': 'hello'}
         query_params['dtypes'] = data_types
@@ -145,6 +332,516 @@ class TestDatasetStatic(object):
             res = mock_dataset.query(**query_params)
 
 
+    def test_count(self, mocker, mock_dataset_with_config, query_params):
+        """Tests example count query."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mock_get = mocker.patch.object(
+            mock_dataset, 'post',
+            return_value=pytest.helpers.mock_response('1234\n'))
+
+        count = mock_dataset.count(filters=query_params['filters'])
+        assert count == 1234
+
+        query = b"""<Query virtualSchemaName="default" formatter="TSV"
+ header="0" uniqueRows="1" count="1" datasetConfigVersion="0.6">
+<Dataset name="mmusculus_gene_ensembl" interface="default">
+<Filter name="chromosome_name" value="1" />
+</Dataset></Query>"""
+        query = b''.join(query.split(b'\n'))
+
+        mock_get.assert_called_once_with(query=query)
+
+    def test_count_error(self, mocker, mock_dataset_with_config):
+        """Tests count query returning an error."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mocker.patch.object(
+            mock_dataset, 'post',
+            return_value=pytest.helpers.mock_response('Query ERROR: oops'))
+
+        with pytest.raises(BiomartException):
+            mock_dataset.count()
+
+    def test_query_chunked(self, mocker, mock_dataset_with_config,
+                           dataset_query_response):
+        """Tests query split into chunks of filter values."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mock_get = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        res = mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': ['1', '2', '3']},
+            chunk_size=2)
+
+        # Identical chunk results should be deduplicated.
+        assert len(res) == len(dataset_query_response.text.split()) - 3
+        assert mock_get.call_count == 2
+
+    @pytest.mark.parametrize('backend', ['pandas', 'arrow'])
+    def test_query_chunked_empty(self, mocker, mock_dataset_with_config,
+                                 dataset_query_response, backend):
+        """Tests chunked query in which a chunk has no results."""
+
+        if backend == 'arrow':
+            pytest.importorskip('pyarrow')
+
+        mock_dataset = mock_dataset_with_config
+
+        mocker.patch.object(
+            mock_dataset, 'post',
+            side_effect=[dataset_query_response,
+                         pytest.helpers.mock_response('')])
+
+        res = mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': ['1', '2', '3', '4']},
+            chunk_size=2,
+            use_attr_names=True,
+            backend=backend)
+
+        n_rows = len(dataset_query_response.text.split()) - 3
+        if backend == 'pandas':
+            assert list(res.columns) == ['ensembl_gene_id']
+            assert len(res) == n_rows
+        else:
+            assert res.column_names == ['ensembl_gene_id']
+            assert res.num_rows == n_rows
+
+    def test_query_chunked_auto(self, mocker, mock_dataset_with_config,
+                                dataset_query_response):
+        """Tests query with chunk size chosen from a count query."""
+
+        mock_dataset = mock_dataset_with_config
+
+        count_response = pytest.helpers.mock_response('120000')
+        mock_get = mocker.patch.object(
+            mock_dataset, 'post',
+            side_effect=[count_response] + [dataset_query_response] * 3)
+
+        res = mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': ['1', '2', '3', '4', '5', '6']},
+            chunk_size='auto')
+
+        # 20000 rows per value --> chunks of 2 values (50000 rows).
+        assert len(res) > 0
+        assert mock_get.call_count == 4
+
+    def test_query_chunked_invalid_attribute(self, mocker,
+                                             mock_dataset_with_config):
+        """Tests that chunked queries are checked before any request."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_get = mocker.patch.object(mock_dataset, 'post')
+
+        with pytest.raises(BiomartException):
+            mock_dataset.query(
+                attributes=['invalid'],
+                filters={'chromosome_name': ['1', '2']},
+                chunk_size='auto')
+
+        assert not mock_get.called
+
+
+    def test_query_sharded(self, mocker, mock_dataset_with_config,
+                           dataset_query_response):
+        """Tests query sharded by region."""
+
+        mock_dataset = mock_dataset_with_config
+
+        plan = planning.QueryPlan(
+            [{'chromosome_name': '1', 'start': 1, 'end': 100},
+             {'chromosome_name': '1', 'start': 101, 'end': 200}], n_jobs=2)
+        mock_plan = mocker.patch.object(
+            planning, 'plan_regions', return_value=plan)
+
+        mock_get = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        res = mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': '1'},
+            only_unique=False,
+            shard_by='region')
+
+        # Overlapping shard results should be deduplicated.
+        assert len(res) == len(dataset_query_response.text.split()) - 3
+        assert mock_get.call_count == 2
+        mock_plan.assert_called_once_with(
+            mock_dataset, {'chromosome_name': '1'}, n_jobs=4)
+
+    def test_query_sharded_empty(self, mocker, mock_dataset_with_config,
+                                 dataset_query_response):
+        """Tests sharded query in which a window contains no features."""
+
+        mock_dataset = mock_dataset_with_config
+
+        plan = planning.QueryPlan(
+            [{'chromosome_name': '1', 'start': 1, 'end': 100},
+             {'chromosome_name': '1', 'start': 101, 'end': 200},
+             {'chromosome_name': '1', 'start': 201, 'end': 300}], n_jobs=1)
+        mocker.patch.object(planning, 'plan_regions', return_value=plan)
+
+        mock_get = mocker.patch.object(
+            mock_dataset, 'post',
+            side_effect=[dataset_query_response,
+                         pytest.helpers.mock_response(''),
+                         dataset_query_response])
+
+        res = mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': '1'},
+            shard_by='region')
+
+        assert list(res.columns) == ['Ensembl Gene ID']
+        assert len(res) == len(dataset_query_response.text.split()) - 3
+        assert mock_get.call_count == 3
+
+    def test_query_invalid_shard(self, mock_dataset_with_config):
+        """Tests query with invalid shard_by value."""
+
+        with pytest.raises(ValueError):
+            mock_dataset_with_config.query(shard_by='invalid')
+
+
+    def test_query_options(self, mocker, mock_dataset_with_config,
+                           dataset_query_response):
+        """Tests if filter values are normalized to their options."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': [1, ' x '],
+                     'biotype': 'Protein_Coding'})
+
+        _, kwargs = mock_post.call_args
+        assert b'name="chromosome_name" value="1,X"' in kwargs['query']
+        assert b'name="biotype" value="protein_coding"' in kwargs['query']
+
+    def test_query_invalid_option(self, mocker, mock_dataset_with_config):
+        """Tests if invalid filter values are rejected before querying."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(mock_dataset, 'post')
+
+        with pytest.raises(BiomartException):
+            mock_dataset.query(attributes=['ensembl_gene_id'],
+                               filters={'chromosome_name': ['1', 'chr2']})
+
+        with pytest.raises(BiomartException) as excinfo:
+            mock_dataset.query(attributes=['ensembl_gene_id'],
+                               filters={'biotype': 'protein_codng'})
+
+        assert mock_post.call_count == 0
+        assert "did you mean 'protein_coding'" in str(excinfo.value)
+
+    def test_query_no_validate_options(self, mocker,
+                                       mock_dataset_with_config,
+                                       dataset_query_response):
+        """Tests if option validation can be disabled."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_dataset._validate_options = False
+
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        mock_dataset.query(attributes=['ensembl_gene_id'],
+                           filters={'chromosome_name': 'chr2'})
+
+        _, kwargs = mock_post.call_args
+        assert b'value="chr2"' in kwargs['query']
+
+    def test_query_arrow(self, mocker, mock_dataset_with_config,
+                         query_params, dataset_query_response):
+        """Tests example query using the arrow backend."""
+
+        pa = pytest.importorskip('pyarrow')
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        res = mock_dataset.query(
+            backend='arrow', use_attr_names=True, **query_params)
+
+        assert isinstance(res, pa.Table)
+        assert res.column_names == ['ensembl_gene_id']
+        assert res.num_rows == len(dataset_query_response.text.split()) - 3
+
+    def test_query_arrow_chunked(self, mocker, mock_dataset_with_config,
+                                 dataset_query_response):
+        """Tests chunked query using the arrow backend."""
+
+        pa = pytest.importorskip('pyarrow')
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        res = mock_dataset.query(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': ['1', '2', '3']},
+            chunk_size=2,
+            backend='arrow')
+
+        assert isinstance(res, pa.Table)
+        assert res.num_rows == len(dataset_query_response.text.split()) - 3
+
+    def test_query_polars(self, mocker, mock_dataset_with_config,
+                          query_params, dataset_query_response):
+        """Tests example query using the polars backend."""
+
+        pl = pytest.importorskip('polars')
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        res = mock_dataset.query(backend='polars', **query_params)
+
+        assert isinstance(res, pl.DataFrame)
+        assert 'Ensembl Gene ID' in res.columns
+
+    def test_query_shared(self, mocker, mock_dataset_with_config,
+                          query_params, dataset_query_response):
+        """Tests example query using the shared backend."""
+
+        pytest.importorskip('pyarrow')
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        with mock_dataset.query(backend='shared', **query_params) as res:
+            assert isinstance(res, SharedResult)
+            assert len(res) > 0
+            assert 'Ensembl Gene ID' in res.table.column_names
+
+    def test_to_dask(self, mocker, mock_dataset_with_config,
+                     dataset_query_response):
+        """Tests if partitions are only fetched when computed."""
+
+        pytest.importorskip('dask.dataframe')
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        res = mock_dataset.to_dask(
+            attributes=['ensembl_gene_id'],
+            filters={'chromosome_name': ['1', '2', '3']},
+            partition_by='chromosome_name',
+            chunk_size=2,
+            use_attr_names=True)
+
+        assert res.npartitions == 2
+        assert list(res.columns) == ['ensembl_gene_id']
+        assert mock_post.call_count == 0
+
+        result = res.compute(scheduler='sync')
+
+        n_rows = len(dataset_query_response.text.split()) - 3
+        assert len(result) == 2 * n_rows
+        assert mock_post.call_count == 2
+
+    def test_to_dask_meta(self, mocker, mock_dataset_with_config):
+        """Tests if the metadata is derived without querying."""
+
+        pytest.importorskip('dask.dataframe')
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post',
+            return_value=pytest.helpers.mock_response(''))
+
+        res = mock_dataset.to_dask(
+            attributes=['ensembl_gene_id', 'start_position'],
+            dtypes={'Gene Start (bp)': 'int64'})
+
+        assert list(res.columns) == ['Ensembl Gene ID', 'Gene Start (bp)']
+        assert res.dtypes['Gene Start (bp)'] == 'int64'
+        assert mock_post.call_count == 0
+
+        # Empty partitions (without header) match the metadata.
+        result = res.compute(scheduler='sync')
+        assert len(result) == 0
+        assert list(result.columns) == ['Ensembl Gene ID', 'Gene Start (bp)']
+
+    def test_to_dask_invalid(self, mock_dataset_with_config):
+        """Tests partitioning on a missing or non-list filter."""
+
+        pytest.importorskip('dask.dataframe')
+
+        with pytest.raises(ValueError):
+            mock_dataset_with_config.to_dask(
+                attributes=['ensembl_gene_id'],
+                filters={'chromosome_name': '1'},
+                partition_by='chromosome_name')
+
+    def test_query_invalid_backend(self, mock_dataset_with_config):
+        """Tests query with an invalid backend."""
+
+        with pytest.raises(ValueError):
+            mock_dataset_with_config.query(backend='invalid')
+
+
+    def test_query_deadline(self, mocker, mock_dataset_with_config,
+                            query_params, dataset_query_response):
+        """Tests query with a deadline."""
+
+        mock_dataset = mock_dataset_with_config
+
+        def _get(**kwargs):
+            deadlines.append(current_deadline())
+            return dataset_query_response
+
+        deadlines = []
+        mocker.patch.object(mock_dataset, 'post', side_effect=_get)
+
+        mock_dataset.query(deadline=60, **query_params)
+
+        assert 0 < deadlines[0].remaining() <= 60
+        assert current_deadline() is None
+
+    def test_query_deadline_configuration(self, mocker, mock_dataset,
+                                          dataset_config_response,
+                                          dataset_query_response):
+        """Tests if configurations fetched by a query use its deadline."""
+
+        def _get(**kwargs):
+            deadlines.append(current_deadline())
+            return dataset_config_response
+
+        deadlines = []
+        mocker.patch.object(mock_dataset, 'get', side_effect=_get)
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        # Default attributes require the (not yet fetched) configuration.
+        mock_dataset.query(deadline=60)
+
+        assert deadlines[0] is not None
+        assert 0 < deadlines[0].remaining() <= 60
+
+    def test_query_deadline_exceeded(self, mocker, mock_dataset_with_config,
+                                     query_params):
+        """Tests query exceeding its deadline."""
+
+        mock_dataset = mock_dataset_with_config
+
+        # Use actual post method, mocking the underlying request.
+        mocker.patch.object(
+            mock_dataset, 'post', new=partial(ServerBase.post, mock_dataset))
+        mock_get = mocker.patch.object(requests, 'post')
+
+        with pytest.raises(DeadlineExceeded):
+            mock_dataset.query(deadline=-1, **query_params)
+
+        assert not mock_get.called
+
+
+    @pytest.fixture
+    def linked_dataset(self, mocker, dataset_config_response):
+        """Returns a second dataset to link, mocked with a configuration."""
+
+        dataset = Dataset(name='hsapiens_gene_ensembl',
+                          host='http://www.ensembl.org', use_cache=False)
+        mocker.patch.object(
+            dataset, 'get', return_value=dataset_config_response)
+
+        return dataset
+
+    def test_query_linked(self, mocker, mock_dataset_with_config,
+                          linked_dataset, query_params):
+        """Tests query of a linked dataset."""
+
+        mock_dataset = mock_dataset_with_config
+
+        response = pytest.helpers.mock_response(
+            'Ensembl Gene ID\tEnsembl Gene ID\nENSMUSG01\tENSG01\n')
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=response)
+
+        res = mock_dataset.query(
+            linked=(linked_dataset, ['ensembl_gene_id'],
+                    {'chromosome_name': ['2']}),
+            use_attr_names=True,
+            **query_params)
+
+        assert list(res.columns) == ['ensembl_gene_id', 'ensembl_gene_id']
+        assert list(res.iloc[0]) == ['ENSMUSG01', 'ENSG01']
+
+        query = b"""<Query virtualSchemaName="default" formatter="TSV"
+ header="1" uniqueRows="1" datasetConfigVersion="0.6">
+<Dataset name="mmusculus_gene_ensembl" interface="default">
+<Attribute name="ensembl_gene_id" />
+<Filter name="chromosome_name" value="1" />
+</Dataset>
+<Dataset name="hsapiens_gene_ensembl" interface="default">
+<Attribute name="ensembl_gene_id" />
+<Filter name="chromosome_name" value="2" />
+</Dataset></Query>"""
+        query = b''.join(query.split(b'\n'))
+
+        mock_post.assert_called_once_with(query=query)
+
+    def test_query_linked_invalid(self, mocker, mock_dataset_with_config,
+                                  linked_dataset, query_params):
+        """Tests if linked attributes are validated before querying."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(mock_dataset, 'post')
+
+        with pytest.raises(BiomartException):
+            mock_dataset.query(linked=(linked_dataset, ['invalid']),
+                               **query_params)
+
+        with pytest.raises(ValueError):
+            mock_dataset.query(linked=(linked_dataset, ), **query_params)
+
+        assert not mock_post.called
+
+    def test_query_linked_schema(self, mock_dataset_with_config,
+                                 query_params):
+        """Tests if linked datasets should share the virtual schema."""
+
+        other = Dataset(name='hsapiens_gene_ensembl',
+                        host='http://www.ensembl.org',
+                        virtual_schema='other')
+
+        with pytest.raises(BiomartException):
+            mock_dataset_with_config.query(
+                linked=(other, ['ensembl_gene_id']), **query_params)
+
+
+def _mock_metadata(mocker, dataset, registry, config):
+    """Mocks the registry and configuration responses of a dataset."""
+
+    responses = {
+        'registry': pytest.helpers.mock_response(registry),
+        'configuration': pytest.helpers.mock_response(config)
+    }
+
+    return mocker.patch.object(
+        dataset, 'get', side_effect=lambda type, **_: responses[type])
+
+
+def _join_refresh():
+    """Waits for background refreshes to finish."""
+    for thread in threading.enumerate():
+        if thread.name == 'pybiomart-refresh':
+            thread.join()
+
 
 class TestDatasetLive(object):
     """Live unit tests for dataset."""
@@ -0,0 +1,267 @@
+import os
+import pickle
+import subprocess
+import sys
+import threading
+
+import pytest
+import requests
+
+from pybiomart import governor as gov
+from pybiomart.base import Deadline, DeadlineExceeded
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+HOST = 'http://www.ensembl.org'
+
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+class TestGovernor(object):
+    """Tests for the Governor class."""
+
+    def test_burst(self, mocker):
+        """Tests that bursts up to the bucket size do not wait."""
+
+        mock_sleep = mocker.patch.object(gov.time, 'sleep')
+
+        governor = gov.Governor(rate=1, burst=3, max_concurrency=10)
+        for _ in range(3):
+            with governor.request(HOST):
+                pass
+
+        assert not mock_sleep.called
+
+    def test_rate_limit(self, mocker):
+        """Tests waiting for tokens once the bucket is empty."""
+
+        mocker.patch.object(gov.time, 'time', return_value=100.0)
+        mock_sleep = mocker.patch.object(gov.time, 'sleep')
+
+        governor = gov.Governor(rate=2, burst=1)
+
+        governor.acquire(HOST)
+        governor.release(HOST, latency=0.1)
+        assert not mock_sleep.called
+
+        governor.acquire(HOST)
+        governor.release(HOST, latency=0.1)
+        mock_sleep.assert_called_once_with(pytest.approx(0.5))
+
+    def test_shared_file(self, mocker, tmpdir):
+        """Tests sharing of rate limits through a SQLite file."""
+
+        mocker.patch.object(gov.time, 'time', return_value=100.0)
+        mock_sleep = mocker.patch.object(gov.time, 'sleep')
+
+        path = str(tmpdir.join('governor.sqlite'))
+        first = gov.Governor(rate=1, burst=1, path=path)
+        second = gov.Governor(rate=1, burst=1, path=path)
+
+        with first.request(HOST):
+            pass
+        with second.request(HOST):
+            pass
+
+        mock_sleep.assert_called_once_with(pytest.approx(1.0))
+
+    def test_shared_concurrency(self, tmpdir):
+        """Tests sharing of concurrency limits through a SQLite file."""
+
+        path = str(tmpdir.join('governor.sqlite'))
+        first = gov.Governor(rate=1000, burst=1000, path=path)
+        second = gov.Governor(rate=1000, burst=1000, path=path)
+
+        slot = first.acquire(HOST)
+        assert second.in_flight(HOST) == 1
+
+        acquired = threading.Event()
+
+        def _acquire():
+            second.acquire(HOST)
+            acquired.set()
+
+        thread = threading.Thread(target=_acquire)
+        thread.start()
+
+        # The slot of the first governor also limits the second.
+        assert not acquired.wait(0.2)
+
+        first.release(HOST, latency=0.1, slot=slot)
+        assert acquired.wait(1)
+        thread.join()
+
+        # Limits adjusted by one governor are used by the other.
+        assert second.limit(HOST) == 2
+
+    @pytest.mark.skipif(os.name != 'posix',
+                        reason='Exited processes are only detected on POSIX')
+    def test_shared_exited_process(self, tmpdir):
+        """Tests that slots of exited processes are dropped."""
+
+        path = str(tmpdir.join('governor.sqlite'))
+        governor = gov.Governor(rate=1000, burst=1000, path=path)
+
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+
+        # Slot left behind by a process that exited whilst requesting.
+        governor._state._connection().execute(
+            'INSERT INTO slots (id, host, pid, acquired) VALUES (?, ?, ?, ?)',
+            ('stale', HOST, process.pid, gov.time.time()))
+        assert governor.in_flight(HOST) == 1
+
+        with governor.request(HOST):
+            assert governor.in_flight(HOST) == 1
+
+        assert governor.in_flight(HOST) == 0
+
+    def test_pickle(self, mocker, tmpdir):
+        """Tests if pickled governors share rate limits via their file."""
+
+        mocker.patch.object(gov.time, 'time', return_value=100.0)
+        mock_sleep = mocker.patch.object(gov.time, 'sleep')
+
+        path = str(tmpdir.join('governor.sqlite'))
+        first = gov.Governor(rate=1, burst=1, path=path)
+        second = pickle.loads(pickle.dumps(first))
+
+        assert second.rate == 1
+        assert second.path == path
+
+        with first.request(HOST):
+            pass
+        with second.request(HOST):
+            pass
+
+        mock_sleep.assert_called_once_with(pytest.approx(1.0))
+
+    def test_additive_increase(self):
+        """Tests increase of the concurrency limit after fast requests."""
+
+        governor = gov.Governor(rate=1000, burst=1000, max_concurrency=3)
+        assert governor.limit(HOST) == 1
+
+        for _ in range(10):
+            governor.acquire(HOST)
+            governor.release(HOST, latency=0.1)
+
+        assert governor.limit(HOST) == 3
+
+    def test_multiplicative_decrease(self):
+        """Tests decrease of the concurrency limit after errors."""
+
+        governor = gov.Governor(rate=1000, burst=1000, max_concurrency=8)
+        governor._state.update_limit(HOST, 1, lambda _: 8)
+
+        governor.acquire(HOST)
+        governor.release(HOST, error=True)
+        assert governor.limit(HOST) == 4
+
+        governor.acquire(HOST)
+        governor.release(HOST, latency=governor._target_latency + 1)
+        assert governor.limit(HOST) == 2
+
+    @pytest.mark.parametrize('error', [
+        requests.ConnectionError('Failed'),
+        requests.Timeout('Timed out'),
+        _http_error(503),
+        _http_error(429)
+    ])
+    def test_request_error(self, error):
+        """Tests that overload errors in requests count as errors."""
+
+        governor = gov.Governor(rate=1000, burst=1000)
+        governor._state.update_limit(HOST, 1, lambda _: 4)
+
+        with pytest.raises(type(error)):
+            with governor.request(HOST):
+                raise error
+
+        assert governor.limit(HOST) == 2
+        assert governor.in_flight(HOST) == 0
+
+    @pytest.mark.parametrize('error', [
+        _http_error(400), ValueError('Invalid query')])
+    def test_request_client_error(self, error):
+        """Tests that other errors do not change the concurrency limit."""
+
+        governor = gov.Governor(rate=1000, burst=1000)
+        governor._state.update_limit(HOST, 1, lambda _: 4)
+
+        with pytest.raises(type(error)):
+            with governor.request(HOST):
+                raise error
+
+        assert governor.limit(HOST) == 4
+        assert governor.in_flight(HOST) == 0
+
+    def test_concurrency_limit(self):
+        """Tests that requests block at the concurrency limit."""
+
+        governor = gov.Governor(rate=1000, burst=1000)
+        governor.acquire(HOST)
+
+        acquired = threading.Event()
+
+        def _acquire():
+            governor.acquire(HOST)
+            acquired.set()
+
+        thread = threading.Thread(target=_acquire)
+        thread.start()
+
+        assert not acquired.wait(0.1)
+
+        governor.release(HOST, latency=0.1)
+        assert acquired.wait(1)
+        thread.join()
+
+    def test_slot_deadline(self):
+        """Tests that waiting for a slot stops at the deadline."""
+
+        governor = gov.Governor(rate=1000, burst=1000)
+        governor.acquire(HOST)
+
+        with pytest.raises(DeadlineExceeded):
+            governor.acquire(HOST, deadline=Deadline(0.1))
+
+        assert governor.in_flight(HOST) == 1
+
+    def test_slot_cancelled(self):
+        """Tests that waiting for a slot stops when cancelled."""
+
+        governor = gov.Governor(rate=1000, burst=1000)
+        governor.acquire(HOST)
+
+        deadline = Deadline()
+        timer = threading.Timer(0.1, deadline.cancel)
+        timer.start()
+
+        with pytest.raises(DeadlineExceeded):
+            governor.acquire(HOST, deadline=deadline)
+
+        timer.join()
+
+    def test_token_deadline(self):
+        """Tests that waiting for a token stops at the deadline."""
+
+        governor = gov.Governor(rate=1, burst=1, max_concurrency=10)
+
+        with governor.request(HOST):
+            pass
+
+        with pytest.raises(DeadlineExceeded):
+            governor.acquire(HOST, deadline=Deadline(0.1))
+
+        assert governor.in_flight(HOST) == 0
+
+    def test_invalid_rate(self):
+        """Tests creating a governor with an invalid rate."""
+
+        with pytest.raises(ValueError):
+            gov.Governor(rate=0)
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pybiomart.base import BiomartException
+from pybiomart.intervals import IntervalIndex
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+@pytest.fixture
+def genes():
+    """Example genes with attribute names as columns."""
+    return pd.DataFrame.from_records(
+        [('ENSMUSG01', 'Gene1', '1', 100, 200),
+         ('ENSMUSG02', 'Gene2', '1', 150, 1000),
+         ('ENSMUSG03', 'Gene3', '1', 300, 400),
+         ('ENSMUSG04', 'Gene4', '2', 100, 200),
+         ('ENSMUSG05', 'Gene5', 'X', 500, 600)],
+        columns=['ensembl_gene_id', 'external_gene_name', 'chromosome_name',
+                 'start_position', 'end_position'])
+
+
+@pytest.fixture
+def index(genes):
+    """Index of the example genes (shuffled to check sorting)."""
+    return IntervalIndex(genes.iloc[[3, 2, 0, 4, 1]],
+                         attributes=['ensembl_gene_id'])
+
+
+@pytest.fixture
+def regions():
+    """Example regions to annotate."""
+    return pd.DataFrame({
+        'chrom': ['1', '1', '2', 'Y', 1],
+        'start': [200, 1001, 150, 100, 350],
+        'end': [250, 2000, 150, 200, 350]
+    })
+
+
+class TestIntervalIndex(object):
+    """Tests for the IntervalIndex class."""
+
+    def test_overlaps(self, index, regions):
+        """Tests overlaps of regions, including inclusive boundaries."""
+
+        region_pos, feature_pos = index.overlaps(
+            regions['chrom'], regions['start'], regions['end'])
+
+        genes = list(index.features['ensembl_gene_id'].iloc[feature_pos])
+
+        assert list(region_pos) == [0, 0, 2, 4, 4]
+        assert genes == ['ENSMUSG01', 'ENSMUSG02', 'ENSMUSG04', 'ENSMUSG02',
+                         'ENSMUSG03']
+
+    def test_overlaps_nested(self):
+        """Tests features contained in a long preceding feature."""
+
+        features = pd.DataFrame({
+            'chromosome_name': ['1'] * 4,
+            'start_position': [1, 10, 20, 5000],
+            'end_position': [10000, 15, 30, 5100]
+        })
+
+        index = IntervalIndex(features, attributes=[])
+        region_pos, feature_pos = index.overlaps(['1', '1'], [5050, 12],
+                                                 [5060, 12])
+
+        assert list(region_pos) == [0, 0, 1, 1]
+        assert list(feature_pos) == [0, 3, 0, 1]
+
+    def test_overlaps_brute_force(self):
+        """Compares overlaps against a brute force search."""
+
+        random = np.random.RandomState(0)
+
+        starts = random.randint(1, 10000, size=200)
+        features = pd.DataFrame({
+            'chromosome_name': random.choice(['1', '2'], size=200),
+            'start_position': starts,
+            'end_position': starts + random.randint(0, 500, size=200)
+        })
+
+        reg_chroms = random.choice(['1', '2'], size=100)
+        reg_starts = random.randint(1, 10000, size=100)
+        reg_ends = reg_starts + random.randint(0, 100, size=100)
+
+        index = IntervalIndex(features, attributes=[])
+        found = set(zip(*index.overlaps(reg_chroms, reg_starts, reg_ends)))
+
+        indexed = index.features
+        expected = {
+            (i, j)
+            for i in range(100)
+            for j in range(len(indexed))
+            if (indexed['chromosome_name'][j] == reg_chroms[i] and
+                indexed['start_position'][j] <= reg_ends[i] and
+                indexed['end_position'][j] >= reg_starts[i])
+        }
+
+        assert found == expected
+
+    def test_annotate(self, index, regions):
+        """Tests annotating regions, keeping regions without overlaps."""
+
+        result = index.annotate(regions, chrom_column='chrom',
+                                start_column='start', end_column='end')
+
+        assert list(result.columns) == ['chrom', 'start', 'end',
+                                        'ensembl_gene_id']
+        assert list(result['start']) == [200, 200, 1001, 150, 100, 350, 350]
+        assert list(result['ensembl_gene_id'].fillna('')) == [
+            'ENSMUSG01', 'ENSMUSG02', '', 'ENSMUSG04', '', 'ENSMUSG02',
+            'ENSMUSG03'
+        ]
+
+    def test_annotate_inner(self, index, regions):
+        """Tests annotating regions, dropping regions without overlaps."""
+
+        result = index.annotate(regions, chrom_column='chrom',
+                                start_column='start', end_column='end',
+                                how='inner')
+
+        assert list(result['start']) == [200, 200, 150, 350, 350]
+
+    def test_save_load(self, tmpdir, index, regions):
+        """Tests if saved indices are loaded correctly."""
+
+        path = str(tmpdir.join('genes.idx'))
+        index.save(path)
+
+        loaded = IntervalIndex.load(path)
+
+        assert len(loaded) == len(index)
+        assert loaded.chromosomes == ['1', '2', 'X']
+        assert loaded.attributes == ['ensembl_gene_id']
+
+        expected = index.overlaps(regions['chrom'], regions['start'],
+                                  regions['end'])
+        found = loaded.overlaps(regions['chrom'], regions['start'],
+                                regions['end'])
+
+        assert all(np.array_equal(a, b) for a, b in zip(found, expected))
+
+    def test_load_version(self, tmpdir):
+        """Tests loading a file of an unsupported version."""
+
+        path = tmpdir.join('genes.idx')
+        pd.to_pickle({'version': 0}, str(path))
+
+        with pytest.raises(BiomartException):
+            IntervalIndex.load(str(path))
+
+
+class TestDatasetIntervalIndex(object):
+    """Tests for Dataset.build_interval_index."""
+
+    def test_build(self, mocker, tmpdir, mock_dataset_with_config, genes):
+        """Tests if coordinates are fetched in a single query."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_query = mocker.patch.object(
+            mock_dataset, 'query', return_value=genes)
+
+        path = str(tmpdir.join('genes.idx'))
+        index = mock_dataset.build_interval_index(
+            attributes=['ensembl_gene_id', 'chromosome_name'],
+            filters={'chromosome_name': ['1', '2']}, path=path)
+
+        assert len(index) == 5
+        assert index.attributes == ['ensembl_gene_id', 'chromosome_name']
+        assert len(IntervalIndex.load(path)) == 5
+
+        _, kwargs = mock_query.call_args
+        assert kwargs['attributes'] == ['chromosome_name', 'start_position',
+                                        'end_position', 'ensembl_gene_id']
+        assert kwargs['filters'] == {'chromosome_name': ['1', '2']}
+        assert kwargs['use_attr_names']
+
+    def test_build_invalid(self, mock_dataset_with_config):
+        """Tests invalid coordinates."""
+
+        with pytest.raises(ValueError):
+            mock_dataset_with_config.build_interval_index(
+                attributes=['ensembl_gene_id'],
+                coordinates=('chromosome_name', 'start_position'))
@@ -0,0 +1,148 @@
+import sqlite3
+
+import pytest
+
+from pybiomart.base import BiomartException
+from pybiomart.jobs import QueryJob
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+@pytest.fixture
+def job_params():
+    """Parameters of a job with three chunks."""
+
+    return {
+        'attributes': ['ensembl_gene_id'],
+        'filters': {
+            'chromosome_name': ['1', '2', '3', '4', '5']
+        },
+        'chunk_size': 2,
+        'n_jobs': 2
+    }
+
+
+class TestQueryJob(object):
+    """Tests for resumable query jobs."""
+
+    def test_run(self, mocker, tmpdir, mock_dataset_with_config, job_params,
+                 dataset_query_response):
+        """Tests running a chunked job."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        job = mock_dataset.query_job(str(tmpdir), **job_params)
+        assert len(job) == 3
+        assert job.status() == {'pending': 3}
+
+        job.run()
+
+        assert job.done
+        assert job.status() == {'done': 3}
+        assert mock_post.call_count == 3
+
+        # Identical chunk results should be deduplicated.
+        result = job.result(use_attr_names=True)
+        assert list(result.columns) == ['ensembl_gene_id']
+        assert len(result) == len(dataset_query_response.text.split()) - 3
+
+    def test_empty_part(self, mocker, tmpdir, mock_dataset_with_config,
+                        job_params, dataset_query_response):
+        """Tests combining a job in which a sub-query has no results."""
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post',
+            side_effect=[dataset_query_response,
+                         pytest.helpers.mock_response(''),
+                         dataset_query_response])
+
+        job = mock_dataset.query_job(str(tmpdir), **job_params)
+        job.run(n_jobs=1)
+
+        assert job.done
+
+        result = job.result()
+        assert list(result.columns) == ['Ensembl Gene ID']
+        assert len(result) == len(dataset_query_response.text.split()) - 3
+
+    def test_resume_failed(self, mocker, tmpdir, mock_dataset_with_config,
+                           job_params, dataset_query_response):
+        """Tests if a rerun only fetches the failed sub-queries."""
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post',
+            side_effect=[dataset_query_response, IOError('Preempted'),
+                         dataset_query_response])
+
+        job = mock_dataset.query_job(
+            str(tmpdir), **dict(job_params, n_jobs=1))
+
+        with pytest.raises(BiomartException):
+            job.run()
+
+        assert job.status() == {'done': 2, 'failed': 1}
+        assert job.errors() == {1: 'Preempted'}
+
+        with pytest.raises(BiomartException):
+            job.result()
+
+        # Reopen job (without planning again) and resume.
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        job = mock_dataset.query_job(str(tmpdir), **job_params)
+        job.run()
+
+        assert job.done
+        assert mock_post.call_count == 1
+
+    def test_resume_interrupted(self, mocker, tmpdir,
+                                mock_dataset_with_config, job_params,
+                                dataset_query_response):
+        """Tests if sub-queries of an interrupted run are run again."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        job = mock_dataset.query_job(str(tmpdir), **job_params)
+
+        # Simulate a run that crashed whilst running the first part.
+        conn = sqlite3.connect(job.manifest)
+        with conn:
+            conn.execute("UPDATE parts SET state = 'running' WHERE id = 0")
+            conn.execute("UPDATE parts SET state = 'done', path = 'x' "
+                         "WHERE id = 1")
+        conn.close()
+
+        job.run()
+
+        assert mock_post.call_count == 2
+        assert job.status() == {'done': 3}
+
+    def test_different_query(self, mocker, tmpdir, mock_dataset_with_config,
+                             job_params, dataset_query_response):
+        """Tests reopening a job directory with a different query."""
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        QueryJob(mock_dataset, str(tmpdir), **job_params)
+
+        with pytest.raises(BiomartException):
+            QueryJob(mock_dataset, str(tmpdir),
+                     **dict(job_params, chunk_size=3))
+
+    def test_invalid_attribute(self, tmpdir, mock_dataset_with_config):
+        """Tests if queries are validated before creating a manifest."""
+
+        with pytest.raises(BiomartException):
+            mock_dataset_with_config.query_job(
+                str(tmpdir.join('job')), attributes=['invalid'])
+
+        assert not tmpdir.join('job').check()
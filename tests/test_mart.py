@@ -34,3 +34,15 @@ class TestMartStatic(object):
         dataset = mock_mart['mmusculus_gene_ensembl']
 
         assert dataset.name == 'mmusculus_gene_ensembl'
+
+    def test_dataset_params(self, mocker, mock_mart, mart_datasets_response):
+        """Tests passing of client parameters to datasets."""
+
+        mock_mart._governor = governor = object()
+
+        mocker.patch.object(
+            mock_mart, 'get', return_value=mart_datasets_response)
+        dataset = mock_mart['mmusculus_gene_ensembl']
+
+        assert dataset.governor is governor
+        assert dataset.hosts == mock_mart.hosts
@@ -0,0 +1,339 @@
+import threading
+import time
+
+import pytest
+
+from pybiomart import planning
+from pybiomart.base import (BiomartException, Deadline, DeadlineExceeded,
+                            current_deadline, deadline_scope)
+from pybiomart.dataset import Filter
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+class TestSplitFilter(object):
+    """Tests for the split_filter function."""
+
+    def test_split(self):
+        """Tests splitting of filter values into chunks."""
+
+        filters = {'ids': ['a', 'b', 'c'], 'chromosome_name': '1'}
+        chunks = planning.split_filter(filters, 'ids', 2)
+
+        assert chunks == [{'ids': ['a', 'b'], 'chromosome_name': '1'},
+                          {'ids': ['c'], 'chromosome_name': '1'}]
+
+
+class TestPlanChunks(object):
+    """Tests for the plan_chunks function."""
+
+    def test_fixed_size(self, mocker):
+        """Tests planning with a fixed chunk size."""
+
+        dataset = mocker.Mock()
+        plan = planning.plan_chunks(
+            dataset, {'ids': list('abcde')}, chunk_size=2, n_jobs=8)
+
+        assert len(plan) == 3
+        assert plan.n_jobs == 3
+        assert plan.estimated_rows is None
+        assert not dataset.count.called
+
+    def test_auto_size(self, mocker):
+        """Tests planning with chunk size derived from a count."""
+
+        dataset = mocker.Mock()
+        dataset.count.return_value = 100
+
+        plan = planning.plan_chunks(
+            dataset, {'ids': list(range(100))},
+            chunk_size='auto', n_jobs=4, chunk_rows=10)
+
+        assert len(plan) == 10
+        assert plan.n_jobs == 4
+        assert plan.estimated_rows == 100
+
+    def test_auto_size_small(self, mocker):
+        """Tests that small queries are run as a single query."""
+
+        dataset = mocker.Mock()
+        dataset.count.return_value = 10
+
+        plan = planning.plan_chunks(
+            dataset, {'ids': list(range(100))}, chunk_size='auto')
+
+        assert len(plan) == 1
+        assert plan.n_jobs == 1
+
+    def test_no_list_filter(self, mocker):
+        """Tests planning without a list filter to split."""
+
+        plan = planning.plan_chunks(
+            mocker.Mock(), {'chromosome_name': '1'}, chunk_size='auto')
+
+        assert plan.filters == [{'chromosome_name': '1'}]
+
+    def test_invalid_size(self, mocker):
+        """Tests planning with an invalid chunk size."""
+
+        with pytest.raises(ValueError):
+            planning.plan_chunks(mocker.Mock(), {'ids': ['a']}, chunk_size=0)
+
+
+class TestPlanSize(object):
+    """Tests for the plan_size function."""
+
+    def test_small(self):
+        """Tests that queries within the size limit are not split."""
+
+        plan = planning.plan_size({'ids': ['a', 'b']}, 100, 1000)
+        assert plan.filters == [{'ids': ['a', 'b']}]
+
+    def test_split(self):
+        """Tests splitting of values to fit within the size limit."""
+
+        values = ['id{:03d}'.format(i) for i in range(100)]
+
+        # 100 bytes of query overhead, 6 bytes per value.
+        plan = planning.plan_size(
+            {'ids': values, 'chromosome_name': '1'}, 700, 160)
+
+        assert len(plan) == 10
+        assert all(len(f['ids']) == 10 for f in plan.filters)
+        assert all(f['chromosome_name'] == '1' for f in plan.filters)
+        assert sum((f['ids'] for f in plan.filters), []) == values
+
+
+class TestFitSize(object):
+    """Tests for the fit_size function."""
+
+    @staticmethod
+    def _size(filters):
+        # 100 bytes of query overhead, 6 bytes per value.
+        return 100 + 6 * len(filters.get('ids', []))
+
+    def test_small(self):
+        """Tests that plans within the size limit are not changed."""
+
+        plan = planning.QueryPlan([{'ids': ['a', 'b']}, {'ids': ['c']}])
+        assert planning.fit_size(plan, self._size, 1000) is plan
+
+    def test_split(self):
+        """Tests splitting of sub-queries exceeding the size limit."""
+
+        values = ['id{:03d}'.format(i) for i in range(100)]
+        plan = planning.QueryPlan(
+            [{'ids': values[:20]}, {'ids': values[20:]}, {'other': 'a'}],
+            n_jobs=2, estimated_rows=100)
+
+        fitted = planning.fit_size(plan, self._size, 160, n_jobs=3)
+
+        assert all(self._size(f) <= 160 for f in fitted.filters)
+        assert sum((f.get('ids', []) for f in fitted.filters), []) == values
+        assert fitted.filters[-1] == {'other': 'a'}
+        assert fitted.n_jobs == 3
+        assert fitted.estimated_rows == 100
+
+    def test_underestimate(self):
+        """Tests splitting when the size of values is underestimated."""
+
+        values = ['id{:03d}'.format(i) for i in range(100)]
+        plan = planning.QueryPlan([{'ids': values}])
+
+        # Encoded values are three times as large as estimated by plan_size.
+        fitted = planning.fit_size(
+            plan, lambda f: 100 + 18 * len(f['ids']), 280)
+
+        assert all(len(f['ids']) <= 10 for f in fitted.filters)
+        assert sum((f['ids'] for f in fitted.filters), []) == values
+
+
+class TestRunPlan(object):
+    """Tests for the run_plan function."""
+
+    @pytest.mark.parametrize('n_jobs', [1, 3])
+    def test_run(self, n_jobs):
+        """Tests that results are returned in order of the plan."""
+
+        plan = planning.QueryPlan([{'i': i} for i in range(5)], n_jobs=n_jobs)
+        assert planning.run_plan(plan, lambda f: f['i']) == list(range(5))
+
+
+class FeatureCounter(object):
+    """Counts features overlapping filters, mimicking biomart counts."""
+
+    def __init__(self, features, options=()):
+        self.features = features
+        self.name = 'dataset'
+        self.filters = {
+            'chromosome_name':
+            Filter(name='chromosome_name', type='list', options=options)
+        }
+
+    def count(self, filters):
+        """Counts features matching the given filters."""
+
+        chroms = filters['chromosome_name']
+        if not isinstance(chroms, list):
+            chroms = [chroms]
+
+        start = filters.get('start', 1)
+        end = filters.get('end', float('inf'))
+
+        return sum(1 for chrom in chroms
+                   for (f_start, f_end) in self.features.get(chrom, [])
+                   if f_end >= start and f_start <= end)
+
+
+class TestPlanRegions(object):
+    """Tests for the plan_regions function."""
+
+    def test_group_small(self):
+        """Tests grouping of small chromosomes."""
+
+        dataset = FeatureCounter({
+            '1': [(1, 10)] * 3,
+            '2': [(1, 10)] * 3,
+            '3': [(1, 10)] * 3
+        }, options=['1', '2', '3', 'MT'])
+
+        plan = planning.plan_regions(dataset, {}, shard_rows=6)
+
+        # MT is not counted separately, as its group is small enough.
+        assert plan.filters == [{'chromosome_name': ['1', '2']},
+                                {'chromosome_name': ['3', 'MT']}]
+        assert plan.estimated_rows == 9
+
+    def test_count_queries(self, mocker):
+        """Tests that chromosomes are not counted one by one."""
+
+        options = ['1', '2'] + ['scaffold{}'.format(i) for i in range(254)]
+        dataset = FeatureCounter({
+            '1': [(1, 10)] * 5,
+            '2': [(1, 10)] * 5,
+            'scaffold100': [(1, 10)]
+        }, options=options)
+
+        mock_count = mocker.spy(dataset, 'count')
+
+        plan = planning.plan_regions(dataset, {}, shard_rows=6, n_jobs=1)
+
+        assert len(plan) == 2
+        assert plan.filters[0] == {'chromosome_name': ['1']}
+        assert plan.filters[1]['chromosome_name'][0] == '2'
+        assert 'scaffold100' in plan.filters[1]['chromosome_name']
+        assert plan.estimated_rows == 11
+        assert mock_count.call_count < 30
+
+    def test_single_count(self, mocker):
+        """Tests planning of small queries using a single count query."""
+
+        dataset = FeatureCounter({'1': [(1, 10)] * 3},
+                                 options=['1', '2', '3'])
+        mock_count = mocker.spy(dataset, 'count')
+
+        plan = planning.plan_regions(dataset, {}, shard_rows=6)
+
+        assert plan.filters == [{'chromosome_name': ['1', '2', '3']}]
+        assert mock_count.call_count == 1
+
+    def test_split_large(self):
+        """Tests splitting of large chromosomes into windows."""
+
+        features = [(i * 1000 + 1, i * 1000 + 500) for i in range(100)]
+        dataset = FeatureCounter({'1': features})
+
+        plan = planning.plan_regions(
+            dataset, {'chromosome_name': '1', 'biotype': 'protein_coding'},
+            shard_rows=30, resolution=100)
+
+        assert len(plan) == 4
+        assert all(f['chromosome_name'] == '1' for f in plan.filters)
+        assert all(f['biotype'] == 'protein_coding' for f in plan.filters)
+
+        # Windows should be contiguous and cover all features.
+        assert plan.filters[0]['start'] == 1
+        for prev, next_ in zip(plan.filters, plan.filters[1:]):
+            assert next_['start'] == prev['end'] + 1
+        assert plan.filters[-1]['end'] >= 99500
+
+        # Each feature should be returned by at least one window.
+        covered = set()
+        for filters in plan.filters:
+            covered |= {f for f in features
+                        if f[1] >= filters['start'] and
+                        f[0] <= filters['end']}
+        assert covered == set(features)
+
+    def test_region(self):
+        """Tests sharding of a region given by start/end filters."""
+
+        dataset = FeatureCounter({'1': [(i, i) for i in range(1, 101)]})
+
+        plan = planning.plan_regions(
+            dataset, {'chromosome_name': ['1'], 'start': 11, 'end': 50},
+            shard_rows=20)
+
+        assert [(f['start'], f['end']) for f in plan.filters] == [(11, 30),
+                                                                  (31, 50)]
+
+    def test_empty(self):
+        """Tests planning of a query without matching entries."""
+
+        dataset = FeatureCounter({}, options=['1'])
+        plan = planning.plan_regions(dataset, {})
+
+        assert plan.filters == [{'chromosome_name': ['1']}]
+
+    def test_no_chromosomes(self):
+        """Tests sharding a dataset without chromosome options."""
+
+        with pytest.raises(BiomartException):
+            planning.plan_regions(FeatureCounter({}), {})
+
+
+class TestMapParallel(object):
+    """Tests for the map_parallel function."""
+
+    def test_propagate_deadline(self):
+        """Tests propagation of the deadline to worker threads."""
+
+        deadline = Deadline(60)
+
+        with deadline_scope(deadline):
+            remaining = planning.map_parallel(
+                lambda _: current_deadline().remaining(), range(4), n_jobs=2)
+
+        assert all(0 < value <= 60 for value in remaining)
+
+    def test_deadline_exceeded(self):
+        """Tests cancellation of outstanding calls after the deadline."""
+
+        started = []
+        stopped = threading.Event()
+
+        def _slow(item):
+            started.append(item)
+            while not current_deadline().expired:
+                time.sleep(0.01)
+            stopped.set()
+
+        with pytest.raises(DeadlineExceeded):
+            with deadline_scope(Deadline(0.1)):
+                planning.map_parallel(_slow, range(10), n_jobs=2)
+
+        # Running calls should see the cancellation, others not start.
+        assert stopped.wait(1)
+        assert len(started) == 2
+
+    def test_exception(self):
+        """Tests cancellation of outstanding calls after an exception."""
+
+        def _fail(item):
+            if item == 0:
+                raise ValueError('Failed')
+            while not current_deadline().expired:
+                time.sleep(0.01)
+
+        with pytest.raises(ValueError):
+            planning.map_parallel(_fail, range(4), n_jobs=2)
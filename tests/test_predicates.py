@@ -0,0 +1,167 @@
+from xml.etree import ElementTree
+
+import pandas as pd
+import pytest
+
+from pybiomart.base import BiomartException
+from pybiomart.predicates import col, push_down
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+GENES = (b'Ensembl Gene ID\tAssociated Gene Name\tGene Start (bp)\n'
+         b'ENSMUSG01\tGm1\t3200000\n'
+         b'ENSMUSG02\tXkr4\t3205901\n'
+         b'ENSMUSG03\tRp1\t4343507\n'
+         b'ENSMUSG04\t\t1000\n'
+         b'ENSMUSG05\tSox17\t4490931\n')
+
+
+@pytest.fixture
+def genes():
+    """Example genes with attribute names as columns."""
+    return pd.DataFrame.from_records(
+        [('ENSMUSG01', 'Gm1', 1, 500),
+         ('ENSMUSG02', 'Xkr4', 1, 3205901),
+         ('ENSMUSG04', None, 2, 1000)],
+        columns=['ensembl_gene_id', 'external_gene_name', 'chromosome_name',
+                 'start_position'])
+
+
+class TestPredicates(object):
+    """Tests for evaluating predicates."""
+
+    def test_isin(self, genes):
+        """Tests selecting values, comparing numbers as strings."""
+
+        mask = col('chromosome_name').isin(['1']).evaluate(genes)
+        assert list(mask) == [True, True, False]
+
+        mask = (col('chromosome_name') != '1').evaluate(genes)
+        assert list(mask) == [False, False, True]
+
+    def test_compare(self, genes):
+        """Tests range comparisons."""
+
+        where = col('start_position').between(1000, 4000000)
+        assert list(where.evaluate(genes)) == [False, True, True]
+
+        mask = (col('start_position') > 1000).evaluate(genes)
+        assert list(mask) == [False, True, False]
+
+    def test_matches(self, genes):
+        """Tests regular expressions, which never match missing values."""
+
+        mask = col('external_gene_name').matches('^Gm[0-9]').evaluate(genes)
+        assert list(mask) == [True, False, False]
+
+        mask = (~col('external_gene_name').matches('^Gm')).evaluate(genes)
+        assert list(mask) == [False, True, True]
+
+    def test_or(self, genes):
+        """Tests alternatives across attributes."""
+
+        where = ((col('chromosome_name') == '2') |
+                 col('external_gene_name').matches('Xkr'))
+
+        assert where.columns == {'chromosome_name', 'external_gene_name'}
+        assert list(where.evaluate(genes)) == [False, True, True]
+
+
+class TestPushDown(object):
+    """Tests for pushing predicates down to the server."""
+
+    def test_push_down(self, mock_dataset_with_config):
+        """Tests if value selections are pushed down as filters."""
+
+        where = ((col('chromosome_name').isin(['1', '2'])) &
+                 (col('start_position') > 1000) &
+                 ((col('biotype') == 'lncRNA') |
+                  (col('biotype') == 'miRNA')))
+
+        filters, local = push_down(where, mock_dataset_with_config)
+
+        assert filters == {'chromosome_name': ['1', '2'],
+                           'biotype': ['lncRNA', 'miRNA']}
+        assert local.columns == {'start_position'}
+
+    def test_push_down_local(self, mock_dataset_with_config):
+        """Tests predicates that cannot be pushed down."""
+
+        where = ((col('chromosome_name') != '1') &
+                 (col('external_gene_name') == 'Xkr4') &
+                 ((col('chromosome_name') == '1') |
+                  (col('biotype') == 'lncRNA')))
+
+        filters, local = push_down(
+            where, mock_dataset_with_config, filters={'biotype': 'miRNA'})
+
+        assert filters == {'biotype': 'miRNA'}
+        assert local.columns == {'chromosome_name', 'external_gene_name',
+                                 'biotype'}
+
+    def test_push_down_all(self, mock_dataset_with_config):
+        """Tests predicates that are pushed down completely."""
+
+        filters, local = push_down(col('chromosome_name') == 'X',
+                                   mock_dataset_with_config)
+
+        assert filters == {'chromosome_name': 'X'}
+        assert local is None
+
+
+class TestDatasetWhere(object):
+    """Tests for queries with predicates."""
+
+    def test_query(self, mocker, mock_dataset_with_config):
+        """Tests query evaluating part of the predicate locally."""
+
+        mock_dataset = mock_dataset_with_config
+        response = pytest.helpers.mock_stream_response(GENES, chunk_size=7)
+        mock_request = mocker.patch.object(
+            mock_dataset, '_request', return_value=response)
+
+        mocker.patch('pybiomart.backends.STREAM_ROWS', 2)
+
+        result = mock_dataset.query(
+            attributes=['ensembl_gene_id', 'external_gene_name'],
+            where=(col('chromosome_name').isin(['1', '2']) &
+                   (col('start_position') > 1000) &
+                   ~col('external_gene_name').matches('^Gm')))
+
+        assert list(result.columns) == ['Ensembl Gene ID',
+                                        'Associated Gene Name']
+        assert list(result['Ensembl Gene ID']) == ['ENSMUSG02', 'ENSMUSG03',
+                                                   'ENSMUSG05']
+        assert response.closed
+
+        # Check pushed down filters and fetched attributes.
+        (_, params), kwargs = mock_request.call_args
+        assert kwargs == {'stream': True}
+
+        query = ElementTree.fromstring(params['query'])
+        dataset = query.find('Dataset')
+
+        attributes = [attr.attrib['name']
+                      for attr in dataset.findall('Attribute')]
+        assert attributes == ['ensembl_gene_id', 'external_gene_name',
+                              'start_position']
+
+        filters = {filt.attrib['name']: filt.attrib['value']
+                   for filt in dataset.findall('Filter')}
+        assert filters == {'chromosome_name': '1,2'}
+
+    def test_query_invalid_column(self, mock_dataset_with_config):
+        """Tests predicates using invalid attributes."""
+
+        with pytest.raises(BiomartException):
+            mock_dataset_with_config.query(
+                attributes=['ensembl_gene_id'],
+                where=col('invalid') > 1)
+
+    def test_query_invalid_backend(self, mock_dataset_with_config):
+        """Tests predicates with unsupported backends."""
+
+        with pytest.raises(ValueError):
+            mock_dataset_with_config.query(
+                attributes=['ensembl_gene_id'], backend='arrow',
+                where=col('start_position') > 1)
@@ -0,0 +1,176 @@
+from xml.etree import ElementTree
+
+import pytest
+
+from pybiomart.base import BiomartException
+from pybiomart.prepared import PreparedQuery
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+class TestPreparedQuery(object):
+    """Tests for prepared queries."""
+
+    def test_render(self, mock_dataset_with_config):
+        """Tests if rendered queries match queries built from scratch."""
+
+        mock_dataset = mock_dataset_with_config
+
+        prepared = mock_dataset.prepare(
+            attributes=['ensembl_gene_id'],
+            parameters=['chromosome_name', 'transcript_gencode_basic'],
+            filters={'biotype': 'protein_coding'})
+
+        assert isinstance(prepared, PreparedQuery)
+        assert prepared.parameters == ['chromosome_name',
+                                       'transcript_gencode_basic']
+
+        filters = {'biotype': 'protein_coding',
+                   'chromosome_name': ['1', '2'],
+                   'transcript_gencode_basic': True}
+        expected = ElementTree.tostring(
+            mock_dataset._build_query(['ensembl_gene_id'], filters))
+
+        assert prepared.render(chromosome_name=['1', '2'],
+                               transcript_gencode_basic=True) == expected
+
+    def test_render_missing(self, mock_dataset_with_config):
+        """Tests if parameters without values are left out."""
+
+        prepared = mock_dataset_with_config.prepare(
+            attributes=['ensembl_gene_id'], parameters=['chromosome_name'])
+
+        query = prepared.render()
+
+        assert b'<Filter' not in query
+        assert query.endswith(b'</Dataset></Query>')
+
+    def test_render_escaped(self, mock_dataset_with_config):
+        """Tests escaping of special characters in filter values."""
+
+        mock_dataset = mock_dataset_with_config
+
+        prepared = mock_dataset.prepare(
+            attributes=['ensembl_gene_id'], parameters=['gene_id'])
+
+        value = u'a"b<c>&dé'
+        expected = ElementTree.tostring(mock_dataset._build_query(
+            ['ensembl_gene_id'], {'gene_id': value}))
+
+        assert prepared.render(gene_id=value) == expected
+
+    def test_render_invalid_option(self, mock_dataset_with_config):
+        """Tests if values are validated against the filter options."""
+
+        prepared = mock_dataset_with_config.prepare(
+            attributes=['ensembl_gene_id'], parameters=['chromosome_name'])
+
+        assert b'value="X"' in prepared.render(chromosome_name='x')
+
+        with pytest.raises(BiomartException):
+            prepared.render(chromosome_name=['1', 'chr1'])
+
+    def test_render_unknown(self, mock_dataset_with_config):
+        """Tests if unknown parameters raise an exception."""
+
+        prepared = mock_dataset_with_config.prepare(
+            attributes=['ensembl_gene_id'], parameters=['chromosome_name'])
+
+        with pytest.raises(BiomartException):
+            prepared.render(start=1)
+
+    def test_prepare_invalid(self, mock_dataset_with_config):
+        """Tests if invalid attributes and filters are rejected."""
+
+        mock_dataset = mock_dataset_with_config
+
+        with pytest.raises(BiomartException):
+            mock_dataset.prepare(attributes=['invalid'])
+
+        with pytest.raises(BiomartException):
+            mock_dataset.prepare(attributes=['ensembl_gene_id'],
+                                 parameters=['invalid'])
+
+    def test_execute(self, mocker, mock_dataset_with_config,
+                     dataset_query_response):
+        """Tests executing a prepared query."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        prepared = mock_dataset.prepare(
+            attributes=['ensembl_gene_id'], parameters=['chromosome_name'])
+
+        res = prepared.execute(chromosome_name='1')
+
+        assert len(res) > 0
+        assert list(res.columns) == ['Ensembl Gene ID']
+
+        mock_post.assert_called_once_with(
+            query=prepared.render(chromosome_name='1'))
+
+    def test_execute_attr_names(self, mocker, mock_dataset_with_config,
+                                dataset_query_response):
+        """Tests executing a prepared query using attribute names."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        prepared = mock_dataset.prepare(
+            attributes=['ensembl_gene_id'], parameters=['chromosome_name'],
+            use_attr_names=True)
+
+        res = prepared.execute(chromosome_name='1')
+
+        assert list(res.columns) == ['ensembl_gene_id']
+
+    def test_execute_column_mismatch(self, mocker, mock_dataset_with_config,
+                                     dataset_query_response):
+        """Tests if unexpected result columns raise an exception."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        prepared = mock_dataset.prepare(
+            attributes=['ensembl_gene_id', 'external_gene_name'],
+            parameters=['chromosome_name'])
+
+        with pytest.raises(BiomartException):
+            prepared.execute(chromosome_name='1')
+
+    def test_prepare_without_validation(self, mocker, mock_dataset,
+                                        dataset_query_response):
+        """Tests if unvalidated queries skip fetching the configuration."""
+
+        mock_get = mocker.patch.object(mock_dataset, 'get')
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        prepared = mock_dataset.prepare(
+            attributes=['ensembl_gene_id'],
+            parameters=['chromosome_name', 'transcript_gencode_basic'],
+            validate=False)
+
+        query = prepared.render(chromosome_name='1',
+                                transcript_gencode_basic=False)
+
+        assert b'<Filter name="chromosome_name" value="1" />' in query
+        assert (b'<Filter name="transcript_gencode_basic" excluded="1" />'
+                in query)
+
+        res = prepared.execute(chromosome_name='1')
+
+        assert list(res.columns) == ['ensembl_gene_id']
+        assert mock_get.call_count == 0
+
+    def test_prepare_without_validation_attributes(self, mock_dataset):
+        """Tests if unvalidated queries require explicit attributes."""
+
+        with pytest.raises(ValueError):
+            mock_dataset.prepare(validate=False)
@@ -0,0 +1,236 @@
+import pandas as pd
+import pytest
+
+from pybiomart.dataset import Filter
+from pybiomart.results import ResultCache
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+GENES = pd.DataFrame.from_records(
+    [('ENSMUSG01', 'Gene1', 'protein_coding', '1'),
+     ('ENSMUSG02', 'Gene2', 'lncRNA', '1'),
+     ('ENSMUSG03', 'Gene3', 'protein_coding', '2'),
+     ('ENSMUSG04', 'Gene4', 'lncRNA', 'X')],
+    columns=['ensembl_gene_id', 'external_gene_name', 'gene_biotype',
+             'chromosome_name'])
+
+
+@pytest.fixture
+def mock_query(mocker, mock_dataset_with_config):
+    """Mocks dataset queries, filtering the example genes."""
+
+    def _query(attributes, filters, **kwargs):
+        result = GENES
+        for name, values in filters.items():
+            if not isinstance(values, list):
+                values = [values]
+            result = result.loc[result[name].isin(values)]
+        return result[attributes].reset_index(drop=True)
+
+    # Gene ids are id_list filters in Ensembl (but not in the example).
+    mocker.patch.dict(
+        mock_dataset_with_config.filters,
+        {'ensembl_gene_id': Filter('ensembl_gene_id', 'id_list')})
+
+    return mocker.patch.object(
+        mock_dataset_with_config, 'query', side_effect=_query)
+
+
+class TestResultCache(object):
+    """Tests for the ResultCache class."""
+
+    def test_repeated(self, mock_dataset_with_config, mock_query):
+        """Tests if repeated queries are answered from cache."""
+
+        cache = ResultCache()
+        query = {'attributes': ['ensembl_gene_id', 'external_gene_name'],
+                 'filters': {'chromosome_name': ['1']}}
+
+        first = cache.query(mock_dataset_with_config, use_attr_names=True,
+                            **query)
+        second = cache.query(mock_dataset_with_config, use_attr_names=True,
+                             **query)
+
+        assert mock_query.call_count == 1
+        assert second.equals(first)
+        assert list(second['ensembl_gene_id']) == ['ENSMUSG01', 'ENSMUSG02']
+
+    def test_contained(self, mock_dataset_with_config, mock_query):
+        """Tests answering a narrower query by filtering locally."""
+
+        cache = ResultCache()
+
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id', 'external_gene_name',
+                                'chromosome_name'],
+                    filters={'ensembl_gene_id': list(GENES.ensembl_gene_id)})
+
+        result = cache.query(
+            mock_dataset_with_config,
+            attributes=['external_gene_name', 'ensembl_gene_id'],
+            filters={'ensembl_gene_id': ['ENSMUSG02', 'ENSMUSG03'],
+                     'chromosome_name': '1'},
+            use_attr_names=True)
+
+        assert mock_query.call_count == 1
+        assert list(result.columns) == ['external_gene_name',
+                                        'ensembl_gene_id']
+        assert list(result['ensembl_gene_id']) == ['ENSMUSG02']
+
+    def test_display_names(self, mock_dataset_with_config, mock_query):
+        """Tests if columns are named using display names by default."""
+
+        cache = ResultCache()
+
+        result = cache.query(mock_dataset_with_config,
+                             attributes=['ensembl_gene_id'])
+
+        assert list(result.columns) == ['Ensembl Gene ID']
+
+    def test_remainder(self, mock_dataset_with_config, mock_query):
+        """Tests if only uncovered filter values are fetched."""
+
+        cache = ResultCache()
+
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id', 'external_gene_name'],
+                    filters={'ensembl_gene_id': ['ENSMUSG01', 'ENSMUSG02']})
+
+        result = cache.query(
+            mock_dataset_with_config,
+            attributes=['ensembl_gene_id'],
+            filters={'ensembl_gene_id': ['ENSMUSG02', 'ENSMUSG03']},
+            use_attr_names=True)
+
+        assert sorted(result['ensembl_gene_id']) == ['ENSMUSG02',
+                                                     'ENSMUSG03']
+
+        _, kwargs = mock_query.call_args
+        assert kwargs['filters'] == {'ensembl_gene_id': ['ENSMUSG03']}
+        assert kwargs['attributes'] == ['ensembl_gene_id']
+
+    def test_not_contained(self, mock_dataset_with_config, mock_query):
+        """Tests queries that cannot be answered from cache."""
+
+        cache = ResultCache()
+
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id'],
+                    filters={'chromosome_name': ['1']})
+
+        # Missing attribute.
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id', 'gene_biotype'],
+                    filters={'chromosome_name': ['1']})
+
+        # Broader filter.
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id'])
+
+        # Narrower filter without the filtered column.
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id'],
+                    filters={'chromosome_name': ['1'],
+                             'gene_biotype': 'lncRNA'})
+
+        # Duplicate rows requested from a unique result.
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id'],
+                    filters={'chromosome_name': ['1']},
+                    only_unique=False)
+
+        assert mock_query.call_count == 5
+
+    def test_filter_type(self, mocker, mock_dataset_with_config,
+                         mock_query):
+        """Tests that filters are only applied locally for equality."""
+
+        mocker.patch.dict(
+            mock_dataset_with_config.filters,
+            {'gene_biotype': Filter('gene_biotype', 'drop_down_basic_filter')})
+
+        cache = ResultCache()
+        query = {'attributes': ['ensembl_gene_id', 'gene_biotype']}
+
+        cache.query(mock_dataset_with_config, **query)
+        cache.query(mock_dataset_with_config,
+                    filters={'gene_biotype': 'lncRNA'}, **query)
+
+        # Identical filters are still answered from cache.
+        cache.query(mock_dataset_with_config,
+                    filters={'gene_biotype': 'lncRNA'}, **query)
+
+        assert mock_query.call_count == 2
+
+    def test_float_column(self, mocker, mock_dataset_with_config):
+        """Tests local filtering of integers in a float column."""
+
+        # Missing values turn integer columns into floats.
+        frame = pd.DataFrame({'ensembl_gene_id': ['ENSMUSG01', 'ENSMUSG02'],
+                              'transcript_count': [3, None]})
+        assert frame['transcript_count'].dtype == 'float64'
+
+        mock_query = mocker.patch.object(
+            mock_dataset_with_config, 'query', return_value=frame)
+
+        cache = ResultCache()
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id', 'transcript_count'])
+
+        result = cache.query(
+            mock_dataset_with_config,
+            attributes=['ensembl_gene_id'],
+            filters={'transcript_count': [3]},
+            use_attr_names=True)
+
+        assert mock_query.call_count == 1
+        assert list(result['ensembl_gene_id']) == ['ENSMUSG01']
+
+    def test_max_entries(self, mock_dataset_with_config, mock_query):
+        """Tests if least recently used results are removed."""
+
+        cache = ResultCache(max_entries=2)
+
+        for chrom in ['1', '2', 'X']:
+            cache.query(mock_dataset_with_config,
+                        attributes=['ensembl_gene_id'],
+                        filters={'chromosome_name': chrom})
+
+        assert len(cache) == 2
+
+        cache.query(mock_dataset_with_config,
+                    attributes=['ensembl_gene_id'],
+                    filters={'chromosome_name': '1'})
+
+        assert mock_query.call_count == 4
+
+
+class TestDatasetResultCache(object):
+    """Tests for queries using a result cache."""
+
+    def test_query(self, mocker, mock_dataset_with_config,
+                   dataset_query_response):
+        """Tests if contained queries do not send requests."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_post = mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        cache = ResultCache()
+
+        first = mock_dataset.query(attributes=['ensembl_gene_id'],
+                                   result_cache=cache)
+        second = mock_dataset.query(attributes=['ensembl_gene_id'],
+                                    result_cache=cache)
+
+        assert mock_post.call_count == 1
+        assert list(second.columns) == ['Ensembl Gene ID']
+        assert second.equals(first)
+
+    def test_query_invalid(self, mock_dataset_with_config):
+        """Tests result caches with unsupported backends."""
+
+        with pytest.raises(ValueError):
+            mock_dataset_with_config.query(
+                attributes=['ensembl_gene_id'], backend='arrow',
+                result_cache=ResultCache())
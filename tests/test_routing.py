@@ -0,0 +1,86 @@
+import pytest
+
+from pybiomart import routing
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+@pytest.fixture
+def router():
+    """Router for three mirror hosts."""
+    return routing.HostRouter(['http://a', 'http://b', 'http://c'])
+
+
+class TestHostRouter(object):
+    """Tests for the HostRouter class."""
+
+    def test_initial_order(self, router):
+        """Tests that unmeasured hosts keep their given order."""
+
+        assert router.needs_probe
+        assert router.ranked() == ['http://a', 'http://b', 'http://c']
+
+    def test_latency_ranking(self, router):
+        """Tests ranking of hosts by latency."""
+
+        router.record_success('http://a', 0.5)
+        router.record_success('http://b', 0.1)
+        router.record_success('http://c', 0.3)
+
+        assert router.ranked() == ['http://b', 'http://c', 'http://a']
+        assert router.best() == 'http://b'
+
+    def test_smoothing(self, router):
+        """Tests smoothing of latency measurements."""
+
+        router.record_success('http://a', 1.0)
+        router.record_success('http://a', 0.0)
+
+        assert router.latencies['http://a'] == pytest.approx(0.7)
+
+    def test_failure(self, router):
+        """Tests that failed hosts are moved to the end."""
+
+        router.record_success('http://a', 0.1)
+        router.record_failure('http://a')
+
+        assert router.ranked()[-1] == 'http://a'
+
+    def test_failure_cooldown(self, mocker, router):
+        """Tests that failed hosts are used again after their cooldown."""
+
+        mock_time = mocker.patch.object(routing.time, 'time')
+
+        mock_time.return_value = 0
+        router.record_success('http://a', 0.1)
+        router.record_failure('http://a')
+
+        mock_time.return_value = routing.DEFAULT_COOLDOWN + 1
+        assert router.best() == 'http://a'
+
+    def test_probe(self, router):
+        """Tests probing of hosts."""
+
+        def _measure(host):
+            if host == 'http://a':
+                raise IOError('Host down')
+            return {'http://b': 0.2, 'http://c': 0.1}[host]
+
+        router.probe(_measure)
+
+        assert not router.needs_probe
+        assert router.ranked() == ['http://c', 'http://b', 'http://a']
+
+
+class TestGetRouter(object):
+    """Tests for the get_router function."""
+
+    def test_shared(self, mocker):
+        """Tests that routers are shared for identical hosts."""
+
+        mocker.patch.dict(routing._ROUTERS, clear=True)
+
+        router = routing.get_router(['http://a', 'http://b'])
+
+        assert routing.get_router(['http://a', 'http://b']) is router
+        assert routing.get_router(['http://b', 'http://a']) is not router
@@ -0,0 +1,102 @@
+import pytest
+
+from pybiomart.search import SearchIndex
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+@pytest.fixture
+def index(tmpdir):
+    """Empty search index stored in a temporary directory."""
+    return SearchIndex(str(tmpdir.join('index.sqlite')))
+
+
+class TestSearchIndex(object):
+    """Tests for the SearchIndex class."""
+
+    def test_add_dataset(self, index, mock_dataset_with_config):
+        """Tests indexing of a dataset."""
+
+        assert index.add_dataset(mock_dataset_with_config, mart='mart')
+        assert index.contains('mmusculus_gene_ensembl', mart='mart')
+        assert index.datasets == [('mart', 'mmusculus_gene_ensembl')]
+
+    def test_add_dataset_incremental(self, mocker, index,
+                                     mock_dataset_with_config):
+        """Tests that already indexed datasets are skipped."""
+
+        dataset = mock_dataset_with_config
+        index.add_dataset(dataset, mart='mart')
+
+        mock_attrs = mocker.patch.object(
+            type(dataset), 'attributes', new_callable=mocker.PropertyMock)
+
+        assert not index.add_dataset(dataset, mart='mart')
+        assert not mock_attrs.called
+
+    def test_search(self, index, mock_dataset_with_config):
+        """Tests searching for attributes and filters."""
+
+        index.add_dataset(mock_dataset_with_config, mart='mart')
+
+        result = index.search('ensembl gene id')
+        assert 'ensembl_gene_id' in set(result['name'])
+        assert set(result['kind']) == {'attribute', 'filter'}
+
+        attrs = index.search('Ensembl Gene', kind='attribute')
+        assert set(attrs['kind']) == {'attribute'}
+
+    def test_search_prefix(self, index, mock_dataset_with_config):
+        """Tests matching of query words as prefixes."""
+
+        index.add_dataset(mock_dataset_with_config, mart='mart')
+
+        result = index.search('chromo')
+        assert 'chromosome_name' in set(result['name'])
+
+    def test_search_no_match(self, index, mock_dataset_with_config):
+        """Tests searching for a missing word."""
+
+        index.add_dataset(mock_dataset_with_config, mart='mart')
+
+        result = index.search('nonexistingword')
+        assert len(result) == 0
+        assert list(result.columns) == [
+            'mart', 'dataset', 'kind', 'name', 'display_name', 'description'
+        ]
+
+    def test_search_datasets(self, index, mock_dataset_with_config):
+        """Tests listing of datasets matching a query."""
+
+        index.add_dataset(mock_dataset_with_config, mart='mart')
+
+        result = index.search_datasets('ensembl_gene_id')
+        assert list(result['dataset']) == ['mmusculus_gene_ensembl']
+        assert result['hits'].iloc[0] > 0
+
+    def test_persistence(self, tmpdir, mock_dataset_with_config):
+        """Tests that the index is persisted to disk."""
+
+        path = str(tmpdir.join('index.sqlite'))
+
+        index = SearchIndex(path)
+        index.add_dataset(mock_dataset_with_config, mart='mart')
+        index.close()
+
+        reopened = SearchIndex(path)
+        assert len(reopened.search('ensembl')) > 0
+
+    def test_update(self, mocker, index, mock_mart, mock_dataset_with_config):
+        """Tests indexing of all datasets in a server."""
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            type(mock_mart), 'datasets', new_callable=mocker.PropertyMock,
+            return_value={mock_dataset.name: mock_dataset})
+
+        server = mocker.Mock(marts={mock_mart.name: mock_mart})
+        server.__getitem__ = lambda self, name: self.marts[name]
+
+        index.update(server)
+
+        assert index.datasets == [(mock_mart.name, mock_dataset.name)]
@@ -0,0 +1,109 @@
+import gzip
+from xml.etree import ElementTree
+
+import pytest
+
+from pybiomart import sequences
+from pybiomart.base import BiomartException
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+FASTA = (b'>ENSMUSG01|ENSMUST01\nACGTACGT\nACGT\n'
+         b'>ENSMUSG02|ENSMUST02\nTTTT\n')
+
+
+@pytest.fixture
+def fasta_response():
+    """Streamed response containing two sequences."""
+    return pytest.helpers.mock_stream_response(FASTA)
+
+
+class TestSequences(object):
+    """Tests for the streamed sequence helpers."""
+
+    def test_read_fasta(self, fasta_response):
+        """Tests parsing of records from chunks split mid-line."""
+
+        records = list(sequences.read_fasta(
+            sequences.open_stream(fasta_response)))
+
+        assert records == [('ENSMUSG01|ENSMUST01', 'ACGTACGTACGT'),
+                           ('ENSMUSG02|ENSMUST02', 'TTTT')]
+
+    def test_read_fasta_empty(self):
+        """Tests parsing of an empty response."""
+
+        response = pytest.helpers.mock_stream_response(b'')
+        chunks = sequences.open_stream(response)
+        assert list(sequences.read_fasta(chunks)) == []
+
+    def test_open_stream_error(self):
+        """Tests if query errors are raised."""
+
+        response = pytest.helpers.mock_stream_response(
+            b'Query ERROR: caught BioMart::Exception', chunk_size=100)
+
+        with pytest.raises(BiomartException):
+            sequences.open_stream(response)
+
+        assert response.closed
+
+    def test_write_chunks_gzip(self, tmpdir, fasta_response):
+        """Tests writing of a gzipped FASTA file."""
+
+        path = str(tmpdir.join('sequences.fa.gz'))
+
+        size = sequences.write_chunks(
+            sequences.open_stream(fasta_response), path)
+
+        assert size == len(FASTA)
+
+        with gzip.open(path, 'rb') as file_:
+            assert file_.read() == FASTA
+
+
+class TestDatasetSequences(object):
+    """Tests for Dataset.query_sequences."""
+
+    def test_query_sequences(self, mocker, mock_dataset_with_config,
+                             fasta_response):
+        """Tests if sequences are queried using a streamed FASTA query."""
+
+        mock_dataset = mock_dataset_with_config
+        mock_request = mocker.patch.object(
+            mock_dataset, '_request', return_value=fasta_response)
+
+        records = mock_dataset.query_sequences(
+            attributes=['ensembl_gene_id', 'ensembl_transcript_id'],
+            filters={'chromosome_name': ['1']})
+
+        assert list(records) == [('ENSMUSG01|ENSMUST01', 'ACGTACGTACGT'),
+                                 ('ENSMUSG02|ENSMUST02', 'TTTT')]
+        assert fasta_response.closed
+
+        # Check query.
+        (method, params), kwargs = mock_request.call_args
+        assert method == 'post'
+        assert kwargs == {'stream': True}
+
+        query = ElementTree.fromstring(params['query'])
+        assert query.attrib['formatter'] == 'FASTA'
+        assert query.attrib['header'] == '0'
+
+    def test_query_sequences_path(self, mocker, tmpdir,
+                                  mock_dataset_with_config, fasta_response):
+        """Tests writing sequences directly to a file."""
+
+        mock_dataset = mock_dataset_with_config
+        mocker.patch.object(
+            mock_dataset, '_request', return_value=fasta_response)
+
+        path = str(tmpdir.join('sequences.fa'))
+        size = mock_dataset.query_sequences(
+            attributes=['ensembl_gene_id'], path=path)
+
+        assert size == len(FASTA)
+        assert fasta_response.closed
+
+        with open(path, 'rb') as file_:
+            assert file_.read() == FASTA
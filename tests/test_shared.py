@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import pickle
+
+import pytest
+
+from pybiomart import backends
+from pybiomart.shared import SharedResult
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+pa = pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def table():
+    """Example Arrow table with differently encoded chunks."""
+
+    first = pa.table({'id': ['a', 'b'],
+                      'biotype': pa.array(['x', 'y']).dictionary_encode()})
+    second = pa.table({'id': ['c'],
+                       'biotype': pa.array(['z']).dictionary_encode()})
+    return pa.concat_tables([first, second])
+
+
+def _count_rows(result):
+    return len(result.table)
+
+
+class TestSharedResult(object):
+    """Tests for the SharedResult class."""
+
+    def test_from_table(self, table, tmpdir):
+        """Tests writing and attaching to a shared result."""
+
+        path = str(tmpdir.join('result.arrow'))
+
+        with SharedResult.from_table(table, path=path) as result:
+            assert result.path == path
+            assert len(result) == 3
+            assert result.table.column('biotype').to_pylist() == \
+                ['x', 'y', 'z']
+            assert list(result.to_pandas()['id']) == ['a', 'b', 'c']
+
+        assert not os.path.exists(path)
+
+    def test_default_path(self, table):
+        """Tests writing a result to a new (temporary) file."""
+
+        result = SharedResult.from_table(table)
+
+        try:
+            assert os.path.exists(result.path)
+            if os.path.isdir('/dev/shm'):
+                assert result.path.startswith('/dev/shm')
+        finally:
+            result.unlink()
+
+    def test_pickle(self, table, tmpdir):
+        """Tests if only the path of a result is pickled."""
+
+        path = str(tmpdir.join('result.arrow'))
+        result = SharedResult.from_table(table, path=path)
+        result.table
+
+        pickled = pickle.dumps(result)
+        assert len(pickled) < 200
+
+        restored = pickle.loads(pickled)
+        assert restored.table.equals(result.table)
+
+    def test_processes(self, table, tmpdir):
+        """Tests attaching to a result from other processes."""
+
+        path = str(tmpdir.join('result.arrow'))
+        result = SharedResult.from_table(table, path=path)
+
+        pool = multiprocessing.Pool(2)
+        try:
+            counts = pool.map(_count_rows, [result] * 4)
+        finally:
+            pool.close()
+            pool.join()
+
+        assert counts == [3] * 4
+
+    def test_finalize(self, table):
+        """Tests finalizing results of the shared backend."""
+
+        result = backends.finalize(table, backend='shared')
+
+        try:
+            assert isinstance(result, SharedResult)
+            assert len(result) == 3
+        finally:
+            result.unlink()
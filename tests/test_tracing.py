@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+import json
+
+from pybiomart import tracing
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+class FakeOtelTracer(object):
+    """Minimal stand-in for an OpenTelemetry tracer."""
+
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        self.spans.append((name, attributes))
+        yield
+
+
+class TestTracer(object):
+    """Tests for the Tracer class."""
+
+    def test_disabled(self):
+        """Tests if spans are no-ops without a tracer."""
+
+        assert tracing.get_tracer() is None
+
+        with tracing.span('test', value=1):
+            pass
+
+        assert tracing.span('other') is tracing.span('test')
+
+    def test_span(self):
+        """Tests recording spans with an active tracer."""
+
+        tracer = tracing.Tracer()
+
+        with tracer:
+            assert tracing.get_tracer() is tracer
+            with tracing.span('outer'):
+                with tracing.span('inner', value=1):
+                    pass
+
+        assert tracing.get_tracer() is None
+
+        names = [span[0] for span in tracer.spans]
+        assert names == ['inner', 'outer']
+
+        inner, outer = tracer.spans
+        assert inner[4] == {'value': 1}
+        assert outer[1] <= inner[1]
+        assert outer[2] >= inner[2]
+
+    def test_chrome_trace(self, tmpdir):
+        """Tests exporting spans as Chrome trace events."""
+
+        tracer = tracing.Tracer()
+
+        with tracer:
+            with tracing.span('test', filters=list(range(1000)), rows=10):
+                pass
+
+        path = str(tmpdir.join('trace.json'))
+        tracer.export_chrome_trace(path)
+
+        with open(path) as file_:
+            trace = json.load(file_)
+
+        event, = trace['traceEvents']
+        assert event['name'] == 'test'
+        assert event['ph'] == 'X'
+        assert event['dur'] >= 0
+        assert event['args']['rows'] == 10
+        assert len(event['args']['filters']) == tracing.MAX_ARG_LENGTH
+        assert event['args']['filters'].endswith('...')
+
+    def test_clear(self):
+        """Tests clearing recorded spans."""
+
+        tracer = tracing.Tracer()
+
+        with tracer:
+            with tracing.span('test'):
+                pass
+
+        tracer.clear()
+        assert tracer.spans == []
+
+    def test_open_telemetry(self):
+        """Tests forwarding spans to OpenTelemetry."""
+
+        otel_tracer = FakeOtelTracer()
+
+        with tracing.OpenTelemetryTracer(otel_tracer):
+            with tracing.span('test', host='http://www.ensembl.org'):
+                pass
+
+        assert otel_tracer.spans == [
+            ('test', {'host': 'http://www.ensembl.org'})]
+
+
+class TestQueryTracing(object):
+    """Tests for tracing of queries."""
+
+    def test_query(self, mocker, mock_dataset_with_config,
+                   dataset_query_response):
+        """Tests spans recorded for a chunked query."""
+
+        mock_dataset = mock_dataset_with_config
+
+        mocker.patch.object(
+            mock_dataset, 'post', return_value=dataset_query_response)
+
+        tracer = tracing.Tracer()
+
+        with tracer:
+            mock_dataset.query(
+                attributes=['ensembl_gene_id'],
+                filters={'chromosome_name': ['1', '2', '3']},
+                chunk_size=1)
+
+        names = [span[0] for span in tracer.spans]
+
+        assert names.count('sub_query') == 3
+        assert names.count('parse') == 3
+        assert {'query', 'build_query', 'plan', 'combine'} <= set(names)
+        assert names[-1] == 'query'
+
+    def test_fetch_configuration(self, mocker, mock_dataset,
+                                 dataset_config_response):
+        """Tests span recorded for fetching the configuration."""
+
+        mocker.patch.object(
+            mock_dataset, 'get', return_value=dataset_config_response)
+
+        tracer = tracing.Tracer()
+
+        with tracer:
+            mock_dataset.attributes
+
+        (name, _, _, _, args), = tracer.spans
+        assert name == 'fetch_configuration'
+        assert args == {'dataset': 'mmusculus_gene_ensembl'}
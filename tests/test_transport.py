@@ -0,0 +1,132 @@
+import io
+import pickle
+
+import pytest
+import requests
+
+from pybiomart import base, routing
+from pybiomart.transport import (RecordingTransport, ReplayMiss,
+                                 ReplayTransport, Transport)
+
+# pylint: disable=redefined-outer-name, no-self-use
+
+
+class FakeTransport(Transport):
+    """Transport answering requests using a function of the parameters."""
+
+    def __init__(self):
+        self.requests = []
+
+    def send(self, method, url, params, timeout=None, stream=False,
+             headers=None):
+        self.requests.append((method, url, params))
+
+        response = requests.Response()
+        response.status_code = 200
+        response.encoding = 'utf-8'
+        response.headers['ETag'] = '"v1"'
+        response.raw = io.BytesIO(
+            u'{} {}'.format(method, sorted(params.items())).encode('utf-8'))
+
+        return response
+
+
+@pytest.fixture
+def archive_path(tmpdir):
+    """Path of the archive."""
+    return str(tmpdir.join('session.sqlite'))
+
+
+@pytest.fixture
+def no_network(mocker):
+    """Fails any request sent over http."""
+    mocker.patch.object(requests, 'get', side_effect=AssertionError)
+    mocker.patch.object(requests, 'post', side_effect=AssertionError)
+
+
+def _server(hosts, transport):
+    server = base.ServerBase(host=hosts, use_cache=False, transport=transport)
+    routing.get_router(server.hosts)._probed = True
+    return server
+
+
+@pytest.fixture(autouse=True)
+def routers(mocker):
+    """Isolates the routing tables of the tests."""
+    mocker.patch.dict(routing._ROUTERS, clear=True)
+
+
+class TestTransport(object):
+    """Tests for recording and replaying requests."""
+
+    def test_record_replay(self, archive_path, no_network):
+        """Tests replaying a recorded session without network."""
+
+        fake = FakeTransport()
+        server = _server('http://a', RecordingTransport(
+            archive_path, transport=fake))
+
+        recorded = [server.get(type='registry').text,
+                    server.post(query=b'<Query />').text]
+
+        server.transport.close()
+
+        replay = ReplayTransport(archive_path)
+        assert len(replay) == 2
+
+        server = _server('http://a', replay)
+
+        response = server.get(type='registry')
+        assert response.text == recorded[0]
+        assert response.headers['etag'] == '"v1"'
+        assert server.post(query=b'<Query />').text == recorded[1]
+
+        assert len(fake.requests) == 2
+
+    def test_record_stream(self, archive_path):
+        """Tests recording (and replaying) a streamed response."""
+
+        server = _server('http://a', RecordingTransport(
+            archive_path, transport=FakeTransport()))
+
+        response = server._request('post', {'query': 'x'}, stream=True)
+        assert b''.join(response.iter_content(2)) == b"post [('query', 'x')]"
+
+        server = _server('http://a', ReplayTransport(archive_path))
+        response = server._request('post', {'query': 'x'}, stream=True)
+        assert b''.join(response.iter_content(2)) == b"post [('query', 'x')]"
+
+    def test_replay_miss(self, archive_path, no_network):
+        """Tests requests missing from the archive."""
+
+        server = _server('http://a', ReplayTransport(archive_path))
+
+        with pytest.raises(ReplayMiss):
+            server.get(type='registry')
+
+    def test_replay_mirrors(self, archive_path, no_network):
+        """Tests if misses fail over to the mirror that was recorded."""
+
+        server = _server('http://a', RecordingTransport(
+            archive_path, transport=FakeTransport()))
+        server.get(type='registry')
+
+        server = _server(['http://b', 'http://a'],
+                         ReplayTransport(archive_path))
+        router = routing.get_router(server.hosts)
+        router.record_success('http://a', 1.0)
+        router.record_success('http://b', 0.1)
+
+        assert server.get(type='registry').status_code == 200
+        assert server.host == 'http://a'
+
+    def test_pickle(self, archive_path):
+        """Tests if transports can be pickled (without connections)."""
+
+        transport = RecordingTransport(archive_path, transport=FakeTransport())
+        transport.send('get', 'http://a', {'type': 'registry'})
+
+        copy = pickle.loads(pickle.dumps(transport))
+        copy.send('get', 'http://a', {'type': 'datasets'})
+
+        assert len(ReplayTransport(archive_path)) == 2